@@ -0,0 +1,126 @@
+"""
+Benchmark de envío de exámenes: N llamadas a POST /exams/results frente a una sola
+llamada a POST /exams/results/batch con los mismos N exámenes.
+
+Las respuestas se generan a partir de la hoja de preguntas del examen (primera opción de
+cada pregunta) y los DNIs indicados se reparten en orden. Guarda resultados reales: usar un
+proyecto de pruebas o pacientes de prueba.
+
+    BENCH_TOKEN=<id_token> python benchmarks/batch_submit.py \
+        --base-url http://localhost:8000 --exam-id <exam_id> \
+        --patient-dnis 12345678,87654321 --size 50 --rounds 3 --concurrency 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+from concurrent_latency import percentile
+
+
+def build_submissions(sheet, exam_id, patient_dnis, size):
+    """size envíos del examen con la primera opción de cada pregunta"""
+    answers = [
+        {"question_id": question["question_id"], "selected_option": question["options"][0]}
+        for category in sheet["categories"]
+        for question in category["questions"]
+        if question["options"]
+    ]
+    return [
+        {"exam_id": exam_id, "patient_dni": patient_dnis[i % len(patient_dnis)], "answers": answers}
+        for i in range(size)
+    ]
+
+
+async def run_singles(client, submissions, concurrency):
+    """Un POST /exams/results por examen, con como mucho concurrency en vuelo"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(submission):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/exams/results", json=submission)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(submission) for submission in submissions))
+    return time.perf_counter() - start, latencies, errors
+
+
+async def run_batch(client, submissions):
+    """Un único POST /exams/results/batch con todos los exámenes"""
+    start = time.perf_counter()
+    errors = len(submissions)
+    try:
+        response = await client.post("/exams/results/batch", json={"submissions": submissions})
+        if response.status_code < 400:
+            errors = response.json()["failed"]
+    except httpx.HTTPError:
+        pass
+    return time.perf_counter() - start, errors
+
+
+def summarize(name, size, elapsed_samples, errors, latencies=None):
+    mean_elapsed = statistics.fmean(elapsed_samples)
+    line = (
+        f"{name:<28} n={size:<4} err={errors:<4} total={mean_elapsed * 1000:.0f}ms "
+        f"exams/s={size / mean_elapsed:.1f}"
+    )
+    if latencies:
+        line += f" p50={percentile(latencies, 50):.1f}ms p95={percentile(latencies, 95):.1f}ms"
+    print(line)
+    return mean_elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Throughput de /exams/results/batch frente a N llamadas a /exams/results")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", default=os.getenv("BENCH_TOKEN"), help="ID token de Firebase (o BENCH_TOKEN)")
+    parser.add_argument("--exam-id", required=True, help="ID de un examen activo")
+    parser.add_argument("--patient-dnis", required=True, help="DNIs de pacientes existentes, separados por comas")
+    parser.add_argument("--size", type=int, default=50, help="Exámenes por envío (máximo 500)")
+    parser.add_argument("--rounds", type=int, default=3, help="Repeticiones de cada modo")
+    parser.add_argument("--concurrency", type=int, default=1, help="Llamadas individuales en vuelo a la vez")
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    limits = httpx.Limits(max_connections=max(args.concurrency, 1))
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, limits=limits, timeout=120) as client:
+        response = await client.get(f"/exams/{args.exam_id}/questions")
+        response.raise_for_status()
+        patient_dnis = [dni.strip() for dni in args.patient_dnis.split(",") if dni.strip()]
+        submissions = build_submissions(response.json(), args.exam_id, patient_dnis, args.size)
+
+        # Calentamiento: verificación de token, conexiones y caché de claves de corrección
+        await client.post("/exams/results", json=submissions[0])
+
+        single_elapsed, single_latencies, single_errors = [], [], 0
+        batch_elapsed, batch_errors = [], 0
+        for _ in range(args.rounds):
+            elapsed, latencies, errors = await run_singles(client, submissions, args.concurrency)
+            single_elapsed.append(elapsed)
+            single_latencies.extend(latencies)
+            single_errors += errors
+
+            elapsed, errors = await run_batch(client, submissions)
+            batch_elapsed.append(elapsed)
+            batch_errors += errors
+
+    singles = summarize(f"single x{args.size} (c={args.concurrency})", args.size, single_elapsed, single_errors, single_latencies)
+    batch = summarize("batch", args.size, batch_elapsed, batch_errors)
+    print(f"speedup batch vs single: {singles / batch:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+Benchmark de latencia con peticiones concurrentes contra la API.
+
+Lanza N peticiones con una concurrencia dada contra /patients/admitted y
+/visit/{dni} y muestra p50/p95/p99. Para comparar antes/después, ejecutarlo
+contra un servidor levantado con cada versión del código:
+
+    BENCH_TOKEN=<id_token> python benchmarks/concurrent_latency.py \
+        --base-url http://localhost:8000 --patient-dni 12345678 \
+        --requests 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+
+def percentile(samples, pct):
+    """Percentil por el método del rango más cercano"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_endpoint(client, path, total, concurrency):
+    """Ejecuta total peticiones a path con como mucho concurrency en vuelo"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "path": path,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": statistics.fmean(latencies) if latencies else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="p99 de /patients/admitted y /visit/{dni} bajo concurrencia")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", default=os.getenv("BENCH_TOKEN"), help="ID token de Firebase (o BENCH_TOKEN)")
+    parser.add_argument("--patient-dni", required=True, help="DNI de un paciente con visitas")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, limits=limits, timeout=60) as client:
+        for path in ("/patients/admitted", f"/visit/{args.patient_dni}"):
+            # Calentamiento para no medir la primera verificación de token ni conexiones
+            await client.get(path)
+            result = await run_endpoint(client, path, args.requests, args.concurrency)
+            print(
+                f"{result['path']:<30} n={result['requests']:<5} err={result['errors']:<4} "
+                f"rps={result['throughput_rps']:.1f} p50={result['p50_ms']:.1f}ms "
+                f"p95={result['p95_ms']:.1f}ms p99={result['p99_ms']:.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,36 +1,54 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from firebase_admin import auth
+from auth.tokens import verify_id_token, classify_token_error
 from services.user import UserService
+from services.executor import run_in_executor
+from services.container import get_services
 from schemas.user import User, Doctor, Police
 from schemas.enums import UserRole
 from typing import Optional, List, Union
 import logging
 
 security = HTTPBearer()
-user_service = UserService()
 logger = logging.getLogger(__name__)
 
 
 class AuthorizationService:
     """Servicio de autorización por roles"""
     
-    def __init__(self):
-        self.user_service = UserService()
+    def __init__(self, user_service: Optional[UserService] = None):
+        self._user_service = user_service
+    
+    @property
+    def user_service(self) -> UserService:
+        """UserService inyectado o, por defecto, el del contenedor de servicios"""
+        if self._user_service is not None:
+            return self._user_service
+        return get_services().user_service
+    
+    async def decode_token(self, credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+        """Verifica el token de Firebase una sola vez y devuelve sus claims"""
+        try:
+            decoded_token = await verify_id_token(credentials.credentials)
+        except Exception as e:
+            logger.error(f"Error decoding token ({classify_token_error(e)}): {e}")
+            decoded_token = None
+        
+        if not decoded_token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid authentication credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        
+        return decoded_token
     
     async def verify_token_and_get_user(self, credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
         """Verifica el token de Firebase y obtiene el usuario"""
         try:
-            token = credentials.credentials
-            decoded_token = auth.verify_id_token(token)
+            decoded_token = await self.decode_token(credentials)
             
-            if not decoded_token:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED, 
-                    detail="Invalid authentication credentials"
-                )
-            
-            user = self.user_service.get_user_by_firebase_uid(decoded_token["uid"])
+            user = await run_in_executor(self.user_service.get_user_by_firebase_uid, decoded_token["uid"])
             if not user:
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -58,16 +76,9 @@ class AuthorizationService:
     async def verify_doctor(self, credentials: HTTPAuthorizationCredentials = Depends(security)) -> Doctor:
         """Verifica que el usuario sea un doctor"""
         try:
-            token = credentials.credentials
-            decoded_token = auth.verify_id_token(token)
-            
-            if not decoded_token:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED, 
-                    detail="Invalid authentication credentials"
-                )
+            decoded_token = await self.decode_token(credentials)
             
-            doctor = self.user_service.get_doctor_by_firebase_uid(decoded_token["uid"])
+            doctor = await run_in_executor(self.user_service.get_doctor_by_firebase_uid, decoded_token["uid"])
             if not doctor:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN, 
@@ -89,16 +100,9 @@ class AuthorizationService:
     async def verify_police(self, credentials: HTTPAuthorizationCredentials = Depends(security)) -> Police:
         """Verifica que el usuario sea un policía"""
         try:
-            token = credentials.credentials
-            decoded_token = auth.verify_id_token(token)
-            
-            if not decoded_token:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED, 
-                    detail="Invalid authentication credentials"
-                )
+            decoded_token = await self.decode_token(credentials)
             
-            police = self.user_service.get_police_by_firebase_uid(decoded_token["uid"])
+            police = await run_in_executor(self.user_service.get_police_by_firebase_uid, decoded_token["uid"])
             if not police:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN, 
@@ -146,7 +150,7 @@ class AuthorizationService:
         user = await self.verify_token_and_get_user(credentials)
         
         if user.role == UserRole.DOCTOR:
-            doctor = self.user_service.get_doctor_by_firebase_uid(user.firebase_uid)
+            doctor = await run_in_executor(self.user_service.get_doctor_by_firebase_uid, user.firebase_uid)
             if not doctor:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN, 
@@ -2,15 +2,13 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import firebase_admin
 from firebase_admin import auth, credentials
-from services.doctor import DoctorService
+from services.container import get_services
+from services.executor import run_in_executor
 from auth.authorization import AuthorizationService
-import time
 import os
 import logging
-import asyncio
 
 security = HTTPBearer()
-doctor_service = DoctorService()
 logger = logging.getLogger(__name__)
 
 class FirebaseAuth:
@@ -38,38 +36,28 @@ class FirebaseAuth:
         """
         Verify Firebase ID token from Bearer header y retorna Doctor (compatibilidad hacia atrás)
         """
+        # El token se verifica una sola vez; los fallos transitorios se reintentan en auth.tokens
+        decoded_token = await self.auth_service.decode_token(credentials)
+        firebase_uid = decoded_token["uid"]
+        
         try:
-            # Usar el nuevo sistema de autenticación pero mantener compatibilidad
-            return await self.auth_service.verify_doctor(credentials)
-            
-        except HTTPException:
-            # Si falla el nuevo sistema, intentar el legacy
-            try:
-                token = credentials.credentials
-                print(token)
-                try:
-                    decoded_token = auth.verify_id_token(token)
-                    print(decoded_token)
-                except Exception as e:
-                    print(e)
-                    await asyncio.sleep(1)
-                    decoded_token = auth.verify_id_token(token)
-
-                if decoded_token:
-                    doctor = doctor_service.get_doctor(decoded_token["uid"])
-                    if doctor and doctor is not None:
-                        return doctor
-                    else:
-                        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Doctor not found")
-                else:
-                    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
-            except Exception as e:
-                logger.error(f"Legacy token verification failed: {e}")
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid authentication credentials",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
+            # Nuevo sistema de usuarios y, si no existe, la colección legacy de doctores
+            doctor = await run_in_executor(self.auth_service.user_service.get_doctor_by_firebase_uid, firebase_uid)
+            if not doctor:
+                doctor = await run_in_executor(get_services().doctor_service.get_legacy_doctor, firebase_uid)
+        except Exception as e:
+            logger.error(f"Legacy token verification failed: {e}")
+            doctor = None
+        
+        if not doctor:
+            logger.warning(f"Doctor not found for Firebase UID {firebase_uid}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid authentication credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        
+        return doctor
 
 # Dependency function for routes that require authentication
 def get_current_user(auth_service: FirebaseAuth = Depends()):
@@ -0,0 +1,192 @@
+from cryptography.x509 import load_pem_x509_certificate
+from firebase_admin import auth
+from typing import Any, Dict, Optional
+import firebase_admin
+import asyncio
+import httpx
+import jwt
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+ISSUER_PREFIX = "https://securetoken.google.com/"
+
+
+class FirebaseKeySet:
+    """Certificados públicos de Firebase en memoria, refrescados según Cache-Control"""
+
+    def __init__(
+        self,
+        certs_url: str = os.getenv("FIREBASE_CERTS_URL", GOOGLE_CERTS_URL),
+        default_max_age: float = float(os.getenv("AUTH_CERTS_DEFAULT_MAX_AGE", "3600")),
+        refresh_margin: float = float(os.getenv("AUTH_CERTS_REFRESH_MARGIN", "300")),
+        min_refresh_interval: float = float(os.getenv("AUTH_CERTS_MIN_REFRESH_INTERVAL", "30")),
+        timeout: float = float(os.getenv("AUTH_CERTS_TIMEOUT", "5"))
+    ):
+        self.certs_url = certs_url
+        self.default_max_age = default_max_age
+        self.refresh_margin = refresh_margin
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._last_fetch = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def parse_max_age(cache_control: Optional[str]) -> Optional[float]:
+        """Extrae max-age de una cabecera Cache-Control"""
+        if not cache_control:
+            return None
+        match = re.search(r"max-age=(\d+)", cache_control)
+        return float(match.group(1)) if match else None
+
+    def load_certificates(self, certs: Dict[str, str], max_age: Optional[float] = None):
+        """Carga un conjunto de certificados PEM indexados por kid"""
+        keys = {
+            kid: load_pem_x509_certificate(pem.encode("utf-8")).public_key()
+            for kid, pem in certs.items()
+        }
+        self._keys = keys
+        self._expires_at = time.time() + (max_age if max_age is not None else self.default_max_age)
+        logger.info(f"Loaded {len(keys)} Firebase signing certificates")
+
+    @property
+    def is_fresh(self) -> bool:
+        return bool(self._keys) and time.time() < self._expires_at
+
+    async def refresh(self, force: bool = False):
+        """Descarga los certificados si han caducado (o si se fuerza)"""
+        async with self._lock:
+            # Otra corrutina puede haber refrescado mientras se esperaba el lock
+            if self.is_fresh and not force:
+                return
+            if force and time.time() - self._last_fetch < self.min_refresh_interval:
+                return
+
+            self._last_fetch = time.time()
+            try:
+                async with httpx.AsyncClient(timeout=self.timeout) as client:
+                    response = await client.get(self.certs_url)
+                    response.raise_for_status()
+            except Exception as e:
+                raise auth.CertificateFetchError(f"Failed to fetch public key certificates: {e}", e)
+
+            self.load_certificates(response.json(), self.parse_max_age(response.headers.get("cache-control")))
+
+    async def get_key(self, kid: str) -> Any:
+        """Obtiene la clave pública de un kid, refrescando si es necesario"""
+        if not self.is_fresh:
+            await self.refresh()
+
+        key = self._keys.get(kid)
+        if key is None:
+            # Google puede haber rotado las claves antes de que caduque la caché
+            await self.refresh(force=True)
+            key = self._keys.get(kid)
+        return key
+
+    # Refresco en segundo plano
+
+    async def start(self):
+        """Carga los certificados e inicia la tarea de refresco en segundo plano"""
+        if self._task is not None:
+            return
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error(f"Error loading Firebase signing certificates: {e}")
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        """Detiene la tarea de refresco"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            delay = max(self._expires_at - time.time() - self.refresh_margin, self.min_refresh_interval)
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh(force=True)
+            except Exception as e:
+                logger.error(f"Error refreshing Firebase signing certificates: {e}")
+
+
+class FirebaseTokenVerifier:
+    """Verificación local (RS256) de ID tokens de Firebase"""
+
+    def __init__(self, key_set: FirebaseKeySet, project_id: Optional[str] = os.getenv("FIREBASE_PROJECT_ID")):
+        self.key_set = key_set
+        self._project_id = project_id
+
+    @property
+    def project_id(self) -> Optional[str]:
+        """Project ID configurado o, si no, el de la app de Firebase inicializada"""
+        if not self._project_id and firebase_admin._apps:
+            self._project_id = firebase_admin.get_app().project_id
+        return self._project_id
+
+    async def verify(self, token: str, clock_skew_seconds: int = 0) -> dict:
+        """Verifica firma y claims del token; lanza los mismos errores que firebase_admin"""
+        project_id = self.project_id
+        if not project_id:
+            raise ValueError("Firebase project ID is not configured")
+
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.InvalidTokenError as e:
+            raise auth.InvalidIdTokenError(f"Malformed ID token: {e}", e)
+
+        if header.get("alg") != "RS256":
+            raise auth.InvalidIdTokenError(f"Unexpected ID token algorithm: {header.get('alg')}")
+
+        key = await self.key_set.get_key(header.get("kid", ""))
+        if key is None:
+            raise auth.InvalidIdTokenError("ID token has a kid that does not match any known certificate")
+
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=["RS256"],
+                audience=project_id,
+                issuer=f"{ISSUER_PREFIX}{project_id}",
+                leeway=clock_skew_seconds,
+                options={"require": ["exp", "iat", "aud", "iss", "sub"]},
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise auth.ExpiredIdTokenError("Token expired", e)
+        except jwt.ImmatureSignatureError as e:
+            # Mismo mensaje que el SDK para que se clasifique como desfase de reloj
+            raise auth.InvalidIdTokenError(f"Token used too early: {e}", e)
+        except jwt.InvalidTokenError as e:
+            raise auth.InvalidIdTokenError(f"Invalid ID token: {e}", e)
+
+        subject = claims.get("sub")
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise auth.InvalidIdTokenError("ID token has an invalid subject")
+        auth_time = claims.get("auth_time")
+        if not isinstance(auth_time, (int, float)):
+            raise auth.InvalidIdTokenError("ID token has no valid auth_time claim")
+        if auth_time > time.time() + clock_skew_seconds:
+            raise auth.InvalidIdTokenError("Token used too early: auth_time is in the future")
+
+        claims["uid"] = subject
+        return claims
+
+
+# Instancias globales del conjunto de claves y del verificador
+firebase_key_set = FirebaseKeySet()
+firebase_token_verifier = FirebaseTokenVerifier(firebase_key_set)
@@ -0,0 +1,114 @@
+from services.cache import ExpiringLRUCache
+from typing import Any, List, Optional
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class PrincipalCache:
+    """Caché de usuarios ya resueltos (User/Doctor/Police) por Firebase UID"""
+
+    USERS_COLLECTION = "users"
+    PROFILE_COLLECTIONS = ("doctors", "police")
+
+    def __init__(
+        self,
+        ttl: float = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", "300")),
+        max_size: int = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "1024")),
+        listener_enabled: bool = os.getenv("AUTH_PRINCIPAL_CACHE_LISTENER", "false").lower() == "true"
+    ):
+        self.ttl = ttl
+        self.listener_enabled = listener_enabled
+        self._cache = ExpiringLRUCache(max_size=max_size, default_ttl=ttl)
+        self._watches: List[Any] = []
+
+    def get(self, kind: str, firebase_uid: str) -> Optional[Any]:
+        """Obtiene una copia del principal ("user", "doctor" o "police") si está en caché"""
+        if self.ttl <= 0:
+            return None
+        principal = self._cache.get((kind, firebase_uid))
+        # Se devuelve una copia para que los llamadores no modifiquen la entrada cacheada
+        return principal.model_copy(deep=True) if principal is not None else None
+
+    def put(self, kind: str, firebase_uid: str, principal: Any):
+        """Guarda un principal ya ensamblado"""
+        if self.ttl <= 0 or principal is None:
+            return
+        self._cache.set((kind, firebase_uid), principal.model_copy(deep=True))
+
+    def invalidate_uid(self, firebase_uid: str) -> int:
+        """Invalida todas las entradas de un Firebase UID"""
+        return self._cache.invalidate_where(lambda key, _: key[1] == firebase_uid)
+
+    def invalidate_user_id(self, user_id: str) -> int:
+        """Invalida todas las entradas de un user_id (perfiles de doctor/policía)"""
+        return self._cache.invalidate_where(lambda _, principal: getattr(principal, "user_id", None) == user_id)
+
+    def invalidate_dni(self, dni: str) -> int:
+        """Invalida todas las entradas de un DNI (doctores de la colección legacy)"""
+        return self._cache.invalidate_where(lambda _, principal: getattr(principal, "dni", None) == dni)
+
+    def clear(self):
+        """Vacía la caché de principales"""
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        """Contadores de uso de la caché"""
+        stats = self._cache.stats()
+        stats["ttl_seconds"] = self.ttl
+        stats["listener_active"] = bool(self._watches)
+        return stats
+
+    # Sincronización opcional mediante snapshot listeners de Firestore
+
+    def start_listener(self, db):
+        """Mantiene la caché fresca escuchando cambios en usuarios y perfiles"""
+        if self._watches:
+            return
+        try:
+            self._watches.append(
+                db.collection(self.USERS_COLLECTION).on_snapshot(self._make_callback("firebase_uid"))
+            )
+            for collection in self.PROFILE_COLLECTIONS:
+                self._watches.append(
+                    db.collection(collection).on_snapshot(self._make_callback("user_id"))
+                )
+            logger.info("Principal cache snapshot listeners started")
+        except Exception as e:
+            logger.error(f"Error starting principal cache listeners: {e}")
+            self.stop_listener()
+
+    def stop_listener(self):
+        """Detiene los snapshot listeners"""
+        for watch in self._watches:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                logger.warning(f"Error stopping principal cache listener: {e}")
+        self._watches = []
+
+    def _make_callback(self, key_field: str):
+        """Crea el callback que invalida las entradas afectadas por cada cambio"""
+        state = {"initial": True}
+
+        def on_snapshot(doc_snapshots, changes, read_time):
+            # El primer snapshot contiene la colección completa y no implica cambios
+            if state["initial"]:
+                state["initial"] = False
+                return
+            for change in changes:
+                data = change.document.to_dict() or {}
+                value = data.get(key_field)
+                if not value:
+                    continue
+                if key_field == "firebase_uid":
+                    self.invalidate_uid(value)
+                else:
+                    self.invalidate_user_id(value)
+
+        return on_snapshot
+
+
+# Instancia global de la caché de principales
+principal_cache = PrincipalCache()
@@ -0,0 +1,136 @@
+from firebase_admin import auth
+from auth.jwks import firebase_token_verifier
+from services.cache import ExpiringLRUCache
+from services.executor import run_in_executor
+from typing import Optional
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Configuración de la verificación de tokens
+CLOCK_SKEW_SECONDS = min(max(int(os.getenv("AUTH_CLOCK_SKEW_SECONDS", "5")), 0), 60)
+VERIFY_MAX_RETRIES = max(int(os.getenv("AUTH_VERIFY_MAX_RETRIES", "2")), 0)
+VERIFY_BACKOFF_SECONDS = float(os.getenv("AUTH_VERIFY_BACKOFF_SECONDS", "0.1"))
+VERIFY_BACKOFF_MAX = float(os.getenv("AUTH_VERIFY_BACKOFF_MAX", "1.0"))
+# "local" verifica la firma con los certificados en memoria; "firebase_admin" usa el SDK
+TOKEN_VERIFIER = os.getenv("AUTH_TOKEN_VERIFIER", "local").lower()
+
+# Fallos transitorios: reloj desincronizado o error al descargar los certificados
+RETRYABLE_FAILURES = {"clock_skew", "certificate_fetch"}
+
+
+class TokenCache:
+    """Caché de tokens de Firebase ya verificados, válidos hasta su claim exp"""
+
+    def __init__(self, max_size: int = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "2048"))):
+        self._cache = ExpiringLRUCache(max_size=max_size)
+
+    @staticmethod
+    def _key(token: str) -> str:
+        """No se guarda el token en claro, solo su hash"""
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """Obtiene el token decodificado si sigue en caché y no ha expirado"""
+        return self._cache.get(self._key(token))
+
+    def put(self, token: str, decoded_token: dict):
+        """Guarda un token decodificado hasta su expiración"""
+        exp = decoded_token.get("exp")
+        if not exp or exp <= time.time():
+            return
+        self._cache.set(self._key(token), decoded_token, expires_at=float(exp))
+
+    def invalidate_user(self, firebase_uid: str) -> int:
+        """Invalida todos los tokens de un usuario (revocación o deshabilitación)"""
+        removed = self._cache.invalidate_where(lambda _, decoded: decoded.get("uid") == firebase_uid)
+        if removed:
+            logger.info(f"Invalidated {removed} cached tokens for user {firebase_uid}")
+        return removed
+
+    def clear(self):
+        """Vacía la caché de tokens"""
+        self._cache.clear()
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def stats(self) -> dict:
+        """Contadores de aciertos y fallos de la caché"""
+        return self._cache.stats()
+
+
+# Instancia global de la caché de tokens
+token_cache = TokenCache()
+
+
+def classify_token_error(error: Exception) -> str:
+    """Clasifica el motivo por el que falló la verificación de un token"""
+    if isinstance(error, auth.ExpiredIdTokenError):
+        return "expired"
+    if isinstance(error, auth.RevokedIdTokenError):
+        return "revoked"
+    if isinstance(error, auth.UserDisabledError):
+        return "disabled"
+    if isinstance(error, auth.CertificateFetchError):
+        return "certificate_fetch"
+    if isinstance(error, auth.InvalidIdTokenError):
+        # El SDK reporta "Token used too early" cuando iat está en el futuro
+        if "too early" in str(error).lower():
+            return "clock_skew"
+        return "invalid"
+    if isinstance(error, ValueError):
+        return "malformed"
+    return "unknown"
+
+
+def use_local_verifier() -> bool:
+    """El emulador de Auth emite tokens sin firmar, así que ahí se usa siempre el SDK"""
+    return (
+        TOKEN_VERIFIER == "local"
+        and not os.getenv("FIREBASE_AUTH_EMULATOR_HOST")
+        and firebase_token_verifier.project_id is not None
+    )
+
+
+async def _verify_once(token: str) -> dict:
+    """Un único intento de verificación, sin bloquear el event loop"""
+    if use_local_verifier():
+        return await firebase_token_verifier.verify(token, clock_skew_seconds=CLOCK_SKEW_SECONDS)
+    return await run_in_executor(auth.verify_id_token, token, clock_skew_seconds=CLOCK_SKEW_SECONDS)
+
+
+async def verify_id_token(token: str) -> dict:
+    """Verifica un ID token de Firebase reutilizando verificaciones previas"""
+    decoded_token = token_cache.get(token)
+    if decoded_token is not None:
+        return decoded_token
+
+    attempt = 0
+    while True:
+        try:
+            decoded_token = await _verify_once(token)
+            break
+        except Exception as e:
+            reason = classify_token_error(e)
+            if reason not in RETRYABLE_FAILURES or attempt >= VERIFY_MAX_RETRIES:
+                logger.warning(f"ID token verification failed ({reason}) after {attempt + 1} attempt(s): {e}")
+                raise
+            # Backoff exponencial acotado, solo para fallos transitorios
+            delay = min(VERIFY_BACKOFF_SECONDS * (2 ** attempt), VERIFY_BACKOFF_MAX)
+            attempt += 1
+            logger.info(f"Retrying ID token verification ({reason}) in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    if decoded_token:
+        token_cache.put(token, decoded_token)
+    return decoded_token
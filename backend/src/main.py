@@ -3,6 +3,9 @@ import logging
 from fastapi import FastAPI
 from routers.system_info import system_info_router
 from auth.firebase import FirebaseAuth
+from auth.principal_cache import principal_cache
+from auth.jwks import firebase_key_set
+from auth.tokens import use_local_verifier
 from contextlib import asynccontextmanager
 from routers.patients import patients_router
 from routers.visit import visit_router
@@ -14,6 +17,8 @@ from routers.admin import admin_router
 from fastapi.middleware.cors import CORSMiddleware
 from routers.exams import exam_router
 from services.firestore_indexes import firestore_index_service
+from services.executor import firestore_executor, run_in_executor
+from services.container import init_services, shutdown_services
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -28,6 +33,33 @@ async def lifespan(app: FastAPI):
     app.firebase_auth = FirebaseAuth(firebase_credentials_path)
     logger.info("✓ Firebase Auth initialized")
     
+    # Cargar los certificados de firma de Firebase para verificar tokens localmente
+    if use_local_verifier():
+        await firebase_key_set.start()
+        logger.info("✓ Firebase signing certificates loaded")
+    
+    # Construir el cliente de Firestore compartido y una instancia de cada servicio
+    services = init_services()
+    logger.info("✓ Service container initialized")
+    
+    # Mantener la caché de principales sincronizada con Firestore si está habilitado
+    if principal_cache.listener_enabled:
+        principal_cache.start_listener(services.db)
+        logger.info("✓ Principal cache listener started")
+    
+    # Directorio de pacientes en memoria: el snapshot listener hace la carga inicial en segundo plano
+    if services.patient_service.directory is not None:
+        services.patient_service.directory.start(services.patient_service.repository)
+        logger.info("✓ Patient directory listener started")
+    
+    # Cargar el índice de nombres de pacientes en memoria si está habilitado
+    if services.patient_service.name_index is not None:
+        try:
+            indexed = await run_in_executor(services.patient_service.warm_search_index)
+            logger.info(f"✓ Patient name index loaded ({indexed} patients)")
+        except Exception as e:
+            logger.error(f"❌ Error loading patient name index: {e}")
+    
     # Verificar y crear índices de Firestore
     try:
         logger.info("🔍 Verifying Firestore indexes...")
@@ -42,6 +74,10 @@ async def lifespan(app: FastAPI):
     yield
     
     logger.info("🔄 Shutting down API...")
+    principal_cache.stop_listener()
+    await firebase_key_set.stop()
+    firestore_executor.shutdown()
+    shutdown_services()
     app.firebase_auth = None
     logger.info("✅ API shutdown completed")
 
@@ -52,6 +88,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 app.include_router(system_info_router)
@@ -73,6 +73,10 @@ class PatientDB(BaseModel):
     last_updated_by: Optional[str] = Field(None, description="DNI del último médico que actualizó")
     discapacity_level: Optional[int] = Field(None, description="Nivel de discapacidad del paciente")
     
+    # Desnormalizado desde visits (admisión o alta más reciente) para listados sin consultas extra
+    last_visit_date: Optional[datetime] = Field(None, description="Fecha de la última visita")
+    last_visit_id: Optional[str] = Field(None, description="ID de la última visita")
+    
     class Config:
         json_encoders = {
             datetime: lambda dt: dt.isoformat()
@@ -1,22 +1,26 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from typing import List
-from schemas.admin import RoleAssignmentRequest, RoleAssignmentResponse, UserRoleInfo
+from schemas.admin import RoleAssignmentRequest, RoleAssignmentResponse, UserRoleInfo, TokenRevocationResponse
 from schemas.enums import UserRole
 from services.user import UserService
+from services.executor import run_in_executor, firestore_executor
+from services.container import get_user_service, get_services
 from auth.authorization import require_admin
+from auth.tokens import token_cache
+from auth.principal_cache import principal_cache
 from schemas.user import User
 import logging
 
 logger = logging.getLogger(__name__)
 
 admin_router = APIRouter(prefix="/admin", tags=["admin"])
-user_service = UserService()
 
 
 @admin_router.post("/assign-role", response_model=RoleAssignmentResponse)
 async def assign_or_revoke_role(
     role_request: RoleAssignmentRequest,
-    current_admin: User = Depends(require_admin)
+    current_admin: User = Depends(require_admin),
+    user_service: UserService = Depends(get_user_service)
 ):
     """
     Asigna o revoca un rol adicional a un usuario (médico o policía)
@@ -24,7 +28,7 @@ async def assign_or_revoke_role(
     """
     try:
         # Buscar el usuario por DNI
-        user = user_service.get_user_by_dni(role_request.user_dni)
+        user = await run_in_executor(user_service.get_user_by_dni, role_request.user_dni)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -40,7 +44,7 @@ async def assign_or_revoke_role(
         
         # Obtener el perfil específico del usuario
         if user.role == UserRole.DOCTOR:
-            doctor = user_service.get_doctor_by_firebase_uid(user.firebase_uid)
+            doctor = await run_in_executor(user_service.get_doctor_by_firebase_uid, user.firebase_uid)
             if not doctor:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
@@ -50,7 +54,7 @@ async def assign_or_revoke_role(
             profile_type = "doctor"
             profile = doctor
         else:  # UserRole.POLICE
-            police = user_service.get_police_by_firebase_uid(user.firebase_uid)
+            police = await run_in_executor(user_service.get_police_by_firebase_uid, user.firebase_uid)
             if not police:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
@@ -75,7 +79,8 @@ async def assign_or_revoke_role(
                 action_message = f"El usuario no tiene el rol '{role_request.role}'"
         
         # Actualizar el perfil en la base de datos
-        updated_profile = user_service.update_user_roles(
+        updated_profile = await run_in_executor(
+            user_service.update_user_roles,
             user.firebase_uid, 
             profile_type, 
             current_roles
@@ -110,7 +115,8 @@ async def assign_or_revoke_role(
 @admin_router.get("/user-roles/{user_dni}", response_model=UserRoleInfo)
 async def get_user_roles(
     user_dni: str,
-    current_admin: User = Depends(require_admin)
+    current_admin: User = Depends(require_admin),
+    user_service: UserService = Depends(get_user_service)
 ):
     """
     Obtiene información de roles de un usuario específico
@@ -118,7 +124,7 @@ async def get_user_roles(
     """
     try:
         # Buscar el usuario por DNI
-        user = user_service.get_user_by_dni(user_dni)
+        user = await run_in_executor(user_service.get_user_by_dni, user_dni)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -128,11 +134,11 @@ async def get_user_roles(
         # Obtener roles adicionales según el tipo de usuario
         additional_roles = []
         if user.role == UserRole.DOCTOR:
-            doctor = user_service.get_doctor_by_firebase_uid(user.firebase_uid)
+            doctor = await run_in_executor(user_service.get_doctor_by_firebase_uid, user.firebase_uid)
             if doctor:
                 additional_roles = getattr(doctor, 'roles', None) or []
         elif user.role == UserRole.POLICE:
-            police = user_service.get_police_by_firebase_uid(user.firebase_uid)
+            police = await run_in_executor(user_service.get_police_by_firebase_uid, user.firebase_uid)
             if police:
                 additional_roles = getattr(police, 'roles', None) or []
         
@@ -156,25 +162,26 @@ async def get_user_roles(
 
 @admin_router.get("/recruiters", response_model=List[UserRoleInfo])
 async def get_all_recruiters(
-    current_admin: User = Depends(require_admin)
+    current_admin: User = Depends(require_admin),
+    user_service: UserService = Depends(get_user_service)
 ):
     """
     Obtiene lista de todos los usuarios con rol 'recruiter'
     Solo accesible para administradores
     """
     try:
-        recruiters = user_service.get_users_with_role("recruiter")
+        recruiters = await run_in_executor(user_service.get_users_with_role, "recruiter")
         
         result = []
         for recruiter in recruiters:
             # Obtener roles adicionales según el tipo
             additional_roles = []
             if recruiter.role == UserRole.DOCTOR:
-                doctor = user_service.get_doctor_by_firebase_uid(recruiter.firebase_uid)
+                doctor = await run_in_executor(user_service.get_doctor_by_firebase_uid, recruiter.firebase_uid)
                 if doctor:
                     additional_roles = getattr(doctor, 'roles', None) or []
             elif recruiter.role == UserRole.POLICE:
-                police = user_service.get_police_by_firebase_uid(recruiter.firebase_uid)
+                police = await run_in_executor(user_service.get_police_by_firebase_uid, recruiter.firebase_uid)
                 if police:
                     additional_roles = getattr(police, 'roles', None) or []
             
@@ -195,3 +202,61 @@ async def get_all_recruiters(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error al obtener la lista de recruiters"
         )
+
+
+@admin_router.post("/users/{user_dni}/revoke-tokens", response_model=TokenRevocationResponse)
+async def revoke_user_tokens(
+    user_dni: str,
+    current_admin: User = require_admin(),
+    user_service: UserService = Depends(get_user_service)
+):
+    """
+    Revoca las sesiones de un usuario en Firebase e invalida sus tokens y principales en caché
+    Solo accesible para administradores
+    """
+    try:
+        user = await run_in_executor(user_service.get_user_by_dni, user_dni)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Usuario con DNI {user_dni} no encontrado"
+            )
+        
+        if not await run_in_executor(user_service.revoke_user_tokens, user.firebase_uid):
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail="Error al revocar las sesiones en Firebase (la caché local ya se ha invalidado)"
+            )
+        
+        logger.info(f"Admin {current_admin.dni} revoked tokens of user {user_dni}")
+        return TokenRevocationResponse(
+            message="Sesiones revocadas correctamente",
+            user_dni=user.dni,
+            user_name=user.name
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error revoking tokens for {user_dni}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al revocar las sesiones del usuario"
+        )
+
+
+@admin_router.get("/cache-stats")
+async def get_cache_stats(
+    current_admin: User = require_admin()
+):
+    """
+    Obtiene los contadores de las cachés en memoria y del pool de Firestore
+    Solo accesible para administradores
+    """
+    directory = get_services().patient_service.directory
+    return {
+        "token_cache": token_cache.stats(),
+        "principal_cache": principal_cache.stats(),
+        "firestore_executor": firestore_executor.stats(),
+        "patient_directory": directory.stats() if directory is not None else {"enabled": False}
+    }
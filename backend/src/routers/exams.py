@@ -1,12 +1,15 @@
-from fastapi import APIRouter, HTTPException, Query, Depends, status
+from fastapi import APIRouter, HTTPException, Query, Depends, Request, Response, status
 from schemas.exam import (
-    ExamCreate, CategoryCreate, QuestionCreate, ExamSubmission,
+    ExamCreate, CategoryCreate, QuestionCreate, ExamSubmission, ExamBatchSubmission, ExamBatchResponse,
     ExamResultResponse, ExamResultDetailResponse, PatientExamHistoryResponse,
     PatientsWithExamsResponse, ExamStatisticsResponse, PatientExamSummary
 )
 from schemas.exam_certificate import ExamCertificateResponse
-from services.exam import exam_service
-from services.exam_results import exam_result_service
+from services.exam import ExamService
+from services.exam_results import ExamResultService
+from services.container import get_exam_result_service, get_exam_service
+from services.streaming import streaming_json_response, wants_ndjson
+from services.etag import etag_matches
 from auth.authorization import require_exam_admin, require_exam_access
 from schemas.user import User
 from typing import Optional
@@ -17,7 +20,11 @@ exam_router = APIRouter(
 ) 
 
 @exam_router.post("/")
-def create_exam(exam: ExamCreate, current_user: User = require_exam_admin()):
+def create_exam(
+    exam: ExamCreate,
+    current_user: User = require_exam_admin(),
+    exam_service: ExamService = Depends(get_exam_service)
+):
     """
     Create a new exam with categories and questions
     Only admins (doctors or police with admin role) can create exams
@@ -31,8 +38,106 @@ def create_exam(exam: ExamCreate, current_user: User = require_exam_admin()):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# Rutas GET fijas antes de "/{exam_id}": registradas después, "/exams/patients" o
+# "/exams/statistics" se resolverían como get_exam con ese exam_id
+@exam_router.get("/patients")
+def get_patients_with_exams(
+    search: Optional[str] = Query(None, description="Search patients by name or DNI"),
+    current_user: User = require_exam_access(),
+    exam_result_service: ExamResultService = Depends(get_exam_result_service)
+):
+    """
+    Get list of patients who have taken exams
+    Useful for police to see who has psychotechnical licenses
+    Accessible by doctors and police officers
+    """
+    try:
+        if search:
+            # Buscar pacientes específicos
+            patients = exam_result_service.search_patients_by_name_or_dni(search)
+            return {
+                "total_patients": len(patients),
+                "patients": patients
+            }
+        else:
+            # Obtener todos los pacientes con exámenes
+            result = exam_result_service.get_patients_with_exams_summary()
+            if result:
+                return result
+            else:
+                return PatientsWithExamsResponse(total_patients=0, patients=[])
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@exam_router.get("/patients/search/{search_term}")
+def search_patients_with_exams(
+    search_term: str,
+    current_user: User = require_exam_access(),
+    exam_result_service: ExamResultService = Depends(get_exam_result_service)
+):
+    """
+    Search patients who have taken exams by name or DNI
+    Specifically useful for police to quickly find drivers
+    Accessible by doctors and police officers
+    """
+    try:
+        patients = exam_result_service.search_patients_by_name_or_dni(search_term)
+        return {
+            "search_term": search_term,
+            "total_found": len(patients),
+            "patients": patients
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@exam_router.get("/results")
+def get_all_exam_results(
+    request: Request,
+    limit: Optional[int] = Query(None, description="Limit number of results"),
+    stream: bool = Query(False, description="Stream results (NDJSON with Accept: application/x-ndjson)"),
+    current_user: User = require_exam_access(),
+    exam_result_service: ExamResultService = Depends(get_exam_result_service)
+):
+    """
+    Get all exam results
+    Accessible by doctors and police officers
+    """
+    if stream:
+        return streaming_json_response(exam_result_service.iter_all_exam_results(limit), ndjson=wants_ndjson(request))
+    
+    try:
+        return exam_result_service.get_all_exam_results(limit)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@exam_router.get("/statistics")
+def get_exam_statistics(
+    days_back: Optional[int] = Query(30, description="Number of days back to analyze"),
+    current_user: User = require_exam_access(),
+    exam_result_service: ExamResultService = Depends(get_exam_result_service)
+):
+    """
+    Get exam statistics and analytics
+    Useful for monitoring exam performance and trends
+    Accessible by doctors and police officers
+    """
+    try:
+        result = exam_result_service.get_exam_statistics(days_back)
+        if result:
+            return result
+        else:
+            raise HTTPException(status_code=500, detail="Unable to generate statistics")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @exam_router.get("/{exam_id}")
-def get_exam(exam_id: str, current_user: User = require_exam_access()):
+def get_exam(
+    exam_id: str,
+    current_user: User = require_exam_access(),
+    exam_service: ExamService = Depends(get_exam_service)
+):
     """
     Get an exam by its ID
     Accessible by doctors and police officers
@@ -47,7 +152,12 @@ def get_exam(exam_id: str, current_user: User = require_exam_access()):
         raise HTTPException(status_code=400, detail=str(e))
 
 @exam_router.put("/{exam_id}")
-def update_exam(exam_id: str, exam: ExamCreate, current_user: User = require_exam_admin()):
+def update_exam(
+    exam_id: str,
+    exam: ExamCreate,
+    current_user: User = require_exam_admin(),
+    exam_service: ExamService = Depends(get_exam_service)
+):
     """
     Update an existing exam
     Only admins (doctors or police with admin role) can update exams
@@ -62,7 +172,11 @@ def update_exam(exam_id: str, exam: ExamCreate, current_user: User = require_exa
         raise HTTPException(status_code=400, detail=str(e))
 
 @exam_router.delete("/{exam_id}")
-def delete_exam(exam_id: str, current_user: User = require_exam_admin()):
+def delete_exam(
+    exam_id: str,
+    current_user: User = require_exam_admin(),
+    exam_service: ExamService = Depends(get_exam_service)
+):
     """
     Delete an exam (soft delete)
     Only admins (doctors or police with admin role) can delete exams
@@ -79,7 +193,8 @@ def delete_exam(exam_id: str, current_user: User = require_exam_admin()):
 @exam_router.get("/")
 def list_exams(
     search: Optional[str] = Query(None, description="Search exams by name"),
-    current_user: User = require_exam_access()
+    current_user: User = require_exam_access(),
+    exam_service: ExamService = Depends(get_exam_service)
 ):
     """
     List all exams or search by name
@@ -97,7 +212,8 @@ def list_exams(
 def add_category_to_exam(
     exam_id: str, 
     category: CategoryCreate, 
-    current_user: User = require_exam_admin()
+    current_user: User = require_exam_admin(),
+    exam_service: ExamService = Depends(get_exam_service)
 ):
     """
     Add a new category to an existing exam
@@ -117,7 +233,8 @@ def add_question_to_category(
     exam_id: str, 
     category_id: str, 
     question: QuestionCreate, 
-    current_user: User = require_exam_admin()
+    current_user: User = require_exam_admin(),
+    exam_service: ExamService = Depends(get_exam_service)
 ):
     """
     Add a new question to a specific category in an exam
@@ -133,22 +250,37 @@ def add_question_to_category(
         raise HTTPException(status_code=400, detail=str(e))
 
 @exam_router.get("/{exam_id}/questions")
-def get_questions_by_exam(exam_id: str, current_user: User = require_exam_access()):
+def get_questions_by_exam(
+    exam_id: str,
+    request: Request,
+    current_user: User = require_exam_access(),
+    exam_service: ExamService = Depends(get_exam_service)
+):
     """
-    Get all questions by exam
+    Get all questions by exam (without correct answers)
+    The sheet is cached per exam version; If-None-Match returns 304 while it is unchanged
     Accessible by doctors and police officers
     """
     try:
-        result = exam_service.get_questions_by_exam(exam_id)
-        if result:
-            return result
-        else:
+        sheet = exam_service.get_question_sheet(exam_id)
+        if not sheet:
             raise HTTPException(status_code=404, detail="Exam not found")
+        body, etag = sheet
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @exam_router.post("/results")
-def submit_exam_result(submission: ExamSubmission, current_user: User = require_exam_access()):
+def submit_exam_result(
+    submission: ExamSubmission,
+    current_user: User = require_exam_access(),
+    exam_result_service: ExamResultService = Depends(get_exam_result_service)
+):
     """
     Submit exam results for a patient
     Accessible by doctors and police officers who can administer exams
@@ -167,8 +299,33 @@ def submit_exam_result(submission: ExamSubmission, current_user: User = require_
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@exam_router.post("/results/batch", response_model=ExamBatchResponse)
+def submit_exam_results_batch(
+    batch: ExamBatchSubmission,
+    current_user: User = require_exam_access(),
+    exam_result_service: ExamResultService = Depends(get_exam_result_service)
+):
+    """
+    Submit the exams of a group session in a single request
+    Each submission is graded and stored independently; the response reports every item
+    Accessible by doctors and police officers who can administer exams
+    """
+    try:
+        return exam_result_service.submit_exam_results_batch(
+            submissions=batch.submissions,
+            examiner_dni=current_user.dni,
+            examiner_name=current_user.name,
+            examiner_role=current_user.role.value
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @exam_router.get("/results/{result_id}")
-def get_exam_result(result_id: str, current_user: User = require_exam_access()):
+def get_exam_result(
+    result_id: str,
+    current_user: User = require_exam_access(),
+    exam_result_service: ExamResultService = Depends(get_exam_result_service)
+):
     """
     Get exam result by ID
     Accessible by doctors and police officers
@@ -183,7 +340,11 @@ def get_exam_result(result_id: str, current_user: User = require_exam_access()):
         raise HTTPException(status_code=400, detail=str(e))
 
 @exam_router.get("/results/{result_id}/detail")
-def get_exam_result_detail(result_id: str, current_user: User = require_exam_access()):
+def get_exam_result_detail(
+    result_id: str,
+    current_user: User = require_exam_access(),
+    exam_result_service: ExamResultService = Depends(get_exam_result_service)
+):
     """
     Get detailed exam result with all answers
     Accessible by doctors and police officers
@@ -198,13 +359,17 @@ def get_exam_result_detail(result_id: str, current_user: User = require_exam_acc
         raise HTTPException(status_code=400, detail=str(e))
 
 @exam_router.get("/patients/{patient_dni}/history")
-def get_patient_exam_history(patient_dni: str, current_user: User = require_exam_access()):
+async def get_patient_exam_history(
+    patient_dni: str,
+    current_user: User = require_exam_access(),
+    exam_result_service: ExamResultService = Depends(get_exam_result_service)
+):
     """
     Get exam history for a specific patient by DNI
     Accessible by doctors and police officers
     """
     try:
-        result = exam_result_service.get_patient_exam_history(patient_dni)
+        result = await exam_result_service.get_patient_exam_history_async(patient_dni)
         if result:
             return result
         else:
@@ -212,96 +377,16 @@ def get_patient_exam_history(patient_dni: str, current_user: User = require_exam
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@exam_router.get("/results")
-def get_all_exam_results(
-    limit: Optional[int] = Query(None, description="Limit number of results"),
-    current_user: User = require_exam_access()
-):
-    """
-    Get all exam results
-    Accessible by doctors and police officers
-    """
-    try:
-        return exam_result_service.get_all_exam_results(limit)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-@exam_router.get("/patients")
-def get_patients_with_exams(
-    search: Optional[str] = Query(None, description="Search patients by name or DNI"),
-    current_user: User = require_exam_access()
-):
-    """
-    Get list of patients who have taken exams
-    Useful for police to see who has psychotechnical licenses
-    Accessible by doctors and police officers
-    """
-    try:
-        if search:
-            # Buscar pacientes específicos
-            patients = exam_result_service.search_patients_by_name_or_dni(search)
-            return {
-                "total_patients": len(patients),
-                "patients": patients
-            }
-        else:
-            # Obtener todos los pacientes con exámenes
-            result = exam_result_service.get_patients_with_exams_summary()
-            if result:
-                return result
-            else:
-                return PatientsWithExamsResponse(total_patients=0, patients=[])
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-@exam_router.get("/statistics")
-def get_exam_statistics(
-    days_back: Optional[int] = Query(30, description="Number of days back to analyze"),
-    current_user: User = require_exam_access()
-):
-    """
-    Get exam statistics and analytics
-    Useful for monitoring exam performance and trends
-    Accessible by doctors and police officers
-    """
-    try:
-        result = exam_result_service.get_exam_statistics(days_back)
-        if result:
-            return result
-        else:
-            raise HTTPException(status_code=500, detail="Unable to generate statistics")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-@exam_router.get("/patients/search/{search_term}")
-def search_patients_with_exams(
-    search_term: str,
-    current_user: User = require_exam_access()
-):
-    """
-    Search patients who have taken exams by name or DNI
-    Specifically useful for police to quickly find drivers
-    Accessible by doctors and police officers
-    """
-    try:
-        patients = exam_result_service.search_patients_by_name_or_dni(search_term)
-        return {
-            "search_term": search_term,
-            "total_found": len(patients),
-            "patients": patients
-        }
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
 @exam_router.get("/get_certificate/{exam_id}/{patient_dni}", response_model=ExamCertificateResponse)
 async def get_exam_certificate(
     exam_id: str,
     patient_dni: str,
-    current_user: User = require_exam_access()
+    current_user: User = require_exam_access(),
+    exam_result_service: ExamResultService = Depends(get_exam_result_service)
 ):
     """Obtiene el certificado del último examen realizado por un paciente"""
     try:
-        certificate = exam_result_service.get_latest_exam_certificate(exam_id, patient_dni)
+        certificate = await exam_result_service.get_latest_exam_certificate_async(exam_id, patient_dni)
         if not certificate:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Request, Response
 from typing import Optional, List
 from schemas import (
     Patient, PatientCreate, PatientUpdate, PatientAdmitted, PatientComplete,
@@ -7,24 +7,33 @@ from schemas import (
     MedicalHistoryResponse, Doctor
 )
 from services.patient import PatientService
+from services.executor import run_in_executor
+from services.streaming import streaming_json_response, wants_ndjson
+from services.etag import etag_matches
+from services.container import get_patient_service
 from auth.firebase import FirebaseAuth
 
 patients_router = APIRouter(prefix="/patients", tags=["patients"])
-patient_service = PatientService()
 firebase_auth = FirebaseAuth() 
 
 
 @patients_router.get("/", response_model=List[PatientSummary])
 async def get_patients(
+    request: Request,
     name: Optional[str] = Query(None, description="Filtrar por nombre del paciente"),
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    stream: bool = Query(False, description="Exporta todos los pacientes en streaming (NDJSON con Accept: application/x-ndjson)"),
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    patient_service: PatientService = Depends(get_patient_service)
 ):
     """Obtiene todos los pacientes habilitados o busca por nombre si se proporciona"""
+    if stream and not name:
+        return streaming_json_response(patient_service.iter_all_patients(), ndjson=wants_ndjson(request))
+    
     try:
         if name:
-            patients = patient_service.search_patients(name)
+            patients = await run_in_executor(patient_service.search_patients, name)
         else:
-            patients = patient_service.get_all_patients()
+            patients = await run_in_executor(patient_service.get_all_patients)
         return patients
     except Exception as e:
         raise HTTPException(
@@ -36,11 +45,12 @@ async def get_patients(
 @patients_router.post("/", response_model=Patient, status_code=status.HTTP_201_CREATED)
 async def create_patient(
     patient: PatientCreate, 
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    patient_service: PatientService = Depends(get_patient_service)
 ):
     """Crea un nuevo paciente"""
     try:
-        created_patient = patient_service.create_patient(patient, created_by=current_user.dni)
+        created_patient = await run_in_executor(patient_service.create_patient, patient, created_by=current_user.dni)
         if not created_patient:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
@@ -57,10 +67,20 @@ async def create_patient(
 
 
 @patients_router.get("/admitted", response_model=List[PatientAdmitted])
-async def get_admitted_patients(current_user: Doctor = Depends(firebase_auth.verify_token)):
-    """Obtiene todos los pacientes actualmente admitidos"""
+async def get_admitted_patients(
+    request: Request,
+    response: Response,
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    patient_service: PatientService = Depends(get_patient_service)
+):
+    """Obtiene todos los pacientes actualmente admitidos (If-None-Match responde 304 si no hay cambios)"""
     try:
-        return patient_service.get_admitted_patients()
+        admitted_patients, etag = await run_in_executor(patient_service.get_admitted_board)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response.headers.update(headers)
+        return admitted_patients
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -71,11 +91,12 @@ async def get_admitted_patients(current_user: Doctor = Depends(firebase_auth.ver
 @patients_router.get("/{patient_dni}", response_model=Patient)
 async def get_patient(
     patient_dni: str, 
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    patient_service: PatientService = Depends(get_patient_service)
 ):
     """Obtiene información básica de un paciente por DNI"""
     try:
-        patient = patient_service.get_patient(patient_dni)
+        patient = await run_in_executor(patient_service.get_patient, patient_dni)
         if not patient:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, 
@@ -94,11 +115,12 @@ async def get_patient(
 @patients_router.get("/{patient_dni}/complete", response_model=PatientComplete)
 async def get_patient_complete(
     patient_dni: str, 
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    patient_service: PatientService = Depends(get_patient_service)
 ):
     """Obtiene información completa de un paciente incluyendo historial médico"""
     try:
-        patient = patient_service.get_patient_complete(patient_dni)
+        patient = await run_in_executor(patient_service.get_patient_complete, patient_dni)
         if not patient:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, 
@@ -118,11 +140,13 @@ async def get_patient_complete(
 async def update_patient_basic(
     patient_dni: str, 
     patient_update: PatientUpdate, 
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    patient_service: PatientService = Depends(get_patient_service)
 ):
     """Actualiza información básica del paciente"""
     try:
-        updated_patient = patient_service.update_patient_basic(
+        updated_patient = await run_in_executor(
+            patient_service.update_patient_basic,
             patient_dni, patient_update, updated_by=current_user.dni
         )
         if not updated_patient:
@@ -144,11 +168,13 @@ async def update_patient_basic(
 async def update_patient_medical_history(
     patient_dni: str,
     medical_update: PatientMedicalHistoryUpdate,
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    patient_service: PatientService = Depends(get_patient_service)
 ):
     """Actualiza el historial médico del paciente"""
     try:
-        updated_history = patient_service.update_medical_history(
+        updated_history = await run_in_executor(
+            patient_service.update_medical_history,
             patient_dni, medical_update, updated_by=current_user.dni
         )
         if not updated_history:
@@ -170,11 +196,13 @@ async def update_patient_medical_history(
 async def add_blood_analysis(
     patient_dni: str,
     analysis_data: BloodAnalysisCreate,
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    patient_service: PatientService = Depends(get_patient_service)
 ):
     """Añade un nuevo análisis de sangre al paciente"""
     try:
-        analysis = patient_service.add_blood_analysis(
+        analysis = await run_in_executor(
+            patient_service.add_blood_analysis,
             patient_dni, analysis_data, performed_by_dni=current_user.dni, performed_by_name=current_user.name
         )
         if not analysis:
@@ -192,15 +220,66 @@ async def add_blood_analysis(
         )
 
 
+@patients_router.get("/{patient_dni}/blood-analysis/latest", response_model=BloodAnalysisResponse)
+async def get_latest_blood_analysis(
+    patient_dni: str,
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    patient_service: PatientService = Depends(get_patient_service)
+):
+    """Obtiene el análisis de sangre más reciente del paciente"""
+    try:
+        analysis = await run_in_executor(patient_service.get_latest_blood_analysis, patient_dni)
+        if not analysis:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Blood analysis not found"
+            )
+        return analysis
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving latest blood analysis: {str(e)}"
+        )
+
+
+@patients_router.get("/{patient_dni}/blood-analysis/visit/{visit_id}", response_model=List[BloodAnalysisResponse])
+async def get_blood_analyses_by_visit(
+    patient_dni: str,
+    visit_id: str,
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    patient_service: PatientService = Depends(get_patient_service)
+):
+    """Obtiene los análisis de sangre del paciente asociados a una visita"""
+    try:
+        analyses = await run_in_executor(patient_service.get_blood_analyses_by_visit, patient_dni, visit_id)
+        if analyses is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Patient not found"
+            )
+        return analyses
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving blood analyses: {str(e)}"
+        )
+
+
 @patients_router.post("/{patient_dni}/radiology-study", response_model=RadiologyStudyResponse)
 async def add_radiology_study(
     patient_dni: str,
     study_data: RadiologyStudyCreate,
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    patient_service: PatientService = Depends(get_patient_service)
 ):
     """Añade un nuevo estudio radiológico al paciente"""
     try:
-        study = patient_service.add_radiology_study(
+        study = await run_in_executor(
+            patient_service.add_radiology_study,
             patient_dni, study_data, performed_by_dni=current_user.dni, performed_by_name=current_user.name
         )
         if not study:
@@ -221,19 +300,20 @@ async def add_radiology_study(
 @patients_router.delete("/{patient_dni}", status_code=status.HTTP_200_OK)
 async def delete_patient(
     patient_dni: str, 
-    current_user: Doctor = Depends(firebase_auth.verify_admin_token)
+    current_user: Doctor = Depends(firebase_auth.verify_admin_token),
+    patient_service: PatientService = Depends(get_patient_service)
 ):
     """Deshabilita un paciente (soft delete)"""
     try:
         # Verificar que el paciente existe antes de intentar eliminarlo
-        patient = patient_service.get_patient(patient_dni)
+        patient = await run_in_executor(patient_service.get_patient, patient_dni)
         if not patient:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, 
                 detail="Patient not found"
             )
         
-        success = patient_service.delete_patient(patient_dni, disabled_by=current_user.dni)
+        success = await run_in_executor(patient_service.delete_patient, patient_dni, disabled_by=current_user.dni)
         if not success:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
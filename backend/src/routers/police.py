@@ -1,12 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from typing import List
 from schemas.user import Police, PoliceSummary
-from services.user import UserService
 from auth.authorization import require_police, require_admin
 import logging
 
 police_router = APIRouter(prefix="/police", tags=["police"])
-user_service = UserService()
 logger = logging.getLogger(__name__)
 
 
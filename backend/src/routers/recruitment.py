@@ -3,7 +3,8 @@ from typing import List
 from schemas.recruitment import RecruitmentCreate, RecruitmentComplete
 from schemas.enums import Profession
 from services.recruitment import RecruitmentService
-from services.user import UserService
+from services.executor import run_in_executor
+from services.container import get_recruitment_service
 from auth.authorization import require_doctor_recruiter, require_police_recruiter, require_doctor_or_admin
 from schemas.user import Doctor, Police
 import logging
@@ -11,12 +12,13 @@ import logging
 logger = logging.getLogger(__name__)
 
 recruitment_router = APIRouter(prefix="/recruitment", tags=["recruitment"])
-recruitment_service = RecruitmentService()
-user_service = UserService()
 
 
 @recruitment_router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_recruitment_request(recruitment: RecruitmentCreate):
+async def create_recruitment_request(
+    recruitment: RecruitmentCreate,
+    recruitment_service: RecruitmentService = Depends(get_recruitment_service)
+):
     """
     Crea una nueva solicitud de reclutamiento
     - Se almacenan en repositorios separados según la profesión (EMS o POLICE)
@@ -42,14 +44,15 @@ async def create_recruitment_request(recruitment: RecruitmentCreate):
 
 @recruitment_router.get("/medical", response_model=List[dict])
 async def get_medical_recruitments(
-    current_doctor: Doctor = require_doctor_or_admin()
+    current_doctor: Doctor = require_doctor_or_admin(),
+    recruitment_service: RecruitmentService = Depends(get_recruitment_service)
 ):
     """
     Obtiene todas las solicitudes de reclutamiento médico
     Solo accesible para médicos con rol 'recruiter'
     """
     try:
-        recruitments = recruitment_service.get_recruitments_by_profession(Profession.EMS)
+        recruitments = await run_in_executor(recruitment_service.get_recruitments_by_profession, Profession.EMS)
         logger.info(f"Doctor {current_doctor.dni} retrieved {len(recruitments)} medical recruitments")
         return recruitments
     except Exception as e:
@@ -62,14 +65,15 @@ async def get_medical_recruitments(
 
 @recruitment_router.get("/police", response_model=List[dict])
 async def get_police_recruitments(
-    current_police: Police = require_police_recruiter()
+    current_police: Police = require_police_recruiter(),
+    recruitment_service: RecruitmentService = Depends(get_recruitment_service)
 ):
     """
     Obtiene todas las solicitudes de reclutamiento policial
     Solo accesible para policías con rol 'recruiter'
     """
     try:
-        recruitments = recruitment_service.get_recruitments_by_profession(Profession.POLICE)
+        recruitments = await run_in_executor(recruitment_service.get_recruitments_by_profession, Profession.POLICE)
         logger.info(f"Police {current_police.dni} retrieved {len(recruitments)} police recruitments")
         return recruitments
     except Exception as e:
@@ -82,14 +86,15 @@ async def get_police_recruitments(
 
 @recruitment_router.get("/medical/pending", response_model=List[dict])
 async def get_pending_medical_recruitments(
-    current_doctor: Doctor = require_doctor_or_admin()
+    current_doctor: Doctor = require_doctor_or_admin(),
+    recruitment_service: RecruitmentService = Depends(get_recruitment_service)
 ):
     """
     Obtiene solo las solicitudes de reclutamiento médico no atendidas
     Solo accesible para médicos con rol 'recruiter'
     """
     try:
-        recruitments = recruitment_service.get_unattended_recruitments(Profession.EMS)
+        recruitments = await run_in_executor(recruitment_service.get_unattended_recruitments, Profession.EMS)
         logger.info(f"Doctor retrieved {len(recruitments)} pending medical recruitments")
         return recruitments
     except Exception as e:
@@ -102,14 +107,15 @@ async def get_pending_medical_recruitments(
 
 @recruitment_router.get("/police/pending", response_model=List[dict])
 async def get_pending_police_recruitments(
-    current_police: Police = require_police_recruiter()
+    current_police: Police = require_police_recruiter(),
+    recruitment_service: RecruitmentService = Depends(get_recruitment_service)
 ):
     """
     Obtiene solo las solicitudes de reclutamiento policial no atendidas
     Solo accesible para policías con rol 'recruiter'
     """
     try:
-        recruitments = recruitment_service.get_unattended_recruitments(Profession.POLICE)
+        recruitments = await run_in_executor(recruitment_service.get_unattended_recruitments, Profession.POLICE)
         logger.info(f"Police {current_police.dni} retrieved {len(recruitments)} pending police recruitments")
         return recruitments
     except Exception as e:
@@ -123,14 +129,16 @@ async def get_pending_police_recruitments(
 @recruitment_router.put("/medical/{recruitment_id}/attend")
 async def mark_medical_recruitment_attended(
     recruitment_id: str,
-    current_doctor: Doctor = require_doctor_or_admin()
+    current_doctor: Doctor = require_doctor_or_admin(),
+    recruitment_service: RecruitmentService = Depends(get_recruitment_service)
 ):
     """
     Marca una solicitud de reclutamiento médico como atendida
     Solo accesible para médicos con rol 'recruiter'
     """
     try:
-        updated_recruitment = recruitment_service.mark_recruitment_attended(
+        updated_recruitment = await run_in_executor(
+            recruitment_service.mark_recruitment_attended,
             recruitment_id, Profession.EMS, current_doctor.name
         )
         
@@ -155,14 +163,16 @@ async def mark_medical_recruitment_attended(
 @recruitment_router.put("/police/{recruitment_id}/attend")
 async def mark_police_recruitment_attended(
     recruitment_id: str,
-    current_police: Police = require_police_recruiter()
+    current_police: Police = require_police_recruiter(),
+    recruitment_service: RecruitmentService = Depends(get_recruitment_service)
 ):
     """
     Marca una solicitud de reclutamiento policial como atendida
     Solo accesible para policías con rol 'recruiter'
     """
     try:
-        updated_recruitment = recruitment_service.mark_recruitment_attended(
+        updated_recruitment = await run_in_executor(
+            recruitment_service.mark_recruitment_attended,
             recruitment_id, Profession.POLICE, current_police.dni
         )
         
@@ -187,14 +197,15 @@ async def mark_police_recruitment_attended(
 @recruitment_router.get("/medical/{recruitment_id}")
 async def get_medical_recruitment_by_id(
     recruitment_id: str,
-    current_doctor: Doctor = require_doctor_or_admin()
+    current_doctor: Doctor = require_doctor_or_admin(),
+    recruitment_service: RecruitmentService = Depends(get_recruitment_service)
 ):
     """
     Obtiene una solicitud de reclutamiento médico específica por ID
     Solo accesible para médicos con rol 'recruiter'
     """
     try:
-        recruitment = recruitment_service.get_recruitment_by_id(recruitment_id, Profession.EMS)
+        recruitment = await run_in_executor(recruitment_service.get_recruitment_by_id, recruitment_id, Profession.EMS)
         
         if not recruitment:
             raise HTTPException(
@@ -220,14 +231,15 @@ async def get_medical_recruitment_by_id(
 @recruitment_router.get("/police/{recruitment_id}")
 async def get_police_recruitment_by_id(
     recruitment_id: str,
-    current_police: Police = require_police_recruiter()
+    current_police: Police = require_police_recruiter(),
+    recruitment_service: RecruitmentService = Depends(get_recruitment_service)
 ):
     """
     Obtiene una solicitud de reclutamiento policial específica por ID
     Solo accesible para policías con rol 'recruiter'
     """
     try:
-        recruitment = recruitment_service.get_recruitment_by_id(recruitment_id, Profession.POLICE)
+        recruitment = await run_in_executor(recruitment_service.get_recruitment_by_id, recruitment_id, Profession.POLICE)
         
         if not recruitment:
             raise HTTPException(
@@ -6,11 +6,12 @@ from schemas.user import (
 )
 from schemas.enums import UserRole
 from services.user import UserService
+from services.executor import run_in_executor
+from services.container import get_user_service
 from auth.authorization import require_admin, require_doctor_or_admin, require_authentication, require_doctor, require_police
 import logging
 
 user_router = APIRouter(prefix="/user", tags=["user"])
-user_service = UserService()
 logger = logging.getLogger(__name__)
 
 
@@ -70,11 +71,12 @@ async def get_all_police(
 
 @user_router.post("/register/doctor", response_model=Doctor, status_code=status.HTTP_201_CREATED)
 async def register_doctor(
-    doctor: DoctorRegister
+    doctor: DoctorRegister,
+    user_service: UserService = Depends(get_user_service)
 ):
     """Registro público de doctor - cualquiera puede registrarse"""
     try:
-        created_doctor = user_service.register_doctor(doctor)
+        created_doctor = await run_in_executor(user_service.register_doctor, doctor)
         if not created_doctor:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -92,11 +94,12 @@ async def register_doctor(
 
 @user_router.post("/register/police", response_model=Police, status_code=status.HTTP_201_CREATED)
 async def register_police(
-    police: PoliceRegister
+    police: PoliceRegister,
+    user_service: UserService = Depends(get_user_service)
 ):
     """Registro público de policía - cualquiera puede registrarse"""
     try:
-        created_police = user_service.register_police(police)
+        created_police = await run_in_executor(user_service.register_police, police)
         if not created_police:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -117,11 +120,12 @@ async def register_police(
 @user_router.post("/doctor", response_model=Doctor, status_code=status.HTTP_201_CREATED)
 async def create_doctor(
     doctor: DoctorCreate,
-    current_user: User = require_admin()
+    current_user: User = require_admin(),
+    user_service: UserService = Depends(get_user_service)
 ):
     """Crea un nuevo doctor (solo admins) - método completo"""
     try:
-        created_doctor = user_service.create_doctor(doctor)
+        created_doctor = await run_in_executor(user_service.create_doctor, doctor)
         if not created_doctor:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -141,11 +145,12 @@ async def create_doctor(
 @user_router.post("/police", response_model=Police, status_code=status.HTTP_201_CREATED)
 async def create_police(
     police: PoliceCreate,
-    current_user: User = require_admin()
+    current_user: User = require_admin(),
+    user_service: UserService = Depends(get_user_service)
 ):
     """Crea un nuevo policía (solo admins)"""
     try:
-        created_police = user_service.create_police(police)
+        created_police = await run_in_executor(user_service.create_police, police)
         if not created_police:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Request, Response
 from typing import Optional, List
 from schemas import (
     VisitBase, Visit, VisitCreate, VisitStatus, VisitUpdate, VisitSummary, 
@@ -9,22 +9,45 @@ from schemas.patient import (
     BloodAnalysisCreate, BloodAnalysisResponse, RadiologyStudyCreate, RadiologyStudyResponse
 )
 from services.visits import VisitService
+from services.executor import run_in_executor
+from services.pagination import InvalidCursorError
+from services.streaming import streaming_json_response, wants_ndjson
+from services.container import get_visit_service
 from auth.firebase import FirebaseAuth
 
 visit_router = APIRouter(prefix="/visit", tags=["visit"])
-visit_service = VisitService()
 firebase_auth = FirebaseAuth() 
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _set_next_cursor(response: Response, next_cursor: Optional[str]):
+    """Expone el cursor de la página siguiente (ausente en la última página)"""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
 
 @visit_router.get("/{patient_dni}", response_model=List[VisitSummary])
 async def get_visits_by_patient(
     patient_dni: str, 
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Tamaño de página (sin él se devuelve todo el historial)"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
-    """Obtiene todas las visitas de un paciente como resumen"""
+    """Obtiene las visitas de un paciente como resumen, paginadas por cursor si se indica limit"""
     try:
-        visits = visit_service.get_all_visits_by_patient_dni(patient_dni)
+        if limit is None and cursor is None:
+            return await visit_service.get_all_visits_by_patient_dni_async(patient_dni)
+        
+        visits, next_cursor = await run_in_executor(
+            visit_service.get_visits_page_by_patient_dni, patient_dni, limit or 50, cursor
+        )
+        _set_next_cursor(response, next_cursor)
         return visits
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -35,11 +58,12 @@ async def get_visits_by_patient(
 @visit_router.get("/info/{visit_id}", response_model=VisitComplete)
 async def get_visit(
     visit_id: str, 
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Obtiene información completa de una visita por ID incluyendo análisis y estudios"""
     try:
-        visit = visit_service.get_visit_complete(visit_id)
+        visit = await run_in_executor(visit_service.get_visit_complete, visit_id)
         if not visit:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -58,11 +82,12 @@ async def get_visit(
 @visit_router.get("/complete/{visit_id}", response_model=VisitComplete)
 async def get_visit_complete(
     visit_id: str,
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Obtiene información completa de una visita con todos los datos médicos"""
     try:
-        visit = visit_service.get_visit_complete(visit_id)
+        visit = await run_in_executor(visit_service.get_visit_complete, visit_id)
         if not visit:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -81,11 +106,12 @@ async def get_visit_complete(
 @visit_router.post("/", response_model=Visit, status_code=status.HTTP_201_CREATED)
 async def create_visit(
     visit: VisitCreate, 
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Crea una nueva visita"""
     try:
-        created_visit = visit_service.create_visit(visit, current_user)
+        created_visit = await run_in_executor(visit_service.create_visit, visit, current_user)
         if not created_visit:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -105,11 +131,13 @@ async def create_visit(
 async def update_visit(
     visit_id: str, 
     visit_update: VisitUpdate, 
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Actualiza información básica de una visita"""
     try:
-        updated_visit = visit_service.update_visit(
+        updated_visit = await run_in_executor(
+            visit_service.update_visit,
             visit_id, visit_update, updated_by=current_user.dni
         )
         if not updated_visit:
@@ -130,11 +158,13 @@ async def update_visit(
 @visit_router.put("/{visit_id}/discharge", response_model=Visit)
 async def discharge_visit(
     visit_id: str, 
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Da de alta a un paciente"""
     try:
-        visit = visit_service.discharge_visit(
+        visit = await run_in_executor(
+            visit_service.discharge_visit,
             visit_id, discharged_by=current_user.dni
         )
         if not visit:
@@ -156,11 +186,13 @@ async def discharge_visit(
 async def add_vital_signs(
     visit_id: str,
     vital_signs: VitalSignsBase,
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Añade signos vitales a una visita"""
     try:
-        result = visit_service.add_vital_signs(
+        result = await run_in_executor(
+            visit_service.add_vital_signs,
             visit_id, vital_signs, measured_by=current_user.dni
         )
         if not result:
@@ -182,11 +214,13 @@ async def add_vital_signs(
 async def add_diagnosis(
     visit_id: str,
     diagnosis: DiagnosisCreate,
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Añade un diagnóstico a una visita"""
     try:
-        result = visit_service.add_diagnosis(
+        result = await run_in_executor(
+            visit_service.add_diagnosis,
             visit_id, diagnosis, diagnosed_by=current_user.dni
         )
         if not result:
@@ -208,11 +242,13 @@ async def add_diagnosis(
 async def add_prescription(
     visit_id: str,
     prescription: PrescriptionCreate,
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Añade una prescripción médica a una visita"""
     try:
-        result = visit_service.add_prescription(
+        result = await run_in_executor(
+            visit_service.add_prescription,
             visit_id, prescription, prescribed_by=current_user.dni
         )
         if not result:
@@ -233,7 +269,11 @@ async def add_prescription(
 @visit_router.get("/doctor/{doctor_dni}", response_model=List[Visit])
 async def get_visits_by_doctor(
     doctor_dni: str,
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Tamaño de página (sin él se devuelven todas)"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Obtiene todas las visitas de un médico específico"""
     try:
@@ -243,8 +283,16 @@ async def get_visits_by_doctor(
             # Aquí podrías añadir lógica adicional de permisos si es necesario
             pass
         
-        visits = visit_service.get_all_visits_by_doctor_dni(doctor_dni)
+        if limit is None and cursor is None:
+            return await run_in_executor(visit_service.get_all_visits_by_doctor_dni, doctor_dni)
+        
+        visits, next_cursor = await run_in_executor(
+            visit_service.get_visits_page_by_doctor_dni, doctor_dni, limit or 50, cursor
+        )
+        _set_next_cursor(response, next_cursor)
         return visits
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -255,12 +303,24 @@ async def get_visits_by_doctor(
 @visit_router.get("/status/{status}", response_model=List[Visit])
 async def get_visits_by_status(
     status: VisitStatus,
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Tamaño de página (sin él se devuelven todas)"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Obtiene todas las visitas por estado (ADMISSION, DISCHARGE, etc.)"""
     try:
-        visits = visit_service.get_all_visits_by_status(status)
+        if limit is None and cursor is None:
+            return await run_in_executor(visit_service.get_all_visits_by_status, status)
+        
+        visits, next_cursor = await run_in_executor(
+            visit_service.get_visits_page_by_status, status, limit or 50, cursor
+        )
+        _set_next_cursor(response, next_cursor)
         return visits
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -270,14 +330,25 @@ async def get_visits_by_status(
 
 @visit_router.get("/", response_model=List[Visit])
 async def get_all_visits(
+    request: Request,
+    response: Response,
     limit: Optional[int] = Query(50, ge=1, le=500, description="Número máximo de visitas a retornar"),
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    stream: bool = Query(False, description="Exporta todas las visitas en streaming (NDJSON con Accept: application/x-ndjson)"),
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
-    """Obtiene todas las visitas del sistema (limitado)"""
+    """Obtiene todas las visitas del sistema (paginado por cursor, o exportación completa en streaming)"""
+    if stream:
+        return streaming_json_response(visit_service.iter_all_visits(), ndjson=wants_ndjson(request))
+    
     try:
-        visits = visit_service.get_all_visits()
-        # Aplicar límite
-        return visits[:limit] if limit else visits
+        # El límite se aplica en la consulta, no sobre la colección completa
+        visits, next_cursor = await run_in_executor(visit_service.get_visits_page, limit or 50, cursor)
+        _set_next_cursor(response, next_cursor)
+        return visits
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -289,12 +360,14 @@ async def get_all_visits(
 async def add_blood_analysis_to_visit(
     visit_id: str,
     blood_analysis: BloodAnalysisCreate,
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Añade un análisis de sangre a una visita específica"""
     try:
         # Usar el método con sincronización automática para duplicar datos
-        result = visit_service.add_blood_analysis_with_patient_sync(
+        result = await run_in_executor(
+            visit_service.add_blood_analysis_with_patient_sync,
             visit_id, 
             blood_analysis, 
             performed_by_dni=current_user.dni,
@@ -319,12 +392,14 @@ async def add_blood_analysis_to_visit(
 async def add_radiology_study_to_visit(
     visit_id: str,
     radiology_study: RadiologyStudyCreate,
-    current_user: Doctor = Depends(firebase_auth.verify_token)
+    current_user: Doctor = Depends(firebase_auth.verify_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Añade un estudio radiológico a una visita específica"""
     try:
         # Usar el método con sincronización automática para duplicar datos
-        result = visit_service.add_radiology_study_with_patient_sync(
+        result = await run_in_executor(
+            visit_service.add_radiology_study_with_patient_sync,
             visit_id, 
             radiology_study, 
             performed_by_dni=current_user.dni,
@@ -348,19 +423,20 @@ async def add_radiology_study_to_visit(
 @visit_router.delete("/{visit_id}", status_code=status.HTTP_200_OK)
 async def delete_visit(
     visit_id: str, 
-    current_user: Doctor = Depends(firebase_auth.verify_admin_token)
+    current_user: Doctor = Depends(firebase_auth.verify_admin_token),
+    visit_service: VisitService = Depends(get_visit_service)
 ):
     """Elimina una visita del sistema"""
     try:
         # Verificar que la visita existe antes de intentar eliminarla
-        visit = visit_service.get_visit(visit_id)
+        visit = await run_in_executor(visit_service.get_visit, visit_id)
         if not visit:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Visit not found"
             )
         
-        success = visit_service.delete_visit(visit_id)
+        success = await run_in_executor(visit_service.delete_visit, visit_id)
         if not success:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
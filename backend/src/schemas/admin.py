@@ -32,3 +32,9 @@ class UserRoleInfo(BaseModel):
     user_role: UserRole = Field(..., description="Rol base del usuario")
     additional_roles: List[str] = Field(..., description="Roles adicionales del usuario")
     enabled: bool = Field(..., description="Si el usuario está habilitado")
+
+class TokenRevocationResponse(BaseModel):
+    """Respuesta de revocación de sesiones de un usuario"""
+    message: str = Field(..., description="Mensaje de confirmación")
+    user_dni: str = Field(..., description="DNI del usuario afectado")
+    user_name: str = Field(..., description="Nombre del usuario afectado")
@@ -103,6 +103,26 @@ class ExamResultSummary(BaseModel):
     exam_date: datetime = Field(..., description="Fecha del examen")
     examiner_name: str = Field(..., description="Nombre del examinador")
 
+class ExamBatchSubmission(BaseModel):
+    """Esquema para enviar los exámenes de una sesión grupal en una sola petición"""
+    submissions: List[ExamSubmission] = Field(..., min_length=1, max_length=500, description="Exámenes a corregir")
+
+class ExamBatchItemResult(BaseModel):
+    """Resultado de un examen dentro de un envío en lote"""
+    index: int = Field(..., description="Posición del examen en el envío")
+    exam_id: str = Field(..., description="ID del examen")
+    patient_dni: str = Field(..., description="DNI del paciente")
+    success: bool = Field(..., description="Si el resultado se corrigió y guardó")
+    result: Optional[ExamResultResponse] = Field(None, description="Resultado guardado")
+    error: Optional[str] = Field(None, description="Motivo del fallo")
+
+class ExamBatchResponse(BaseModel):
+    """Esquema de respuesta de un envío en lote"""
+    total: int = Field(..., description="Exámenes recibidos")
+    succeeded: int = Field(..., description="Exámenes guardados")
+    failed: int = Field(..., description="Exámenes con error")
+    results: List[ExamBatchItemResult] = Field(..., description="Resultado por examen, en el orden del envío")
+
 class ExamResultDetailResponse(ExamResultResponse):
     """Esquema detallado que incluye todas las respuestas"""
     answers: List[QuestionAnswerResult] = Field(..., description="Detalle de todas las respuestas")
@@ -139,5 +159,7 @@ class ExamStatisticsResponse(BaseModel):
     total_passed: int = Field(..., description="Total de exámenes aprobados")
     total_failed: int = Field(..., description="Total de exámenes reprobados")
     pass_rate_percentage: float = Field(..., description="Porcentaje de aprobación")
+    average_score_percentage: Optional[float] = Field(None, description="Puntuación media del periodo")
     exams_by_month: List[dict] = Field(..., description="Exámenes agrupados por mes")
+    exams_by_exam: List[dict] = Field(default_factory=list, description="Totales por examen (solo con EXAM_STATS_MODE=rollups)")
     most_recent_exams: List[ExamResultSummary] = Field(..., description="Exámenes más recientes")
\ No newline at end of file
@@ -0,0 +1,177 @@
+from services.firestore import FirestoreService
+from schemas import PatientAdmitted, Visit
+from firebase_admin import firestore
+from google.api_core.exceptions import NotFound
+from typing import Optional, List, Tuple
+from datetime import datetime
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Intentos de cada transacción sobre el tablero antes de darlo por desactualizado
+ADMITTED_BOARD_MAX_ATTEMPTS = max(1, int(os.getenv("ADMITTED_BOARD_MAX_ATTEMPTS", "10")))
+
+
+# Campos de una visita (VisitDB) que determinan su entrada en el tablero, estado incluido
+ADMITTED_BOARD_VISIT_FIELDS = (
+    "visit_status", "patient_dni", "reason", "attention_place", "attention_details",
+    "triage", "attending_doctor_dni", "attending_doctor_name", "created_at"
+)
+
+
+def board_fields_changed(original: dict, current: dict) -> bool:
+    """Si una edición de la visita (diccionarios de _visit_db_to_dict) afecta al tablero"""
+    return any(original.get(field) != current.get(field) for field in ADMITTED_BOARD_VISIT_FIELDS)
+
+
+def build_admitted_entry(patient_name: str, visit: Visit) -> PatientAdmitted:
+    """Construye la entrada del tablero de admitidos a partir de la visita y el nombre del paciente"""
+    return PatientAdmitted(
+        name=patient_name,
+        dni=visit.patient_dni,
+        visit_id=visit.visit_id,
+        reason=visit.reason,
+        attention_place=visit.attention_place,
+        attention_details=visit.attention_details,
+        triage=visit.triage,
+        doctor_dni=visit.doctor_dni,
+        doctor_name=visit.doctor_name,
+        admission_date=visit.created_at
+    )
+
+
+class AdmittedBoardRepository(FirestoreService):
+    """Proyección materializada de pacientes admitidos en un único documento (admitted_board/current).
+
+    Un documento de Firestore admite alrededor de una escritura sostenida por segundo. Solo lo
+    escriben los cambios que afectan al tablero (ingresos, altas, ediciones de triaje o médico,
+    renombrado o baja de pacientes), muy por debajo de ese ritmo en un hospital; los picos se
+    absorben reintentando la transacción (ADMITTED_BOARD_MAX_ATTEMPTS). Si aun así falla, el
+    tablero se marca como desactualizado y la siguiente lectura lo reconstruye desde las visitas.
+    """
+
+    def __init__(self, db=None):
+        super().__init__(db)
+        self.board_collection = "admitted_board"
+        self.board_document = "current"
+
+    @property
+    def _board_ref(self):
+        return self.db.collection(self.board_collection).document(self.board_document)
+
+    def get(self) -> Optional[Tuple[List[PatientAdmitted], str]]:
+        """Devuelve las entradas (más recientes primero) y su ETag, o None si el tablero no existe"""
+        try:
+            doc = self._board_ref.get()
+            if not doc.exists:
+                return None
+
+            data = doc.to_dict() or {}
+            if data.get("stale"):
+                return None
+            entries = []
+            for visit_id, entry in (data.get("entries") or {}).items():
+                try:
+                    entries.append(PatientAdmitted(**entry))
+                except Exception as e:
+                    logger.error(f"Invalid admitted board entry {visit_id}: {e}")
+            entries.sort(key=lambda entry: entry.admission_date, reverse=True)
+            return entries, f'"{data.get("version", 0)}"'
+        except Exception as e:
+            logger.error(f"Error reading admitted board: {e}")
+            return None
+
+    def upsert(self, entry: PatientAdmitted) -> bool:
+        """Añade o reemplaza la entrada de una visita"""
+        return self._apply(entry.visit_id, entry.model_dump(mode="json"))
+
+    def remove(self, visit_id: str) -> bool:
+        """Quita la entrada de una visita (alta o eliminación); no escribe si no estaba"""
+        return self._apply(visit_id, None)
+
+    def _apply(self, visit_id: str, entry: Optional[dict]) -> bool:
+        """Cambia una entrada en una transacción e incrementa la versión solo si hay cambio real.
+
+        Si el tablero aún no existe no se escribe nada: crearlo con merge dejaría fuera a los
+        pacientes ya admitidos. La primera lectura (PatientService.get_admitted_board) o el comando
+        rebuild-admitted-board lo reconstruyen desde las visitas, que ya incluyen esta escritura.
+        """
+        @firestore.transactional
+        def _update(transaction):
+            snapshot = self._board_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return
+            current = ((snapshot.to_dict() or {}).get("entries") or {}).get(visit_id)
+            if current == entry:
+                return
+            transaction.set(self._board_ref, {
+                "entries": {visit_id: entry if entry is not None else firestore.DELETE_FIELD},
+                "version": firestore.Increment(1),
+                "updated_at": datetime.now().isoformat()
+            }, merge=True)
+
+        return self._run(_update, f"visit {visit_id}")
+
+    def update_patient(self, patient_dni: str, name: Optional[str] = None, remove: bool = False) -> bool:
+        """Renombra o quita todas las entradas de un paciente (edición o baja del paciente)"""
+        @firestore.transactional
+        def _update(transaction):
+            snapshot = self._board_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return
+            changes = {}
+            for visit_id, entry in ((snapshot.to_dict() or {}).get("entries") or {}).items():
+                if entry.get("dni") != patient_dni:
+                    continue
+                if remove:
+                    changes[visit_id] = firestore.DELETE_FIELD
+                elif name and entry.get("name") != name:
+                    changes[visit_id] = {**entry, "name": name}
+            if changes:
+                transaction.set(self._board_ref, {
+                    "entries": changes,
+                    "version": firestore.Increment(1),
+                    "updated_at": datetime.now().isoformat()
+                }, merge=True)
+
+        return self._run(_update, f"patient {patient_dni}")
+
+    def _run(self, update, target: str) -> bool:
+        """Ejecuta una transacción del tablero; si se agotan los reintentos lo marca desactualizado"""
+        try:
+            update(self.db.transaction(max_attempts=ADMITTED_BOARD_MAX_ATTEMPTS))
+            return True
+        except Exception as e:
+            logger.error(f"Error updating admitted board for {target}: {e}")
+            self._mark_stale()
+            return False
+
+    def _mark_stale(self):
+        """Escritura sin transacción: get() devolverá None y la siguiente lectura reconstruirá el tablero.
+
+        Se conserva version para que el ETag del tablero reconstruido no repita uno anterior.
+        """
+        try:
+            self._board_ref.update({"stale": True, "updated_at": datetime.now().isoformat()})
+        except NotFound:
+            pass
+        except Exception as e:
+            logger.error(f"Error marking admitted board as stale: {e}")
+
+    def rebuild(self, entries: List[PatientAdmitted]) -> str:
+        """Reemplaza el tablero completo (arranque o reparación) y devuelve el nuevo ETag"""
+        @firestore.transactional
+        def _rebuild(transaction) -> int:
+            snapshot = self._board_ref.get(transaction=transaction)
+            version = ((snapshot.to_dict() or {}).get("version", 0) if snapshot.exists else 0) + 1
+            transaction.set(self._board_ref, {
+                "entries": {entry.visit_id: entry.model_dump(mode="json") for entry in entries},
+                "version": version,
+                "updated_at": datetime.now().isoformat()
+            })
+            return version
+
+        version = _rebuild(self.db.transaction())
+        logger.info(f"Admitted board rebuilt with {len(entries)} entries")
+        return f'"{version}"'
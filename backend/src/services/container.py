@@ -0,0 +1,116 @@
+from services.firestore import get_firestore_client, get_async_firestore_client
+from services.user import UserService, UserRepository
+from services.doctor import DoctorService
+from services.visits import VisitService, VisitRepository, AsyncVisitRepository
+from services.admitted_board import AdmittedBoardRepository
+from services.labs import LabRepository
+from services.search import PatientNameIndex, PATIENT_SEARCH_TRIE
+from services.patient_directory import PatientDirectory, PATIENT_DIRECTORY_ENABLED
+from services.patient import PatientService, PatientRepository, AsyncPatientRepository
+from services.exam import ExamService, ExamRepository
+from services.exam_results import ExamResultService, ExamResultRepository, AsyncExamResultRepository, PatientExamSummaryRepository
+from services.exam_stats import ExamStatsRepository
+from services.recruitment import RecruitmentService
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """Clientes de Firestore y una única instancia de cada servicio de la aplicación"""
+
+    def __init__(self, db=None, async_db=None):
+        # Un solo cliente (y canal gRPC) sync y otro async para todos los repositorios
+        self.db = db if db is not None else get_firestore_client()
+        self.async_db = async_db if async_db is not None else get_async_firestore_client()
+
+        self.user_service = UserService(UserRepository(self.db))
+        self.doctor_service = DoctorService(user_service=self.user_service, db=self.db)
+        self.lab_repository = LabRepository(self.db)
+        self.visit_service = VisitService(
+            repository=VisitRepository(self.db),
+            doctor_service=self.doctor_service,
+            admitted_board=AdmittedBoardRepository(self.db),
+            lab_repository=self.lab_repository,
+            async_repository=AsyncVisitRepository(self.async_db)
+        )
+        self.patient_service = PatientService(
+            repository=PatientRepository(self.db),
+            visit_service=self.visit_service,
+            lab_repository=self.lab_repository,
+            # El directorio ya incluye su propio índice de nombres
+            name_index=PatientNameIndex() if PATIENT_SEARCH_TRIE and not PATIENT_DIRECTORY_ENABLED else None,
+            directory=PatientDirectory() if PATIENT_DIRECTORY_ENABLED else None
+        )
+        self.visit_service.patient_service = self.patient_service
+        self.exam_service = ExamService(ExamRepository(self.db))
+        self.exam_result_service = ExamResultService(
+            repository=ExamResultRepository(self.db),
+            exam_repository=self.exam_service.repository,
+            exam_service=self.exam_service,
+            patient_service=self.patient_service,
+            async_repository=AsyncExamResultRepository(self.async_db),
+            async_patient_repository=AsyncPatientRepository(self.async_db),
+            summary_repository=PatientExamSummaryRepository(self.db),
+            stats_repository=ExamStatsRepository(self.db)
+        )
+        self.recruitment_service = RecruitmentService(self.db)
+
+
+_container: Optional[ServiceContainer] = None
+
+
+def init_services(db=None, async_db=None) -> ServiceContainer:
+    """Construye el contenedor de servicios (se llama desde el lifespan)"""
+    global _container
+    _container = ServiceContainer(db=db, async_db=async_db)
+    logger.info("Service container initialized")
+    return _container
+
+
+def get_services() -> ServiceContainer:
+    """Devuelve el contenedor, creándolo si aún no existe (scripts, tareas)"""
+    if _container is None:
+        return init_services()
+    return _container
+
+
+def shutdown_services():
+    """Libera el contenedor de servicios"""
+    global _container
+    if _container is not None and _container.patient_service.directory is not None:
+        _container.patient_service.directory.stop()
+    if _container is not None and _container.patient_service.name_index is not None:
+        _container.patient_service.name_index.stop_reloading()
+    _container = None
+
+
+# Dependencias de FastAPI (sustituibles con app.dependency_overrides en tests)
+
+async def get_user_service() -> UserService:
+    return get_services().user_service
+
+
+async def get_doctor_service() -> DoctorService:
+    return get_services().doctor_service
+
+
+async def get_visit_service() -> VisitService:
+    return get_services().visit_service
+
+
+async def get_patient_service() -> PatientService:
+    return get_services().patient_service
+
+
+async def get_exam_service() -> ExamService:
+    return get_services().exam_service
+
+
+async def get_exam_result_service() -> ExamResultService:
+    return get_services().exam_result_service
+
+
+async def get_recruitment_service() -> RecruitmentService:
+    return get_services().recruitment_service
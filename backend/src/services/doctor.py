@@ -1,21 +1,29 @@
 from services.firestore import FirestoreService
-from services.user import UserService
+from services.user import UserService, UserRepository
+from auth.principal_cache import principal_cache
+from services.cache import ExpiringLRUCache
 from schemas import Doctor, DoctorCreate
 from schemas.user import DoctorCreate as DoctorCreateNew, DoctorProfile
 from schemas.enums import UserRole
 from firebase_admin import auth
-from typing import Optional, List
+from typing import Optional, List, Dict, Iterable
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 class DoctorService(FirestoreService):
     """Servicio de doctor con compatibilidad hacia atrás"""
     
-    def __init__(self):
-        super().__init__()
+    def __init__(self, user_service: Optional[UserService] = None, db=None):
+        super().__init__(db)
         self.doctors_collection = "doctors"  # Mantener para compatibilidad
-        self.user_service = UserService()
+        self.user_service = user_service or UserService(UserRepository(self.db))
+        # Caché DNI -> nombre para visitas legacy sin el nombre desnormalizado
+        self._name_cache = ExpiringLRUCache(
+            max_size=int(os.getenv("DOCTOR_NAME_CACHE_SIZE", "1024")),
+            default_ttl=float(os.getenv("DOCTOR_NAME_CACHE_TTL", "600"))
+        )
 
     def get_doctor(self, doctor_uid: str) -> Optional[Doctor]:
         """Obtiene un doctor por Firebase UID (compatible hacia atrás)"""
@@ -35,15 +43,66 @@ class DoctorService(FirestoreService):
                 )
             
             # Fallback al sistema legacy si no se encuentra en el nuevo
-            doc = self.db.collection(self.doctors_collection).where("firebase_uid", "==", doctor_uid).get()
-            if doc:
-                return Doctor(**doc[0].to_dict())
-            return None
+            return self.get_legacy_doctor(doctor_uid)
             
         except Exception as e:
             logger.error(f"Error getting doctor {doctor_uid}: {e}")
             return None
 
+    def get_legacy_doctor(self, doctor_uid: str) -> Optional[Doctor]:
+        """Obtiene un doctor de la colección legacy por Firebase UID"""
+        cached = principal_cache.get("legacy_doctor", doctor_uid)
+        if cached:
+            return cached
+        
+        try:
+            doc = self.db.collection(self.doctors_collection).where("firebase_uid", "==", doctor_uid).limit(1).get()
+            if not doc:
+                return None
+            
+            doctor = Doctor(**doc[0].to_dict())
+            principal_cache.put("legacy_doctor", doctor_uid, doctor)
+            return doctor
+            
+        except Exception as e:
+            logger.error(f"Error getting legacy doctor {doctor_uid}: {e}")
+            return None
+
+    def get_names_by_dni(self, dnis: Iterable[str]) -> Dict[str, str]:
+        """Resuelve nombres de médicos por DNI en lote (users y colección legacy), con caché"""
+        names: Dict[str, str] = {}
+        pending = []
+        for dni in set(dnis):
+            cached = self._name_cache.get(dni)
+            if cached is None:
+                pending.append(dni)
+            elif cached:
+                names[dni] = cached
+        
+        if not pending:
+            return names
+        
+        try:
+            # Usuarios del nuevo sistema (documento por DNI) y, para el resto, doctores legacy
+            for collection in (self.user_service.repository.users_collection, self.doctors_collection):
+                if not pending:
+                    break
+                refs = [self.db.collection(collection).document(dni) for dni in pending]
+                for doc in self.db.get_all(refs, field_paths=["name"]):
+                    name = (doc.to_dict() or {}).get("name") if doc.exists else None
+                    if name:
+                        names[doc.id] = name
+                        self._name_cache.set(doc.id, name)
+                pending = [dni for dni in pending if dni not in names]
+            
+            # También se cachean los no encontrados para no repetir la consulta
+            for dni in pending:
+                self._name_cache.set(dni, "")
+        except Exception as e:
+            logger.error(f"Error resolving doctor names for {len(pending)} DNIs: {e}")
+        
+        return names
+
     def get_all_doctors(self) -> List[Doctor]:
         """Obtiene todos los doctores (compatible hacia atrás)"""
         try:
@@ -120,10 +179,15 @@ class DoctorService(FirestoreService):
     def update_doctor(self, doctor: Doctor):
         """Actualiza un doctor (compatible hacia atrás)"""
         self.db.collection(self.doctors_collection).document(doctor.dni).set(doctor.model_dump())
+        self._name_cache.invalidate(doctor.dni)
+        if doctor.firebase_uid:
+            principal_cache.invalidate_uid(doctor.firebase_uid)
 
     def delete_doctor(self, doctor_dni: str):
         """Elimina un doctor (compatible hacia atrás)"""
         self.db.collection(self.doctors_collection).document(doctor_dni).delete()
+        self._name_cache.invalidate(doctor_dni)
+        principal_cache.invalidate_dni(doctor_dni)
 
     def _format_password(self, dni: str) -> str:
         """Genera password por defecto basado en DNI"""
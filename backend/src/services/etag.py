@@ -0,0 +1,22 @@
+from fastapi import Request
+from typing import List
+import re
+
+# Una entity-tag de If-None-Match: opcionalmente débil (W/) y entre comillas (RFC 9110 8.8.3)
+_ENTITY_TAG = re.compile(r'\s*(?:W/)?("[^"]*")\s*(?:,|$)')
+
+
+def parse_if_none_match(header: str) -> List[str]:
+    """Tags opacos de una cabecera If-None-Match, sin el prefijo W/ ("*" se devuelve tal cual)"""
+    if header.strip() == "*":
+        return ["*"]
+    return [match.group(1) for match in _ENTITY_TAG.finditer(header)]
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match coincide con el ETag actual por comparación débil: se puede responder 304"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    current = etag[2:] if etag.startswith("W/") else etag
+    return any(tag == "*" or tag == current for tag in parse_if_none_match(header))
@@ -6,21 +6,48 @@ from schemas.exam import (
     QuestionResponse, CategoryResponse, ExamResponse, QuestionAnswerResult
 )
 from schemas.enums import ExamResultStatus
-from typing import Optional, List
+from services.cache import ExpiringLRUCache
+from typing import Optional, List, Dict, Tuple
 from datetime import datetime
+import hashlib
 import logging
+import json
+import os
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Claves de corrección compiladas por examen. Solo se invalidan en la instancia que edita el
+# examen: las demás pueden corregir con la clave anterior hasta EXAM_KEY_CACHE_TTL segundos
+# (bajar el TTL, o ponerlo a 0, si las ediciones deben verse al momento en todas)
+EXAM_KEY_CACHE_SIZE = int(os.getenv("EXAM_KEY_CACHE_SIZE", "256"))
+EXAM_KEY_CACHE_TTL = float(os.getenv("EXAM_KEY_CACHE_TTL", "300"))
 
-class ExamRepository(FirestoreService):
-    """Repositorio para operaciones de base de datos de exámenes"""
+# Hojas de preguntas públicas ya serializadas (cuerpo JSON + ETag) por examen
+EXAM_SHEET_CACHE_SIZE = int(os.getenv("EXAM_SHEET_CACHE_SIZE", "128"))
+EXAM_SHEET_CACHE_TTL = float(os.getenv("EXAM_SHEET_CACHE_TTL", "300"))
+
+
+class CompiledAnswerKey:
+    """Datos de un examen necesarios para corregir y detallar resultados, compilados una vez"""
     
-    def __init__(self):
-        super().__init__()
-        self.exams_collection = "exams"
+    __slots__ = ("exam_id", "name", "max_error_allowed", "enabled", "correct_options", "question_texts")
+    
+    def __init__(self, exam_db: ExamDB):
+        self.exam_id = exam_db.exam_id
+        self.name = exam_db.name
+        self.max_error_allowed = exam_db.max_error_allowed
+        self.enabled = exam_db.enabled
+        self.correct_options: Dict[str, str] = {}
+        self.question_texts: Dict[str, str] = {}
+        for question in exam_db.get_all_questions():
+            self.correct_options[question.question_id] = question.correct_option
+            self.question_texts[question.question_id] = question.question
+
+
+class ExamDocumentMixin:
+    """Conversión entre documentos de Firestore y ExamDB"""
     
     def _document_to_exam_db(self, doc) -> Optional[ExamDB]:
         """Convierte un documento de Firestore a ExamDB"""
@@ -42,6 +69,22 @@ class ExamRepository(FirestoreService):
             logger.error(f"Error converting document to ExamDB: {e}")
             return None
     
+    def _exam_db_to_dict(self, exam_db: ExamDB) -> dict:
+        """Convierte ExamDB a diccionario con timestamps como strings ISO"""
+        exam_dict = exam_db.model_dump()
+        for field in ['created_at', 'updated_at']:
+            if field in exam_dict and isinstance(exam_dict[field], datetime):
+                exam_dict[field] = exam_dict[field].isoformat()
+        return exam_dict
+
+
+class ExamRepository(ExamDocumentMixin, FirestoreService):
+    """Repositorio para operaciones de base de datos de exámenes"""
+    
+    def __init__(self, db=None):
+        super().__init__(db)
+        self.exams_collection = "exams"
+    
     def get_by_id(self, exam_id: str) -> Optional[ExamDB]:
         """Obtiene un examen por ID"""
         try:
@@ -51,14 +94,28 @@ class ExamRepository(FirestoreService):
             logger.error(f"Error getting exam by ID {exam_id}: {e}")
             return None
     
+    def get_many_by_id(self, exam_ids: List[str]) -> Dict[str, ExamDB]:
+        """Obtiene varios exámenes con una lectura en lote (db.get_all)"""
+        unique_ids = list(dict.fromkeys(exam_id for exam_id in exam_ids if exam_id))
+        exams = {}
+        if not unique_ids:
+            return exams
+        try:
+            collection = self.db.collection(self.exams_collection)
+            for doc in self.db.get_all([collection.document(exam_id) for exam_id in unique_ids]):
+                exam = self._document_to_exam_db(doc)
+                if exam:
+                    exams[exam.exam_id] = exam
+            return exams
+        except Exception as e:
+            logger.error(f"Error getting {len(unique_ids)} exams by ID: {e}")
+            return exams
+    
     def create(self, exam_db: ExamDB) -> bool:
         """Crea un nuevo examen"""
         try:
             # Convertir el modelo a diccionario con timestamps como strings ISO
-            exam_dict = exam_db.model_dump()
-            for field in ['created_at', 'updated_at']:
-                if field in exam_dict and isinstance(exam_dict[field], datetime):
-                    exam_dict[field] = exam_dict[field].isoformat()
+            exam_dict = self._exam_db_to_dict(exam_db)
             
             self.db.collection(self.exams_collection).document(exam_db.exam_id).set(exam_dict)
             logger.info(f"Exam {exam_db.exam_id} created successfully")
@@ -71,10 +128,7 @@ class ExamRepository(FirestoreService):
         """Actualiza un examen existente"""
         try:
             # Convertir a diccionario con manejo de timestamps
-            exam_dict = exam_db.model_dump()
-            for field in ['created_at', 'updated_at']:
-                if field in exam_dict and isinstance(exam_dict[field], datetime):
-                    exam_dict[field] = exam_dict[field].isoformat()
+            exam_dict = self._exam_db_to_dict(exam_db)
             
             self.db.collection(self.exams_collection).document(exam_db.exam_id).set(exam_dict)
             logger.info(f"Exam {exam_db.exam_id} updated successfully")
@@ -136,8 +190,49 @@ class ExamRepository(FirestoreService):
 class ExamService:
     """Servicio principal para gestión de exámenes"""
     
-    def __init__(self):
-        self.repository = ExamRepository()
+    def __init__(self, repository: Optional[ExamRepository] = None):
+        self.repository = repository or ExamRepository()
+        self._answer_keys = ExpiringLRUCache(max_size=EXAM_KEY_CACHE_SIZE, default_ttl=EXAM_KEY_CACHE_TTL)
+        self._question_sheets = ExpiringLRUCache(max_size=EXAM_SHEET_CACHE_SIZE, default_ttl=EXAM_SHEET_CACHE_TTL)
+    
+    def get_answer_key(self, exam_id: str) -> Optional[CompiledAnswerKey]:
+        """
+        Clave de corrección del examen (también de exámenes deshabilitados, para los detalles).
+        
+        No se compara con updated_at en cada uso: una edición hecha en otra instancia se ve
+        aquí cuando caduca la entrada (EXAM_KEY_CACHE_TTL).
+        """
+        answer_key = self._answer_keys.get(exam_id)
+        if answer_key is not None:
+            return answer_key
+        
+        exam_db = self.repository.get_by_id(exam_id)
+        if not exam_db:
+            return None
+        answer_key = CompiledAnswerKey(exam_db)
+        self._answer_keys.set(exam_id, answer_key)
+        return answer_key
+    
+    def get_answer_keys(self, exam_ids: List[str]) -> Dict[str, CompiledAnswerKey]:
+        """Claves de varios exámenes; las que no están en caché se leen en una sola lectura en lote"""
+        answer_keys = {}
+        missing = []
+        for exam_id in dict.fromkeys(exam_ids):
+            answer_key = self._answer_keys.get(exam_id)
+            if answer_key is not None:
+                answer_keys[exam_id] = answer_key
+            else:
+                missing.append(exam_id)
+        for exam_id, exam_db in self.repository.get_many_by_id(missing).items():
+            answer_key = CompiledAnswerKey(exam_db)
+            self._answer_keys.set(exam_id, answer_key)
+            answer_keys[exam_id] = answer_key
+        return answer_keys
+    
+    def invalidate_exam_cache(self, exam_id: str):
+        """Descarta la clave compilada y la hoja de preguntas tras modificar el examen"""
+        self._answer_keys.invalidate(exam_id)
+        self._question_sheets.invalidate(exam_id)
     
     def _exam_create_to_exam_db(self, exam_create: ExamCreate, created_by: Optional[str] = None) -> ExamDB:
         """Convierte ExamCreate a ExamDB"""
@@ -198,6 +293,7 @@ class ExamService:
         updated_exam.updated_by = updated_by
         
         if self.repository.update(updated_exam):
+            self.invalidate_exam_cache(exam_id)
             return updated_exam
         return None
     
@@ -212,7 +308,10 @@ class ExamService:
         exam_db.updated_at = datetime.now()
         exam_db.updated_by = deleted_by
         
-        return self.repository.update(exam_db)
+        if self.repository.update(exam_db):
+            self.invalidate_exam_cache(exam_id)
+            return True
+        return False
     
     def list_exams(self) -> List[ExamDB]:
         """Lista todos los exámenes habilitados"""
@@ -246,6 +345,7 @@ class ExamService:
         exam_db.updated_by = updated_by
         
         if self.repository.update(exam_db):
+            self.invalidate_exam_cache(exam_id)
             return exam_db
         return None
     
@@ -267,6 +367,7 @@ class ExamService:
         exam_db.updated_by = updated_by
         
         if self.repository.update(exam_db):
+            self.invalidate_exam_cache(exam_id)
             return exam_db
         return None
     
@@ -275,8 +376,27 @@ class ExamService:
         exam_db = self.repository.get_by_id(exam_id)
         if not exam_db or not exam_db.enabled:
             return None
+        return self._build_question_sheet(exam_db)
+    
+    def get_question_sheet(self, exam_id: str) -> Optional[Tuple[bytes, str]]:
+        """Hoja de preguntas serializada una vez por versión del examen: (cuerpo JSON, ETag).
+        
+        El cuerpo es idéntico byte a byte mientras el examen no cambie y el ETag es su hash.
+        """
+        sheet = self._question_sheets.get(exam_id)
+        if sheet is not None:
+            return sheet
         
-        # Convertir a formato de respuesta sin las respuestas correctas
+        questions = self.get_questions_by_exam(exam_id)
+        if questions is None:
+            return None
+        body = json.dumps(questions, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        sheet = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        self._question_sheets.set(exam_id, sheet)
+        return sheet
+    
+    def _build_question_sheet(self, exam_db: ExamDB) -> dict:
+        """Convierte el examen a formato de respuesta sin las respuestas correctas"""
         categories_response = []
         for category in exam_db.categories:
             questions_response = []
@@ -301,7 +421,3 @@ class ExamService:
             "max_error_allowed": exam_db.max_error_allowed,
             "categories": categories_response
         }
-
-
-# Instancia global del servicio
-exam_service = ExamService()
@@ -1,31 +1,62 @@
-from services.firestore import FirestoreService
-from services.exam import ExamRepository
-from services.patient import PatientService
+from services.firestore import FirestoreService, AsyncFirestoreService
+from services.exam import ExamRepository, ExamService, CompiledAnswerKey
+from services.patient import PatientService, AsyncPatientRepository
+from services.search import build_search_tokens, search_terms, matches_terms, most_selective_term
+from services.exam_stats import ExamStatsRepository, use_exam_stats_rollups, stats_period_start
 from models.exam import ExamResultDB, QuestionAnswerDB
 from schemas.exam import (
     ExamSubmission, ExamResultResponse, ExamResultDetailResponse, 
     PatientExamHistoryResponse, QuestionAnswerResult, PatientExamSummary,
-    PatientsWithExamsResponse, ExamStatisticsResponse, ExamResultSummary
+    PatientsWithExamsResponse, ExamStatisticsResponse, ExamResultSummary,
+    ExamBatchResponse, ExamBatchItemResult
 )
 from schemas.exam_certificate import ExamCertificateResponse
 from schemas.enums import ExamResultStatus
 from firebase_admin import firestore
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator, Any
 from datetime import datetime, timedelta
 from collections import defaultdict
+import asyncio
 import logging
+import time
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Límite de escrituras de un WriteBatch de Firestore
+MAX_BATCH_WRITES = 500
 
-class ExamResultRepository(FirestoreService):
-    """Repositorio para operaciones de base de datos de resultados de exámenes"""
-    
-    def __init__(self):
-        super().__init__()
-        self.results_collection = "exam_results"
+
+def _stats_since(days_back: Optional[int]) -> Optional[datetime]:
+    """Inicio del periodo de las estadísticas (None = desde siempre)"""
+    if not days_back:
+        return None
+    return datetime.now() - timedelta(days=days_back)
+
+
+def _month_ranges(start: datetime, end: datetime) -> List[tuple]:
+    """Tramos [inicio, fin) por mes natural entre start y end, como ("YYYY-MM", inicio, fin)"""
+    ranges = []
+    month_start = datetime(start.year, start.month, 1)
+    while month_start <= end:
+        next_month = datetime(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+        ranges.append((month_start.strftime("%Y-%m"), max(month_start, start), next_month))
+        month_start = next_month
+    return ranges
+
+
+def _aggregate(aggregation_query) -> Dict[str, Any]:
+    """Ejecuta una consulta de agregación y devuelve {alias: valor}"""
+    values = {}
+    for row in aggregation_query.get():
+        for result in row:
+            values[result.alias] = result.value
+    return values
+
+
+class ExamResultDocumentMixin:
+    """Conversión entre documentos de Firestore y ExamResultDB, compartida por los repositorios sync y async"""
     
     def _document_to_result_db(self, doc) -> Optional[ExamResultDB]:
         """Convierte un documento de Firestore a ExamResultDB"""
@@ -47,22 +78,72 @@ class ExamResultRepository(FirestoreService):
             logger.error(f"Error converting document to ExamResultDB: {e}")
             return None
     
-    def create(self, result_db: ExamResultDB) -> bool:
-        """Crea un nuevo resultado de examen"""
+    def _result_db_to_dict(self, result_db: ExamResultDB) -> dict:
+        """Convierte ExamResultDB a diccionario con timestamps como strings ISO"""
+        result_dict = result_db.model_dump()
+        for field in ['exam_date', 'created_at', 'updated_at']:
+            if field in result_dict and isinstance(result_dict[field], datetime):
+                result_dict[field] = result_dict[field].isoformat()
+        return result_dict
+
+
+class ExamResultRepository(ExamResultDocumentMixin, FirestoreService):
+    """Repositorio para operaciones de base de datos de resultados de exámenes"""
+    
+    def __init__(self, db=None):
+        super().__init__(db)
+        self.results_collection = "exam_results"
+    
+    def create(self, result_db: ExamResultDB, summaries: Optional["PatientExamSummaryRepository"] = None, stats: Optional[ExamStatsRepository] = None) -> bool:
+        """Crea un nuevo resultado de examen (y actualiza resumen del paciente y contadores diarios en el mismo batch)"""
         try:
             # Convertir a diccionario con timestamps como strings
-            result_dict = result_db.model_dump()
-            for field in ['exam_date', 'created_at', 'updated_at']:
-                if field in result_dict and isinstance(result_dict[field], datetime):
-                    result_dict[field] = result_dict[field].isoformat()
-            
-            self.db.collection(self.results_collection).document(result_db.result_id).set(result_dict)
+            result_dict = self._result_db_to_dict(result_db)
+            
+            result_ref = self.db.collection(self.results_collection).document(result_db.result_id)
+            if summaries is not None or stats is not None:
+                batch = self.db.batch()
+                batch.set(result_ref, result_dict)
+                if summaries is not None:
+                    summaries.record_result(result_db, batch)
+                if stats is not None:
+                    stats.record_result(result_db, batch)
+                batch.commit()
+            else:
+                result_ref.set(result_dict)
             logger.info(f"Exam result {result_db.result_id} created successfully")
             return True
         except Exception as e:
             logger.error(f"Error creating exam result {result_db.result_id}: {e}")
             return False
     
+    def create_many(self, results: List[ExamResultDB], summaries: Optional["PatientExamSummaryRepository"] = None, stats: Optional[ExamStatsRepository] = None) -> List[bool]:
+        """Guarda varios resultados en batches de hasta MAX_BATCH_WRITES escrituras.
+        
+        Cada resultado ocupa una escritura más la de su resumen y la de los contadores diarios.
+        Devuelve, en el mismo orden, si cada resultado se guardó (un batch fallido falla entero).
+        """
+        writes_per_result = 1 + (summaries is not None) + (stats is not None)
+        chunk_size = max(1, MAX_BATCH_WRITES // writes_per_result)
+        collection = self.db.collection(self.results_collection)
+        saved = []
+        for start in range(0, len(results), chunk_size):
+            chunk = results[start:start + chunk_size]
+            try:
+                batch = self.db.batch()
+                for result_db in chunk:
+                    batch.set(collection.document(result_db.result_id), self._result_db_to_dict(result_db))
+                    if summaries is not None:
+                        summaries.record_result(result_db, batch)
+                    if stats is not None:
+                        stats.record_result(result_db, batch)
+                batch.commit()
+                saved.extend([True] * len(chunk))
+            except Exception as e:
+                logger.error(f"Error creating batch of {len(chunk)} exam results: {e}")
+                saved.extend([False] * len(chunk))
+        return saved
+    
     def get_by_id(self, result_id: str) -> Optional[ExamResultDB]:
         """Obtiene un resultado por ID"""
         try:
@@ -125,20 +206,6 @@ class ExamResultRepository(FirestoreService):
             logger.error(f"Error getting latest result for exam {exam_id} and patient {patient_dni}: {e}")
             return None
     
-    def get_patients_with_exams(self) -> List[str]:
-        """Obtiene lista de DNIs únicos de pacientes que han realizado exámenes"""
-        try:
-            docs = self.db.collection(self.results_collection).get()
-            patient_dnis = set()
-            for doc in docs:
-                data = doc.to_dict()
-                if 'patient_dni' in data:
-                    patient_dnis.add(data['patient_dni'])
-            return list(patient_dnis)
-        except Exception as e:
-            logger.error(f"Error getting patients with exams: {e}")
-            return []
-    
     def get_all_results(self, limit: Optional[int] = None) -> List[ExamResultDB]:
         """Obtiene todos los resultados"""
         try:
@@ -158,22 +225,277 @@ class ExamResultRepository(FirestoreService):
         except Exception as e:
             logger.error(f"Error getting all exam results: {e}")
             return []
+    
+    def stream_all_results(self, limit: Optional[int] = None) -> Iterator[ExamResultDB]:
+        """Recorre los resultados con .stream(), sin materializar la colección completa"""
+        query = self.db.collection(self.results_collection)\
+            .order_by("exam_date", direction="DESCENDING")
+        
+        if limit:
+            query = query.limit(limit)
+        
+        for doc in query.stream():
+            result = self._document_to_result_db(doc)
+            if result:
+                yield result
+    
+    def get_exam_statistics(self, days_back: Optional[int] = 30) -> Dict[str, Any]:
+        """Totales y desglose mensual con consultas de agregación (sin descargar resultados).
+        
+        Coste: dos agregaciones para los totales y un count() por mes del periodo. El recuento de
+        aprobados necesita el índice compuesto is_approved ASC + exam_date ASC.
+        """
+        collection = self.db.collection(self.results_collection)
+        now = datetime.now()
+        since = _stats_since(days_back)
+        
+        query = collection.where("exam_date", ">=", since.isoformat()) if since else collection
+        totals = _aggregate(
+            query.count(alias="total").avg("score_percentage", alias="average_score")
+        )
+        passed = _aggregate(query.where("is_approved", "==", True).count(alias="passed"))
+        total_exams = int(totals.get("total") or 0)
+        passed_exams = int(passed.get("passed") or 0)
+        
+        if since is None and total_exams:
+            # Sin límite de días, los meses empiezan en el resultado más antiguo
+            oldest = list(collection.order_by("exam_date").select(["exam_date"]).limit(1).stream())
+            oldest_date = (oldest[0].to_dict() or {}).get("exam_date") if oldest else None
+            since = datetime.fromisoformat(oldest_date.replace('Z', '+00:00')).replace(tzinfo=None) if oldest_date else now
+        
+        exams_by_month = {}
+        if total_exams:
+            for month, start, end in _month_ranges(since, now):
+                month_counts = _aggregate(
+                    collection.where("exam_date", ">=", start.isoformat())
+                    .where("exam_date", "<", end.isoformat())
+                    .count(alias="count")
+                )
+                exams_by_month[month] = int(month_counts.get("count") or 0)
+        
+        average_score = totals.get("average_score")
+        return {
+            "total_exams": total_exams,
+            "passed_exams": passed_exams,
+            "failed_exams": total_exams - passed_exams,
+            "average_score": round(average_score, 2) if average_score is not None else None,
+            "exams_by_month": exams_by_month
+        }
+
+
+def _summary_search_text(patient_name: str, patient_dni: str) -> str:
+    """Texto indexado en los resúmenes: se busca por palabras del nombre o por el DNI"""
+    return f"{patient_name} {patient_dni}"
+
+
+class PatientExamSummaryRepository(FirestoreService):
+    """Resumen precalculado de exámenes por paciente (patient_exam_summaries/{dni}).
+    
+    Se actualiza en el mismo batch que cada resultado nuevo; listados y búsquedas son una sola
+    consulta. La búsqueda necesita el índice de array search_tokens (automático en Firestore).
+    """
+    
+    def __init__(self, db=None):
+        super().__init__(db)
+        self.summaries_collection = "patient_exam_summaries"
+    
+    def _document_to_summary(self, doc) -> Optional[PatientExamSummary]:
+        """Convierte un documento de resumen a PatientExamSummary"""
+        try:
+            data = doc.to_dict() or {}
+            last_exam_date = data.get("last_exam_date")
+            if isinstance(last_exam_date, str):
+                try:
+                    last_exam_date = datetime.fromisoformat(last_exam_date.replace('Z', '+00:00'))
+                except ValueError:
+                    last_exam_date = None
+            return PatientExamSummary(
+                patient_dni=data.get("patient_dni") or doc.id,
+                patient_name=data.get("patient_name") or doc.id,
+                total_exams=data.get("total_exams", 0),
+                passed_exams=data.get("passed_exams", 0),
+                failed_exams=data.get("failed_exams", 0),
+                last_exam_date=last_exam_date,
+                last_exam_result=data.get("last_exam_result"),
+                has_valid_license=bool(data.get("has_valid_license", False))
+            )
+        except Exception as e:
+            logger.error(f"Error converting exam summary {doc.id}: {e}")
+            return None
+    
+    def summary_fields(self, patient_dni: str, patient_name: str) -> dict:
+        """Campos de identificación y búsqueda del resumen"""
+        return {
+            "patient_dni": patient_dni,
+            "patient_name": patient_name,
+            "search_tokens": build_search_tokens(_summary_search_text(patient_name, patient_dni)),
+            "updated_at": datetime.now().isoformat()
+        }
+    
+    def record_result(self, result_db: ExamResultDB, batch):
+        """Suma un resultado nuevo al resumen del paciente (contadores con Increment, sin leer)"""
+        ref = self.db.collection(self.summaries_collection).document(result_db.patient_dni)
+        batch.set(ref, {
+            **self.summary_fields(result_db.patient_dni, result_db.patient_name),
+            "total_exams": firestore.Increment(1),
+            "passed_exams": firestore.Increment(1 if result_db.is_approved else 0),
+            "failed_exams": firestore.Increment(0 if result_db.is_approved else 1),
+            "last_exam_date": result_db.exam_date.isoformat(),
+            "last_exam_result": result_db.is_approved,
+            "last_result_id": result_db.result_id,
+            # Licencia vigente si el último examen está aprobado
+            "has_valid_license": result_db.is_approved
+        }, merge=True)
+    
+    def list_all(self) -> List[PatientExamSummary]:
+        """Todos los resúmenes, último examen más reciente primero"""
+        try:
+            docs = self.db.collection(self.summaries_collection)\
+                .order_by("last_exam_date", direction=firestore.Query.DESCENDING)\
+                .stream()
+            return [summary for summary in map(self._document_to_summary, docs) if summary]
+        except Exception as e:
+            logger.error(f"Error listing patient exam summaries: {e}")
+            return []
+    
+    def count_examined_since(self, since: Optional[datetime]) -> int:
+        """Pacientes con algún examen desde since: los que tienen el último examen en el periodo"""
+        query = self.db.collection(self.summaries_collection)
+        if since is not None:
+            query = query.where("last_exam_date", ">=", since.isoformat())
+        return int(_aggregate(query.count(alias="patients")).get("patients") or 0)
+    
+    def search(self, search_term: str) -> List[PatientExamSummary]:
+        """Resúmenes cuyo nombre o DNI empiezan por los términos buscados"""
+        try:
+            terms = search_terms(search_term)
+            if not terms:
+                return []
+            docs = self.db.collection(self.summaries_collection)\
+                .where("search_tokens", "array_contains", most_selective_term(terms))\
+                .stream()
+            summaries = [
+                summary for summary in map(self._document_to_summary, docs)
+                if summary and matches_terms(_summary_search_text(summary.patient_name, summary.patient_dni), terms)
+            ]
+            summaries.sort(key=lambda x: x.last_exam_date or datetime.min, reverse=True)
+            return summaries
+        except Exception as e:
+            logger.error(f"Error searching patient exam summaries for {search_term}: {e}")
+            return []
+
+
+class AsyncExamResultRepository(ExamResultDocumentMixin, AsyncFirestoreService):
+    """Repositorio asíncrono (AsyncClient) para operaciones de base de datos de resultados de exámenes"""
+    
+    def __init__(self, db=None):
+        super().__init__(db)
+        self.results_collection = "exam_results"
+    
+    async def _get_results(self, query) -> List[ExamResultDB]:
+        """Ejecuta una consulta y convierte los documentos a ExamResultDB"""
+        docs = await query.get()
+        results = []
+        for doc in docs:
+            result = self._document_to_result_db(doc)
+            if result:
+                results.append(result)
+        return results
+    
+    async def get_by_id(self, result_id: str) -> Optional[ExamResultDB]:
+        """Obtiene un resultado por ID"""
+        try:
+            doc = await self.db.collection(self.results_collection).document(result_id).get()
+            return self._document_to_result_db(doc)
+        except Exception as e:
+            logger.error(f"Error getting exam result by ID {result_id}: {e}")
+            return None
+    
+    async def get_by_patient_dni(self, patient_dni: str) -> List[ExamResultDB]:
+        """Obtiene todos los resultados de un paciente por DNI"""
+        try:
+            return await self._get_results(
+                self.db.collection(self.results_collection)
+                .where("patient_dni", "==", patient_dni)
+                .order_by("exam_date", direction="DESCENDING")
+            )
+        except Exception as e:
+            logger.error(f"Error getting exam results for patient {patient_dni}: {e}")
+            return []
+    
+    async def get_by_exam_id(self, exam_id: str) -> List[ExamResultDB]:
+        """Obtiene todos los resultados de un examen específico"""
+        try:
+            return await self._get_results(
+                self.db.collection(self.results_collection)
+                .where("exam_id", "==", exam_id)
+                .order_by("exam_date", direction="DESCENDING")
+            )
+        except Exception as e:
+            logger.error(f"Error getting results for exam {exam_id}: {e}")
+            return []
+    
+    async def get_latest_by_exam_and_patient(self, exam_id: str, patient_dni: str) -> Optional[ExamResultDB]:
+        """Obtiene el resultado más reciente de un examen específico para un paciente"""
+        try:
+            results = await self._get_results(
+                self.db.collection(self.results_collection)
+                .where("exam_id", "==", exam_id)
+                .where("patient_dni", "==", patient_dni)
+                .order_by("exam_date", direction="DESCENDING")
+                .limit(1)
+            )
+            return results[0] if results else None
+        except Exception as e:
+            logger.error(f"Error getting latest result for exam {exam_id} and patient {patient_dni}: {e}")
+            return None
+    
+    async def get_all_results(self, limit: Optional[int] = None) -> List[ExamResultDB]:
+        """Obtiene todos los resultados"""
+        try:
+            query = self.db.collection(self.results_collection)\
+                .order_by("exam_date", direction="DESCENDING")
+            
+            if limit:
+                query = query.limit(limit)
+            
+            return await self._get_results(query)
+        except Exception as e:
+            logger.error(f"Error getting all exam results: {e}")
+            return []
 
 
 class ExamResultService:
     """Servicio para gestión de resultados de exámenes"""
     
-    def __init__(self):
-        self.repository = ExamResultRepository()
-        self.exam_repository = ExamRepository()
-        self.patient_service = PatientService()
+    def __init__(
+        self,
+        repository: Optional[ExamResultRepository] = None,
+        exam_repository: Optional[ExamRepository] = None,
+        patient_service: Optional[PatientService] = None,
+        async_repository: Optional[AsyncExamResultRepository] = None,
+        async_patient_repository: Optional[AsyncPatientRepository] = None,
+        summary_repository: Optional[PatientExamSummaryRepository] = None,
+        stats_repository: Optional[ExamStatsRepository] = None,
+        exam_service: Optional[ExamService] = None
+    ):
+        self.repository = repository or ExamResultRepository()
+        self.summaries = summary_repository or PatientExamSummaryRepository(self.repository.db)
+        self.stats = stats_repository or ExamStatsRepository(self.repository.db)
+        self.exam_repository = exam_repository or ExamRepository(self.repository.db)
+        # Claves de corrección compiladas y cacheadas (invalidadas por ExamService al editar)
+        self.exam_service = exam_service or ExamService(self.exam_repository)
+        self.patient_service = patient_service or PatientService()
+        # Repositorios asíncronos para los endpoints async
+        self.async_repository = async_repository or AsyncExamResultRepository()
+        self.async_patient_repository = async_patient_repository or AsyncPatientRepository(self.async_repository.db)
     
     def submit_exam_result(self, submission: ExamSubmission, examiner_dni: str, examiner_name: str, examiner_role: str) -> Optional[ExamResultResponse]:
         """Procesa y guarda el resultado de un examen"""
         try:
-            # Obtener el examen para validar respuestas
-            exam_db = self.exam_repository.get_by_id(submission.exam_id)
-            if not exam_db or not exam_db.enabled:
+            # Clave de corrección del examen (en caché tras la primera lectura)
+            answer_key = self.exam_service.get_answer_key(submission.exam_id)
+            if not answer_key or not answer_key.enabled:
                 logger.error(f"Exam {submission.exam_id} not found or disabled")
                 return None
             
@@ -183,53 +505,11 @@ class ExamResultService:
                 logger.error(f"Patient {submission.patient_dni} not found")
                 return None
             
-            # Obtener todas las preguntas del examen
-            all_questions = exam_db.get_all_questions()
-            question_dict = {q.question_id: q for q in all_questions}
-            
-            # Validar y procesar respuestas
-            processed_answers = []
-            for answer in submission.answers:
-                if answer.question_id not in question_dict:
-                    logger.error(f"Question {answer.question_id} not found in exam {submission.exam_id}")
-                    continue
-                
-                question = question_dict[answer.question_id]
-                is_correct = answer.selected_option == question.correct_option
-                
-                processed_answer = QuestionAnswerDB(
-                    question_id=answer.question_id,
-                    selected_option=answer.selected_option,
-                    correct_option=question.correct_option,
-                    is_correct=is_correct
-                )
-                processed_answers.append(processed_answer)
-            
-            # Crear el resultado
-            result_db = ExamResultDB(
-                exam_id=submission.exam_id,
-                exam_name=exam_db.name,
-                patient_dni=submission.patient_dni,
-                patient_name=patient.name,
-                answers=processed_answers,
-                total_questions=len(processed_answers),
-                correct_answers=0,  # Se calculará
-                incorrect_answers=0,  # Se calculará
-                score_percentage=0,  # Se calculará
-                status=ExamResultStatus.PENDING,  # Se calculará
-                is_approved=False,  # Se calculará
-                examiner_dni=examiner_dni,
-                examiner_name=examiner_name,
-                examiner_role=examiner_role,
-                notes=submission.notes,
-                observations=submission.observations
-            )
+            # Corregir las respuestas y calcular el resultado
+            result_db = self._grade_submission(submission, answer_key, patient.name, examiner_dni, examiner_name, examiner_role)
             
-            # Calcular resultados
-            result_db.calculate_results(exam_db.max_error_allowed)
-            
-            # Guardar en la base de datos
-            if self.repository.create(result_db):
+            # Guardar en la base de datos junto con el resumen del paciente
+            if self.repository.create(result_db, self.summaries, self.stats):
                 return self._result_db_to_response(result_db)
             
             return None
@@ -238,6 +518,98 @@ class ExamResultService:
             logger.error(f"Error submitting exam result: {e}")
             return None
     
+    def _grade_submission(self, submission: ExamSubmission, answer_key: CompiledAnswerKey, patient_name: str, examiner_dni: str, examiner_name: str, examiner_role: str) -> ExamResultDB:
+        """Corrige un envío contra la clave compilada del examen (sin lecturas de Firestore)"""
+        # Validar y procesar respuestas
+        processed_answers = []
+        for answer in submission.answers:
+            correct_option = answer_key.correct_options.get(answer.question_id)
+            if correct_option is None:
+                logger.error(f"Question {answer.question_id} not found in exam {submission.exam_id}")
+                continue
+        
+            processed_answer = QuestionAnswerDB(
+                question_id=answer.question_id,
+                selected_option=answer.selected_option,
+                correct_option=correct_option,
+                is_correct=answer.selected_option == correct_option
+            )
+            processed_answers.append(processed_answer)
+        
+        # Crear el resultado
+        result_db = ExamResultDB(
+            exam_id=submission.exam_id,
+            exam_name=answer_key.name,
+            patient_dni=submission.patient_dni,
+            patient_name=patient_name,
+            answers=processed_answers,
+            total_questions=len(processed_answers),
+            correct_answers=0,  # Se calculará
+            incorrect_answers=0,  # Se calculará
+            score_percentage=0,  # Se calculará
+            status=ExamResultStatus.PENDING,  # Se calculará
+            is_approved=False,  # Se calculará
+            examiner_dni=examiner_dni,
+            examiner_name=examiner_name,
+            examiner_role=examiner_role,
+            notes=submission.notes,
+            observations=submission.observations
+        )
+        
+        # Calcular resultados
+        result_db.calculate_results(answer_key.max_error_allowed)
+        return result_db
+    
+    def submit_exam_results_batch(self, submissions: List[ExamSubmission], examiner_dni: str, examiner_name: str, examiner_role: str) -> ExamBatchResponse:
+        """Corrige y guarda los exámenes de una sesión grupal.
+        
+        Exámenes y pacientes distintos se leen una sola vez con lecturas en lote, la corrección es en
+        memoria y los resultados se guardan en WriteBatches; devuelve el resultado de cada envío.
+        """
+        started = time.perf_counter()
+        answer_keys = self.exam_service.get_answer_keys([submission.exam_id for submission in submissions])
+        patient_names = self.patient_service.get_patient_names([submission.patient_dni for submission in submissions])
+        
+        items: List[Optional[ExamBatchItemResult]] = [None] * len(submissions)
+        graded = []
+        for index, submission in enumerate(submissions):
+            error = None
+            answer_key = answer_keys.get(submission.exam_id)
+            patient_name = patient_names.get(submission.patient_dni)
+            if not answer_key or not answer_key.enabled:
+                error = "Exam not found or disabled"
+            elif patient_name is None:
+                error = "Patient not found"
+            else:
+                try:
+                    graded.append((index, self._grade_submission(submission, answer_key, patient_name, examiner_dni, examiner_name, examiner_role)))
+                except Exception as e:
+                    logger.error(f"Error grading batch submission {index}: {e}")
+                    error = "Failed to grade exam"
+            if error:
+                items[index] = ExamBatchItemResult(
+                    index=index, exam_id=submission.exam_id, patient_dni=submission.patient_dni,
+                    success=False, error=error
+                )
+        
+        saved = self.repository.create_many([result_db for _, result_db in graded], self.summaries, self.stats)
+        for (index, result_db), ok in zip(graded, saved):
+            items[index] = ExamBatchItemResult(
+                index=index, exam_id=result_db.exam_id, patient_dni=result_db.patient_dni,
+                success=ok,
+                result=self._result_db_to_response(result_db) if ok else None,
+                error=None if ok else "Failed to store exam result"
+            )
+        
+        succeeded = sum(1 for item in items if item.success)
+        logger.info(f"Exam batch: {succeeded}/{len(submissions)} results stored in {time.perf_counter() - started:.3f}s")
+        return ExamBatchResponse(
+            total=len(submissions),
+            succeeded=succeeded,
+            failed=len(submissions) - succeeded,
+            results=items
+        )
+    
     def get_patient_exam_history(self, patient_dni: str) -> Optional[PatientExamHistoryResponse]:
         """Obtiene el historial de exámenes de un paciente"""
         try:
@@ -248,28 +620,48 @@ class ExamResultService:
                 return None
             
             results_db = self.repository.get_by_patient_dni(patient_dni)
+            return self._build_patient_exam_history(patient_dni, patient.name, results_db)
             
-            # Convertir a respuestas
-            exam_results = [self._result_db_to_response(result) for result in results_db]
-            
-            # Calcular estadísticas
-            total_exams = len(results_db)
-            passed_exams = sum(1 for result in results_db if result.is_approved)
-            failed_exams = total_exams - passed_exams
-            
-            return PatientExamHistoryResponse(
-                patient_dni=patient_dni,
-                patient_name=patient.name,
-                exam_results=exam_results,
-                total_exams=total_exams,
-                passed_exams=passed_exams,
-                failed_exams=failed_exams
+        except Exception as e:
+            logger.error(f"Error getting patient exam history for {patient_dni}: {e}")
+            return None
+    
+    async def get_patient_exam_history_async(self, patient_dni: str) -> Optional[PatientExamHistoryResponse]:
+        """Obtiene el historial de exámenes cargando paciente y resultados en paralelo"""
+        try:
+            patient_db, results_db = await asyncio.gather(
+                self.async_patient_repository.get_by_dni(patient_dni),
+                self.async_repository.get_by_patient_dni(patient_dni)
             )
+            if not patient_db or not patient_db.enabled:
+                logger.error(f"Patient {patient_dni} not found")
+                return None
+            
+            return self._build_patient_exam_history(patient_dni, patient_db.name, results_db)
             
         except Exception as e:
             logger.error(f"Error getting patient exam history for {patient_dni}: {e}")
             return None
     
+    def _build_patient_exam_history(self, patient_dni: str, patient_name: str, results_db: List[ExamResultDB]) -> PatientExamHistoryResponse:
+        """Construye la respuesta del historial con sus estadísticas"""
+        # Convertir a respuestas
+        exam_results = [self._result_db_to_response(result) for result in results_db]
+        
+        # Calcular estadísticas
+        total_exams = len(results_db)
+        passed_exams = sum(1 for result in results_db if result.is_approved)
+        failed_exams = total_exams - passed_exams
+        
+        return PatientExamHistoryResponse(
+            patient_dni=patient_dni,
+            patient_name=patient_name,
+            exam_results=exam_results,
+            total_exams=total_exams,
+            passed_exams=passed_exams,
+            failed_exams=failed_exams
+        )
+    
     def get_exam_result_detail(self, result_id: str) -> Optional[ExamResultDetailResponse]:
         """Obtiene el detalle completo de un resultado incluyendo todas las respuestas"""
         try:
@@ -277,23 +669,19 @@ class ExamResultService:
             if not result_db:
                 return None
             
-            # Obtener el examen para tener los textos de las preguntas
-            exam_db = self.exam_repository.get_by_id(result_db.exam_id)
-            if not exam_db:
+            # Textos de las preguntas desde la clave compilada del examen
+            answer_key = self.exam_service.get_answer_key(result_db.exam_id)
+            if not answer_key:
                 return None
             
-            # Crear diccionario de preguntas
-            all_questions = exam_db.get_all_questions()
-            question_dict = {q.question_id: q for q in all_questions}
-            
             # Convertir respuestas a formato detallado
             detailed_answers = []
             for answer in result_db.answers:
-                if answer.question_id in question_dict:
-                    question = question_dict[answer.question_id]
+                question_text = answer_key.question_texts.get(answer.question_id)
+                if question_text is not None:
                     detailed_answer = QuestionAnswerResult(
                         question_id=answer.question_id,
-                        question=question.question,
+                        question=question_text,
                         selected_option=answer.selected_option,
                         correct_option=answer.correct_option,
                         is_correct=answer.is_correct
@@ -329,23 +717,33 @@ class ExamResultService:
         try:
             # Obtener el último resultado del examen para el paciente
             result_db = self.repository.get_latest_by_exam_and_patient(exam_id, patient_dni)
-            if not result_db:
-                return None
-                
-            # Crear el certificado
-            return ExamCertificateResponse(
-                citizen_dni=result_db.patient_dni,
-                citizen_name=result_db.patient_name,
-                exam_pass=result_db.is_approved,
-                exam_date=result_db.exam_date,
-                doctor_dni=result_db.examiner_dni,
-                doctor_name=result_db.examiner_name
-            )
+            return self._result_db_to_certificate(result_db) if result_db else None
             
         except Exception as e:
             logger.error(f"Error getting exam certificate for exam {exam_id} and patient {patient_dni}: {e}")
             return None
     
+    async def get_latest_exam_certificate_async(self, exam_id: str, patient_dni: str) -> Optional[ExamCertificateResponse]:
+        """Versión asíncrona de get_latest_exam_certificate (AsyncClient)"""
+        try:
+            result_db = await self.async_repository.get_latest_by_exam_and_patient(exam_id, patient_dni)
+            return self._result_db_to_certificate(result_db) if result_db else None
+            
+        except Exception as e:
+            logger.error(f"Error getting exam certificate for exam {exam_id} and patient {patient_dni}: {e}")
+            return None
+    
+    def _result_db_to_certificate(self, result_db: ExamResultDB) -> ExamCertificateResponse:
+        """Crea el certificado a partir de un resultado"""
+        return ExamCertificateResponse(
+            citizen_dni=result_db.patient_dni,
+            citizen_name=result_db.patient_name,
+            exam_pass=result_db.is_approved,
+            exam_date=result_db.exam_date,
+            doctor_dni=result_db.examiner_dni,
+            doctor_name=result_db.examiner_name
+        )
+    
     def get_all_exam_results(self, limit: Optional[int] = None) -> List[ExamResultResponse]:
         """Obtiene todos los resultados de exámenes"""
         try:
@@ -355,67 +753,19 @@ class ExamResultService:
             logger.error(f"Error getting all exam results: {e}")
             return []
     
+    def iter_all_exam_results(self, limit: Optional[int] = None) -> Iterator[ExamResultResponse]:
+        """Genera los resultados a medida que llegan (exportaciones en streaming)"""
+        for result_db in self.repository.stream_all_results(limit):
+            yield self._result_db_to_response(result_db)
+    
     def get_patients_with_exams_summary(self) -> Optional[PatientsWithExamsResponse]:
         """Obtiene lista de pacientes que han realizado exámenes con resumen"""
         try:
-            # Obtener todos los resultados agrupados por paciente
-            patient_dnis = self.repository.get_patients_with_exams()
-            
-            if not patient_dnis:
-                return PatientsWithExamsResponse(
-                    total_patients=0,
-                    patients=[]
-                )
-            
-            patients_summary = []
-            
-            for patient_dni in patient_dnis:
-                # Obtener resultados del paciente
-                patient_results = self.repository.get_by_patient_dni(patient_dni)
-                
-                if not patient_results:
-                    continue
-                
-                # Calcular estadísticas
-                total_exams = len(patient_results)
-                passed_exams = sum(1 for result in patient_results if result.is_approved)
-                failed_exams = total_exams - passed_exams
-                
-                # Obtener información del último examen
-                latest_result = patient_results[0] if patient_results else None
-                last_exam_date = latest_result.exam_date if latest_result else None
-                last_exam_result = latest_result.is_approved if latest_result else None
-                
-                # Determinar si tiene licencia vigente (último examen aprobado)
-                has_valid_license = last_exam_result if last_exam_result is not None else False
-                
-                # Obtener nombre del paciente
-                patient_name = latest_result.patient_name if latest_result else patient_dni
-                
-                patient_summary = PatientExamSummary(
-                    patient_dni=patient_dni,
-                    patient_name=patient_name,
-                    total_exams=total_exams,
-                    passed_exams=passed_exams,
-                    failed_exams=failed_exams,
-                    last_exam_date=last_exam_date,
-                    last_exam_result=last_exam_result,
-                    has_valid_license=has_valid_license
-                )
-                
-                patients_summary.append(patient_summary)
-            
-            # Ordenar por fecha del último examen (más reciente primero)
-            patients_summary.sort(
-                key=lambda x: x.last_exam_date or datetime.min,
-                reverse=True
-            )
-            
+            patients_summary = self.summaries.list_all()
             return PatientsWithExamsResponse(
                 total_patients=len(patients_summary),
                 patients=patients_summary
             )
-            
         except Exception as e:
             logger.error(f"Error getting patients with exams summary: {e}")
             return None
@@ -423,7 +773,13 @@ class ExamResultService:
     def get_exam_statistics(self, days_back: Optional[int] = 30) -> Optional[ExamStatisticsResponse]:
         """Obtiene estadísticas generales de exámenes"""
         try:
-            stats = self.repository.get_exam_statistics(days_back)
+            if use_exam_stats_rollups():
+                # Contadores diarios: como mucho days_back documentos (por shard)
+                stats = self.stats.get_statistics(days_back)
+                stats['total_patients'] = self.summaries.count_examined_since(stats_period_start(days_back))
+            else:
+                stats = self.repository.get_exam_statistics(days_back)
+                stats['total_patients'] = self.summaries.count_examined_since(_stats_since(days_back))
             
             # Obtener los exámenes más recientes
             recent_results = self.repository.get_all_results(limit=10)
@@ -458,7 +814,9 @@ class ExamResultService:
                 total_passed=passed_exams,
                 total_failed=stats['failed_exams'],
                 pass_rate_percentage=round(pass_rate, 2),
+                average_score_percentage=stats['average_score'],
                 exams_by_month=exams_by_month_list,
+                exams_by_exam=stats.get('exams_by_exam', []),
                 most_recent_exams=recent_summaries
             )
             
@@ -469,23 +827,7 @@ class ExamResultService:
     def search_patients_by_name_or_dni(self, search_term: str) -> List[PatientExamSummary]:
         """Busca pacientes que han realizado exámenes por nombre o DNI"""
         try:
-            # Obtener todos los pacientes con exámenes
-            all_patients = self.get_patients_with_exams_summary()
-            
-            if not all_patients:
-                return []
-            
-            # Filtrar por término de búsqueda
-            search_term_lower = search_term.lower()
-            filtered_patients = []
-            
-            for patient in all_patients.patients:
-                if (search_term_lower in patient.patient_dni.lower() or 
-                    search_term_lower in patient.patient_name.lower()):
-                    filtered_patients.append(patient)
-            
-            return filtered_patients
-            
+            return self.summaries.search(search_term)
         except Exception as e:
             logger.error(f"Error searching patients: {e}")
             return []
@@ -512,7 +854,3 @@ class ExamResultService:
             exam_date=result_db.exam_date,
             created_at=result_db.created_at
         )
-
-
-# Instancia global del servicio
-exam_result_service = ExamResultService()
@@ -0,0 +1,132 @@
+from services.firestore import FirestoreService
+from models.exam import ExamResultDB
+from firebase_admin import firestore
+from typing import Optional, List, Dict, Any
+from datetime import datetime, timedelta
+import logging
+import random
+import os
+
+logger = logging.getLogger(__name__)
+
+# "aggregation": estadísticas con consultas de agregación sobre exam_results.
+# "rollups": lectura de los contadores diarios de exam_stats (requiere rebuild-exam-stats una vez).
+EXAM_STATS_MODE = os.getenv("EXAM_STATS_MODE", "aggregation").lower()
+
+# Documentos por día; con más de uno las escrituras se reparten para no saturar un único documento
+EXAM_STATS_SHARDS = max(1, int(os.getenv("EXAM_STATS_SHARDS", "1")))
+
+
+def use_exam_stats_rollups() -> bool:
+    """Si get_exam_statistics lee los contadores diarios en vez de agregar exam_results"""
+    return EXAM_STATS_MODE == "rollups"
+
+
+def stats_document_id(day: str, shard: int = 0) -> str:
+    """exam_stats/{yyyy-mm-dd} para el shard 0, exam_stats/{yyyy-mm-dd}_{n} para el resto"""
+    return day if shard == 0 else f"{day}_{shard}"
+
+
+def stats_period_start(days_back: Optional[int]) -> Optional[datetime]:
+    """Inicio del día de hace days_back días (None = desde siempre), la granularidad de exam_stats"""
+    if not days_back:
+        return None
+    return (datetime.now() - timedelta(days=days_back)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class ExamStatsRepository(FirestoreService):
+    """Contadores diarios de exámenes (exam_stats), actualizados con Increment al guardar resultados.
+
+    Cada documento guarda total, passed, failed, score_sum y los mismos contadores por examen
+    en by_exam. Leer un periodo es una consulta por rango sobre el campo day: como mucho
+    días x shards documentos pequeños. Los pacientes distintos no se guardan aquí (un array por
+    día crecería sin límite hacia el máximo de 1 MiB por documento): se cuentan sobre
+    patient_exam_summaries, un documento por paciente.
+    """
+
+    def __init__(self, db=None, shards: int = EXAM_STATS_SHARDS):
+        super().__init__(db)
+        self.stats_collection = "exam_stats"
+        self.shards = shards
+
+    def record_result(self, result_db: ExamResultDB, batch):
+        """Suma un resultado al día de su exam_date (en un shard al azar si hay varios)"""
+        day = result_db.exam_date.strftime("%Y-%m-%d")
+        shard = random.randrange(self.shards) if self.shards > 1 else 0
+        passed = 1 if result_db.is_approved else 0
+        ref = self.db.collection(self.stats_collection).document(stats_document_id(day, shard))
+        batch.set(ref, {
+            "day": day,
+            "total": firestore.Increment(1),
+            "passed": firestore.Increment(passed),
+            "failed": firestore.Increment(1 - passed),
+            "score_sum": firestore.Increment(result_db.score_percentage),
+            "by_exam": {
+                result_db.exam_id: {
+                    "exam_name": result_db.exam_name,
+                    "total": firestore.Increment(1),
+                    "passed": firestore.Increment(passed),
+                    "failed": firestore.Increment(1 - passed)
+                }
+            }
+        }, merge=True)
+
+    def get_days(self, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Documentos diarios desde since (todos si es None), con los shards ya sumados por día"""
+        try:
+            query = self.db.collection(self.stats_collection)
+            if since is not None:
+                query = query.where("day", ">=", since.strftime("%Y-%m-%d"))
+
+            days: Dict[str, Dict[str, Any]] = {}
+            for doc in query.stream():
+                data = doc.to_dict() or {}
+                day = data.get("day")
+                if not day:
+                    continue
+                merged = days.setdefault(day, {
+                    "day": day, "total": 0, "passed": 0, "failed": 0, "score_sum": 0, "by_exam": {}
+                })
+                for field in ("total", "passed", "failed", "score_sum"):
+                    merged[field] += data.get(field, 0)
+                for exam_id, counters in (data.get("by_exam") or {}).items():
+                    exam = merged["by_exam"].setdefault(exam_id, {
+                        "exam_name": counters.get("exam_name"), "total": 0, "passed": 0, "failed": 0
+                    })
+                    for field in ("total", "passed", "failed"):
+                        exam[field] += counters.get(field, 0)
+            return [days[day] for day in sorted(days)]
+        except Exception as e:
+            logger.error(f"Error reading exam stats rollups: {e}")
+            return []
+
+    def get_statistics(self, days_back: Optional[int] = 30) -> Dict[str, Any]:
+        """Mismo formato que ExamResultRepository.get_exam_statistics, a partir de los días.
+
+        La granularidad es el día: days_back=30 incluye el día completo de hace 30 días.
+        """
+        days = self.get_days(stats_period_start(days_back))
+
+        total_exams = sum(day["total"] for day in days)
+        passed_exams = sum(day["passed"] for day in days)
+        score_sum = sum(day["score_sum"] for day in days)
+        exams_by_month: Dict[str, int] = {}
+        by_exam: Dict[str, Dict[str, Any]] = {}
+        for day in days:
+            month = day["day"][:7]
+            exams_by_month[month] = exams_by_month.get(month, 0) + day["total"]
+            for exam_id, counters in day["by_exam"].items():
+                exam = by_exam.setdefault(exam_id, {
+                    "exam_id": exam_id, "exam_name": counters["exam_name"], "total": 0, "passed": 0, "failed": 0
+                })
+                for field in ("total", "passed", "failed"):
+                    exam[field] += counters[field]
+
+        return {
+            "total_exams": total_exams,
+            "passed_exams": passed_exams,
+            "failed_exams": total_exams - passed_exams,
+            "average_score": round(score_sum / total_exams, 2) if total_exams else None,
+            "exams_by_month": exams_by_month,
+            "exams_by_exam": sorted(by_exam.values(), key=lambda exam: exam["total"], reverse=True)
+        }
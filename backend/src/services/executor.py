@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+import asyncio
+import functools
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class FirestoreExecutor:
+    """Pool de hilos dedicado para las llamadas síncronas a Firestore"""
+
+    def __init__(self, max_workers: int = int(os.getenv("FIRESTORE_EXECUTOR_WORKERS", "32"))):
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Crea el pool de forma perezosa (también tras un shutdown)"""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="firestore"
+                    )
+                    logger.info(f"Firestore executor started with {self.max_workers} workers")
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Ejecuta func en el pool y espera su resultado sin bloquear el event loop"""
+        loop = asyncio.get_running_loop()
+        self._in_flight += 1
+        try:
+            return await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+        finally:
+            self._in_flight -= 1
+
+    def shutdown(self, wait: bool = True):
+        """Detiene el pool esperando a las llamadas en curso"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+                logger.info("Firestore executor stopped")
+
+    def stats(self) -> dict:
+        """Tamaño del pool y llamadas en curso o en cola"""
+        return {
+            "max_workers": self.max_workers,
+            "in_flight": self._in_flight,
+        }
+
+
+# Instancia global del pool de Firestore
+firestore_executor = FirestoreExecutor()
+
+
+async def run_in_executor(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Ejecuta una llamada bloqueante (repositorios/servicios) fuera del event loop"""
+    return await firestore_executor.run(func, *args, **kwargs)
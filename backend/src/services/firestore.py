@@ -1,12 +1,34 @@
 import firebase_admin
-from firebase_admin import firestore, auth, credentials
+from firebase_admin import firestore, firestore_async, auth, credentials
 import os
 
+
+def _initialize_firebase_app():
+    """Initialize Firebase Admin SDK if not already initialized"""
+    if not firebase_admin._apps:
+        firebase_credentials_path = os.getenv("FIREBASE_CREDENTIALS_PATH") if os.getenv("FIREBASE_CREDENTIALS_PATH") else "firebase-credentials.json"
+        firebase_admin.initialize_app(credentials.Certificate(firebase_credentials_path))
+
+
+def get_firestore_client():
+    """Cliente síncrono compartido (uno por app de Firebase, con un único canal gRPC)"""
+    _initialize_firebase_app()
+    return firestore.client()
+
+
+def get_async_firestore_client():
+    """AsyncClient compartido (uno por app de Firebase)"""
+    _initialize_firebase_app()
+    return firestore_async.client()
+
+
 class FirestoreService:
-    def __init__(self):
-        """Initialize Firestore client"""
-        if not firebase_admin._apps:
-            firebase_credentials_path = os.getenv("FIREBASE_CREDENTIALS_PATH") if os.getenv("FIREBASE_CREDENTIALS_PATH") else "firebase-credentials.json"
-            # Initialize Firebase Admin SDK if not already initialized
-            firebase_admin.initialize_app(credentials.Certificate(firebase_credentials_path))
-        self.db = firestore.client()
+    def __init__(self, db=None):
+        """Initialize Firestore client (el compartido salvo que se inyecte uno)"""
+        self.db = db if db is not None else get_firestore_client()
+
+
+class AsyncFirestoreService:
+    def __init__(self, db=None):
+        """Initialize Firestore AsyncClient (el compartido salvo que se inyecte uno)"""
+        self.db = db if db is not None else get_async_firestore_client()
@@ -15,6 +15,17 @@ import os
 
 logger = logging.getLogger(__name__)
 
+# Índices que necesitan las consultas del código, además de los de firestore.indexes.json
+LAB_VISIT_FIELDS = [
+    {"field_path": "visit_related_id", "order": "ASCENDING"},
+    {"field_path": "date_performed", "order": "DESCENDING"}
+]
+APP_REQUIRED_INDEXES = [
+    # LabRepository.list_by_visit en patients/{dni}/blood_analyses y radiology_studies
+    {"collectionGroup": "blood_analyses", "fields": LAB_VISIT_FIELDS},
+    {"collectionGroup": "radiology_studies", "fields": LAB_VISIT_FIELDS},
+]
+
 class FirestoreIndexService(FirestoreService):
     """Servicio para gestión de índices de Firestore"""
     
@@ -42,19 +53,23 @@ class FirestoreIndexService(FirestoreService):
             logger.error(f"Error initializing Firestore Admin Client: {e}")
     
     def load_required_indexes(self) -> List[Dict]:
-        """Carga los índices requeridos desde el archivo firestore.indexes.json"""
+        """Índices de APP_REQUIRED_INDEXES más los del archivo firestore.indexes.json (sin repetir)"""
+        indexes = list(APP_REQUIRED_INDEXES)
         try:
             indexes_file_path = "firestore.indexes.json"
             if not os.path.exists(indexes_file_path):
                 logger.warning("firestore.indexes.json file not found")
-                return []
+                return indexes
             
             with open(indexes_file_path, 'r') as f:
                 data = json.load(f)
-                return data.get('indexes', [])
+            for index in data.get('indexes', []):
+                if index not in indexes:
+                    indexes.append(index)
+            return indexes
         except Exception as e:
             logger.error(f"Error loading required indexes: {e}")
-            return []
+            return indexes
     
     def get_parent_path(self) -> str:
         """Obtiene el path padre para las operaciones de administración"""
@@ -0,0 +1,129 @@
+from services.firestore import FirestoreService
+from models.patient import BloodAnalysis, RadiologyStudy
+from firebase_admin import firestore
+from typing import Optional, List, Dict, Type, Union
+from datetime import datetime
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# "embedded": análisis y estudios en arrays dentro de pacientes y visitas (modo histórico).
+# "subcollection": un documento por análisis/estudio en patients/{dni}/blood_analyses y
+# patients/{dni}/radiology_studies; pacientes y visitas mantienen un tamaño constante.
+LAB_STORAGE_MODE = os.getenv("LAB_STORAGE_MODE", "embedded").lower()
+
+BLOOD_ANALYSES = "blood_analyses"
+RADIOLOGY_STUDIES = "radiology_studies"
+
+LAB_MODELS: Dict[str, Type[Union[BloodAnalysis, RadiologyStudy]]] = {
+    BLOOD_ANALYSES: BloodAnalysis,
+    RADIOLOGY_STUDIES: RadiologyStudy,
+}
+
+LAB_ID_FIELDS = {
+    BLOOD_ANALYSES: "analysis_id",
+    RADIOLOGY_STUDIES: "study_id",
+}
+
+
+def use_lab_subcollections() -> bool:
+    """Si los análisis y estudios se guardan en subcolecciones del paciente"""
+    return LAB_STORAGE_MODE == "subcollection"
+
+
+def merge_labs(*groups: List) -> List:
+    """Une listas de análisis/estudios sin duplicados (mismo ID), más recientes primero.
+
+    Durante la migración un mismo elemento puede estar todavía embebido y ya en la subcolección.
+    """
+    merged = {}
+    for group in groups:
+        for item in group:
+            item_id = getattr(item, "analysis_id", None) or getattr(item, "study_id", None)
+            merged.setdefault(item_id, item)
+    return sorted(merged.values(), key=lambda item: item.date_performed, reverse=True)
+
+
+class LabRepository(FirestoreService):
+    """Análisis de sangre y estudios radiológicos como subcolecciones del paciente.
+
+    Las consultas por visita necesitan el índice compuesto (ámbito colección) sobre
+    blood_analyses / radiology_studies: visit_related_id ASC, date_performed DESC, que
+    crea al arrancar FirestoreIndexService (APP_REQUIRED_INDEXES).
+    """
+
+    def __init__(self, db=None):
+        super().__init__(db)
+        self.patients_collection = "patients"
+
+    def _collection(self, patient_dni: str, kind: str):
+        return self.db.collection(self.patients_collection).document(patient_dni).collection(kind)
+
+    def _document_to_lab(self, doc, kind: str):
+        """Convierte un documento de la subcolección al modelo correspondiente"""
+        try:
+            data = doc.to_dict()
+            if isinstance(data.get("date_performed"), str):
+                try:
+                    data["date_performed"] = datetime.fromisoformat(data["date_performed"].replace('Z', '+00:00'))
+                except ValueError:
+                    data["date_performed"] = datetime.now()
+            return LAB_MODELS[kind](**data)
+        except Exception as e:
+            logger.error(f"Error converting {kind} document {doc.id}: {e}")
+            return None
+
+    def _run(self, query, kind: str) -> List:
+        labs = []
+        for doc in query.stream():
+            lab = self._document_to_lab(doc, kind)
+            if lab:
+                labs.append(lab)
+        return labs
+
+    def add(self, patient_dni: str, kind: str, item: dict, batch=None):
+        """Guarda un análisis/estudio (el ID del elemento es el ID del documento, así que es idempotente)"""
+        doc_ref = self._collection(patient_dni, kind).document(item[LAB_ID_FIELDS[kind]])
+        if batch is not None:
+            batch.set(doc_ref, item)
+        else:
+            doc_ref.set(item)
+
+    def list(self, patient_dni: str, kind: str) -> List:
+        """Todos los análisis/estudios del paciente, más recientes primero"""
+        try:
+            return self._run(
+                self._collection(patient_dni, kind).order_by("date_performed", direction=firestore.Query.DESCENDING),
+                kind
+            )
+        except Exception as e:
+            logger.error(f"Error listing {kind} for patient {patient_dni}: {e}")
+            return []
+
+    def list_by_visit(self, patient_dni: str, kind: str, visit_id: str) -> List:
+        """Análisis/estudios de una visita concreta (consulta indexada por visit_related_id)"""
+        try:
+            return self._run(
+                self._collection(patient_dni, kind)
+                .where("visit_related_id", "==", visit_id)
+                .order_by("date_performed", direction=firestore.Query.DESCENDING),
+                kind
+            )
+        except Exception as e:
+            logger.error(f"Error listing {kind} for visit {visit_id}: {e}")
+            return []
+
+    def latest(self, patient_dni: str, kind: str):
+        """Análisis/estudio más reciente del paciente, o None"""
+        try:
+            labs = self._run(
+                self._collection(patient_dni, kind)
+                .order_by("date_performed", direction=firestore.Query.DESCENDING)
+                .limit(1),
+                kind
+            )
+            return labs[0] if labs else None
+        except Exception as e:
+            logger.error(f"Error getting latest {kind} for patient {patient_dni}: {e}")
+            return None
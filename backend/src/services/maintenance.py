@@ -0,0 +1,422 @@
+"""
+Tareas de mantenimiento de datos en Firestore.
+
+Uso (desde backend/src):
+
+    python -m services.maintenance migrate-labs [--dry-run]
+    python -m services.maintenance backfill-last-visit [--dry-run]
+    python -m services.maintenance backfill-search-tokens [--dry-run]
+    python -m services.maintenance rebuild-exam-summaries [--dry-run]
+    python -m services.maintenance rebuild-exam-stats [--dry-run]
+    python -m services.maintenance rebuild-admitted-board [--dry-run]
+
+migrate-labs mueve los análisis de sangre y estudios radiológicos embebidos en pacientes
+y visitas a patients/{dni}/blood_analyses y patients/{dni}/radiology_studies. Es idempotente
+(el ID del elemento es el ID del documento) y se puede relanzar si se interrumpe. Orden
+recomendado: desplegar con LAB_STORAGE_MODE=subcollection (las lecturas unen embebidos y
+subcolección mientras dure la migración) y después ejecutar la migración.
+
+backfill-last-visit rellena last_visit_date/last_visit_id de los pacientes a partir de sus
+visitas (fecha de alta o, si no hay, de admisión). Se ejecuta una vez tras desplegar el código
+que mantiene esos campos al crear y dar de alta visitas; relanzarlo es inocuo.
+
+backfill-search-tokens calcula search_tokens (prefijos normalizados del nombre) en los pacientes
+guardados antes de la búsqueda por prefijos; solo escribe los documentos desactualizados.
+
+rebuild-exam-summaries recalcula patient_exam_summaries desde exam_results (reemplaza cada
+resumen). Tras desplegar, los resúmenes se mantienen solos al guardar resultados; conviene
+lanzarlo sin exámenes en curso, porque un resultado guardado durante el recorrido puede no
+contarse hasta el siguiente relanzamiento.
+
+rebuild-exam-stats recalcula los contadores diarios de exam_stats desde exam_results (borra los
+documentos existentes, shards incluidos, y escribe uno por día). Mismas precauciones que
+rebuild-exam-summaries; después se puede activar EXAM_STATS_MODE=rollups. Los pacientes
+distintos del periodo salen de patient_exam_summaries, así que rebuild-exam-summaries tiene que
+haberse lanzado antes. Reescribir los días también quita el antiguo array patient_dnis.
+
+rebuild-admitted-board reemplaza admitted_board/current con las visitas en admisión actuales.
+Las escrituras de visitas no crean el tablero si falta (lo reconstruye la primera lectura), así
+que basta con lanzarlo al desplegar o para reparar un tablero que no coincida con las visitas.
+"""
+from services.firestore import get_firestore_client
+from services.labs import LabRepository, BLOOD_ANALYSES, RADIOLOGY_STUDIES, LAB_ID_FIELDS
+from services.search import build_search_tokens
+from services.exam_results import PatientExamSummaryRepository
+from services.exam_stats import ExamStatsRepository, stats_document_id
+from services.container import get_services
+from firebase_admin import firestore
+from datetime import datetime
+from typing import Dict, List, Set, Tuple
+import argparse
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Firestore admite 500 operaciones por batch; se deja margen para las actualizaciones del documento padre
+MAX_BATCH_OPERATIONS = 450
+
+LAB_KINDS = (BLOOD_ANALYSES, RADIOLOGY_STUDIES)
+
+
+def _lab_fingerprint(kind: str, item: dict) -> str:
+    """Contenido de un análisis/estudio sin ID ni fecha, para detectar las copias duplicadas que
+    la sincronización visita/paciente antigua creaba con IDs distintos"""
+    data = {k: v for k, v in item.items() if k not in (LAB_ID_FIELDS[kind], "date_performed")}
+    return json.dumps(data, sort_keys=True, default=str)
+
+
+class LabMigration:
+    """Migración de análisis y estudios embebidos a subcolecciones del paciente"""
+
+    def __init__(self, db=None, dry_run: bool = False):
+        self.db = db if db is not None else get_firestore_client()
+        self.labs = LabRepository(self.db)
+        self.dry_run = dry_run
+        self.stats = {"patients": 0, "visits": 0, "written": 0, "duplicates": 0}
+
+    def _commit_in_chunks(self, writes: List[dict], parent_ref, parent_field_prefix: str = ""):
+        """Copia los elementos a la subcolección y quita los originales del documento padre.
+
+        Se usa ArrayRemove con el valor guardado (en vez de vaciar el array) para no perder
+        elementos añadidos mientras se migra. Cada trozo es un batch atómico.
+        """
+        if self.dry_run:
+            return
+        for start in range(0, len(writes), MAX_BATCH_OPERATIONS):
+            batch = self.db.batch()
+            removed: Dict[str, list] = {}
+            for write in writes[start:start + MAX_BATCH_OPERATIONS]:
+                if write["copy"]:
+                    self.labs.add(write["patient_dni"], write["kind"], write["item"], batch)
+                removed.setdefault(write["kind"], []).append(write["original"])
+            batch.update(parent_ref, {
+                f"{parent_field_prefix}{kind}": firestore.ArrayRemove(items)
+                for kind, items in removed.items()
+            })
+            batch.commit()
+
+    def _existing_fingerprints(self, patient_dni: str, kind: str) -> Set[str]:
+        """Huellas de lo que ya está en la subcolección (relanzamientos tras una interrupción)"""
+        docs = self.labs._collection(patient_dni, kind).stream()
+        return {_lab_fingerprint(kind, doc.to_dict()) for doc in docs}
+
+    def migrate_patient(self, patient_doc):
+        """Migra los elementos embebidos del paciente y de sus visitas"""
+        patient_dni = patient_doc.id
+        medical_history = (patient_doc.to_dict() or {}).get("medical_history") or {}
+        fingerprints = {kind: self._existing_fingerprints(patient_dni, kind) for kind in LAB_KINDS}
+
+        patient_writes = []
+        for kind in LAB_KINDS:
+            for item in medical_history.get(kind) or []:
+                fingerprints[kind].add(_lab_fingerprint(kind, item))
+                patient_writes.append({"patient_dni": patient_dni, "kind": kind, "item": item, "original": item, "copy": True})
+        if patient_writes:
+            self._commit_in_chunks(patient_writes, patient_doc.reference, "medical_history.")
+            self.stats["patients"] += 1
+            self.stats["written"] += len(patient_writes)
+
+        visits = self.db.collection("visits")\
+            .where("patient_dni", "==", patient_dni)\
+            .select(list(LAB_KINDS))\
+            .stream()
+        for visit_doc in visits:
+            visit_data = visit_doc.to_dict() or {}
+            visit_writes = []
+            for kind in LAB_KINDS:
+                for original in visit_data.get(kind) or []:
+                    item = {**original, "visit_related_id": original.get("visit_related_id") or visit_doc.id}
+                    fingerprint = _lab_fingerprint(kind, item)
+                    # Si el paciente ya tiene la misma entrada (copia sincronizada), solo se quita de la visita
+                    duplicate = fingerprint in fingerprints[kind]
+                    fingerprints[kind].add(fingerprint)
+                    visit_writes.append({"patient_dni": patient_dni, "kind": kind, "item": item, "original": original, "copy": not duplicate})
+                    self.stats["duplicates"] += int(duplicate)
+            if visit_writes:
+                self._commit_in_chunks(visit_writes, visit_doc.reference)
+                self.stats["visits"] += 1
+                self.stats["written"] += sum(1 for write in visit_writes if write["copy"])
+
+    def run(self) -> dict:
+        """Recorre todos los pacientes (proyectando solo los arrays a migrar)"""
+        patients = self.db.collection("patients")\
+            .select([f"medical_history.{kind}" for kind in LAB_KINDS])\
+            .stream()
+        for patient_doc in patients:
+            try:
+                self.migrate_patient(patient_doc)
+            except Exception as e:
+                logger.error(f"Error migrating labs of patient {patient_doc.id}: {e}")
+        logger.info(f"Lab migration {'(dry run) ' if self.dry_run else ''}finished: {self.stats}")
+        return self.stats
+
+
+def _parse_date(value) -> datetime:
+    """Fechas guardadas como string ISO (o datetime en documentos antiguos)"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    return value.replace(tzinfo=None)
+
+
+class LastVisitBackfill:
+    """Relleno inicial de la última visita desnormalizada en los pacientes"""
+
+    def __init__(self, db=None, dry_run: bool = False):
+        self.db = db if db is not None else get_firestore_client()
+        self.dry_run = dry_run
+        self.stats = {"visits": 0, "patients": 0, "missing_patients": 0}
+
+    def _latest_visits(self) -> Dict[str, Tuple[datetime, str]]:
+        """Una sola pasada por visits (solo los campos necesarios) quedándose con la más reciente por paciente"""
+        latest: Dict[str, Tuple[datetime, str]] = {}
+        visits = self.db.collection("visits")\
+            .select(["patient_dni", "admission_date", "discharge_date"])\
+            .stream()
+        for visit_doc in visits:
+            data = visit_doc.to_dict() or {}
+            patient_dni = data.get("patient_dni")
+            raw_date = data.get("discharge_date") or data.get("admission_date")
+            if not patient_dni or not raw_date:
+                continue
+            try:
+                visit_date = _parse_date(raw_date)
+            except Exception as e:
+                logger.error(f"Invalid date in visit {visit_doc.id}: {e}")
+                continue
+            self.stats["visits"] += 1
+            if patient_dni not in latest or visit_date > latest[patient_dni][0]:
+                latest[patient_dni] = (visit_date, visit_doc.id)
+        return latest
+
+    def run(self) -> dict:
+        latest = self._latest_visits()
+        patients_ref = self.db.collection("patients")
+        existing = {doc.id for doc in patients_ref.select([]).stream()}
+        updates = []
+        for patient_dni, (visit_date, visit_id) in latest.items():
+            if patient_dni not in existing:
+                self.stats["missing_patients"] += 1
+                continue
+            updates.append((patient_dni, visit_date, visit_id))
+        self.stats["patients"] = len(updates)
+
+        if not self.dry_run:
+            for start in range(0, len(updates), MAX_BATCH_OPERATIONS):
+                batch = self.db.batch()
+                for patient_dni, visit_date, visit_id in updates[start:start + MAX_BATCH_OPERATIONS]:
+                    batch.update(patients_ref.document(patient_dni), {
+                        "last_visit_date": visit_date.isoformat(),
+                        "last_visit_id": visit_id
+                    })
+                batch.commit()
+        logger.info(f"Last visit backfill {'(dry run) ' if self.dry_run else ''}finished: {self.stats}")
+        return self.stats
+
+
+class SearchTokensBackfill:
+    """Rellena search_tokens en los pacientes que no lo tienen o lo tienen desactualizado"""
+
+    def __init__(self, db=None, dry_run: bool = False):
+        self.db = db if db is not None else get_firestore_client()
+        self.dry_run = dry_run
+        self.stats = {"patients": 0, "updated": 0}
+
+    def run(self) -> dict:
+        patients = self.db.collection("patients").select(["name", "search_tokens"]).stream()
+        batch = self.db.batch()
+        pending = 0
+        for patient_doc in patients:
+            self.stats["patients"] += 1
+            data = patient_doc.to_dict() or {}
+            tokens = build_search_tokens(data.get("name"))
+            if data.get("search_tokens") == tokens:
+                continue
+            self.stats["updated"] += 1
+            if self.dry_run:
+                continue
+            batch.update(patient_doc.reference, {"search_tokens": tokens})
+            pending += 1
+            if pending >= MAX_BATCH_OPERATIONS:
+                batch.commit()
+                batch = self.db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+        logger.info(f"Search tokens backfill {'(dry run) ' if self.dry_run else ''}finished: {self.stats}")
+        return self.stats
+
+
+class ExamSummaryRebuild:
+    """Recalcula el resumen de exámenes de cada paciente con una sola pasada por exam_results"""
+
+    def __init__(self, db=None, dry_run: bool = False):
+        self.db = db if db is not None else get_firestore_client()
+        self.summaries = PatientExamSummaryRepository(self.db)
+        self.dry_run = dry_run
+        self.stats = {"results": 0, "patients": 0}
+
+    def _aggregate(self) -> Dict[str, dict]:
+        aggregated: Dict[str, dict] = {}
+        results = self.db.collection("exam_results")\
+            .select(["result_id", "patient_dni", "patient_name", "is_approved", "exam_date"])\
+            .stream()
+        for result_doc in results:
+            data = result_doc.to_dict() or {}
+            patient_dni = data.get("patient_dni")
+            if not patient_dni:
+                continue
+            self.stats["results"] += 1
+            approved = bool(data.get("is_approved"))
+            exam_date = _parse_date(data["exam_date"]) if data.get("exam_date") else datetime.min
+            summary = aggregated.setdefault(patient_dni, {
+                "total_exams": 0, "passed_exams": 0, "failed_exams": 0, "last": None
+            })
+            summary["total_exams"] += 1
+            summary["passed_exams" if approved else "failed_exams"] += 1
+            if summary["last"] is None or exam_date > summary["last"][0]:
+                summary["last"] = (exam_date, approved, data.get("result_id") or result_doc.id, data.get("patient_name") or patient_dni)
+        return aggregated
+
+    def run(self) -> dict:
+        aggregated = self._aggregate()
+        self.stats["patients"] = len(aggregated)
+        if not self.dry_run:
+            collection = self.db.collection(self.summaries.summaries_collection)
+            items = list(aggregated.items())
+            for start in range(0, len(items), MAX_BATCH_OPERATIONS):
+                batch = self.db.batch()
+                for patient_dni, summary in items[start:start + MAX_BATCH_OPERATIONS]:
+                    last_exam_date, approved, result_id, patient_name = summary["last"]
+                    batch.set(collection.document(patient_dni), {
+                        **self.summaries.summary_fields(patient_dni, patient_name),
+                        "total_exams": summary["total_exams"],
+                        "passed_exams": summary["passed_exams"],
+                        "failed_exams": summary["failed_exams"],
+                        "last_exam_date": last_exam_date.isoformat(),
+                        "last_exam_result": approved,
+                        "last_result_id": result_id,
+                        "has_valid_license": approved
+                    })
+                batch.commit()
+        logger.info(f"Exam summaries rebuild {'(dry run) ' if self.dry_run else ''}finished: {self.stats}")
+        return self.stats
+
+
+class ExamStatsRebuild:
+    """Recalcula exam_stats/{yyyy-mm-dd} con una sola pasada por exam_results"""
+
+    def __init__(self, db=None, dry_run: bool = False):
+        self.db = db if db is not None else get_firestore_client()
+        self.stats_collection = ExamStatsRepository(self.db).stats_collection
+        self.dry_run = dry_run
+        self.stats = {"results": 0, "days": 0, "deleted": 0}
+
+    def _aggregate(self) -> Dict[str, dict]:
+        days: Dict[str, dict] = {}
+        results = self.db.collection("exam_results")\
+            .select(["exam_id", "exam_name", "is_approved", "score_percentage", "exam_date"])\
+            .stream()
+        for result_doc in results:
+            data = result_doc.to_dict() or {}
+            if not data.get("exam_date"):
+                continue
+            self.stats["results"] += 1
+            day = _parse_date(data["exam_date"]).strftime("%Y-%m-%d")
+            passed = 1 if data.get("is_approved") else 0
+            counters = days.setdefault(day, {
+                "day": day, "total": 0, "passed": 0, "failed": 0, "score_sum": 0, "by_exam": {}
+            })
+            counters["total"] += 1
+            counters["passed"] += passed
+            counters["failed"] += 1 - passed
+            counters["score_sum"] += data.get("score_percentage") or 0
+            exam = counters["by_exam"].setdefault(data.get("exam_id") or "unknown", {
+                "exam_name": data.get("exam_name"), "total": 0, "passed": 0, "failed": 0
+            })
+            exam["total"] += 1
+            exam["passed"] += passed
+            exam["failed"] += 1 - passed
+        return days
+
+    def run(self) -> dict:
+        days = self._aggregate()
+        self.stats["days"] = len(days)
+        # Los días recalculados se sobrescriben con set(); se borran los shards y los días sin resultados
+        rebuilt_ids = {stats_document_id(day) for day in days}
+        existing = [
+            doc.reference for doc in self.db.collection(self.stats_collection).select([]).stream()
+            if doc.id not in rebuilt_ids
+        ]
+        self.stats["deleted"] = len(existing)
+
+        if not self.dry_run:
+            collection = self.db.collection(self.stats_collection)
+            writes = [("delete", ref, None) for ref in existing]
+            writes += [
+                ("set", collection.document(stats_document_id(day)), counters)
+                for day, counters in days.items()
+            ]
+            for start in range(0, len(writes), MAX_BATCH_OPERATIONS):
+                batch = self.db.batch()
+                for operation, ref, data in writes[start:start + MAX_BATCH_OPERATIONS]:
+                    if operation == "delete":
+                        batch.delete(ref)
+                    else:
+                        batch.set(ref, data)
+                batch.commit()
+        logger.info(f"Exam stats rebuild {'(dry run) ' if self.dry_run else ''}finished: {self.stats}")
+        return self.stats
+
+
+class AdmittedBoardRebuild:
+    """Reconstruye el tablero de admitidos desde las visitas en admisión"""
+
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+        self.stats = {"admitted": 0, "etag": None}
+
+    def run(self) -> dict:
+        patient_service = get_services().patient_service
+        admitted_patients = patient_service.get_admitted_patients()
+        self.stats["admitted"] = len(admitted_patients)
+        if not self.dry_run:
+            self.stats["etag"] = patient_service.visit_service.admitted_board.rebuild(admitted_patients)
+        logger.info(f"Admitted board rebuild {'(dry run) ' if self.dry_run else ''}finished: {self.stats}")
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tareas de mantenimiento de Firestore")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_labs = subparsers.add_parser("migrate-labs", help="Mueve análisis y estudios embebidos a subcolecciones")
+    migrate_labs.add_argument("--dry-run", action="store_true", help="Solo cuenta lo que se migraría")
+    backfill_last_visit = subparsers.add_parser("backfill-last-visit", help="Rellena la última visita de cada paciente")
+    backfill_last_visit.add_argument("--dry-run", action="store_true", help="Solo cuenta los pacientes que se actualizarían")
+    backfill_search_tokens = subparsers.add_parser("backfill-search-tokens", help="Calcula search_tokens de los pacientes")
+    backfill_search_tokens.add_argument("--dry-run", action="store_true", help="Solo cuenta los pacientes que se actualizarían")
+    rebuild_exam_summaries = subparsers.add_parser("rebuild-exam-summaries", help="Recalcula patient_exam_summaries")
+    rebuild_exam_summaries.add_argument("--dry-run", action="store_true", help="Solo cuenta los resúmenes que se escribirían")
+    rebuild_exam_stats = subparsers.add_parser("rebuild-exam-stats", help="Recalcula los contadores diarios de exam_stats")
+    rebuild_exam_stats.add_argument("--dry-run", action="store_true", help="Solo cuenta los días que se escribirían")
+    rebuild_admitted_board = subparsers.add_parser("rebuild-admitted-board", help="Reconstruye admitted_board/current")
+    rebuild_admitted_board.add_argument("--dry-run", action="store_true", help="Solo cuenta los pacientes admitidos")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "migrate-labs":
+        print(LabMigration(dry_run=args.dry_run).run())
+    elif args.command == "backfill-last-visit":
+        print(LastVisitBackfill(dry_run=args.dry_run).run())
+    elif args.command == "backfill-search-tokens":
+        print(SearchTokensBackfill(dry_run=args.dry_run).run())
+    elif args.command == "rebuild-exam-summaries":
+        print(ExamSummaryRebuild(dry_run=args.dry_run).run())
+    elif args.command == "rebuild-exam-stats":
+        print(ExamStatsRebuild(dry_run=args.dry_run).run())
+    elif args.command == "rebuild-admitted-board":
+        print(AdmittedBoardRebuild(dry_run=args.dry_run).run())
+
+
+if __name__ == "__main__":
+    main()
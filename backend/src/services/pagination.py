@@ -0,0 +1,49 @@
+from firebase_admin import firestore
+from typing import Any, Optional, Tuple
+import base64
+import json
+
+
+class InvalidCursorError(ValueError):
+    """Cursor de paginación mal formado o manipulado"""
+
+
+def encode_cursor(order_value: Any, document_id: str) -> str:
+    """Cursor opaco a partir del valor del campo de orden y el ID del último documento de la página"""
+    payload = json.dumps({"v": order_value, "id": document_id}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    """Devuelve (valor de orden, ID de documento) de un cursor generado por encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        document_id = data["id"]
+        if not isinstance(document_id, str) or not document_id:
+            raise ValueError("empty document id")
+        return data["v"], document_id
+    except Exception as e:
+        raise InvalidCursorError(f"Invalid pagination cursor: {e}")
+
+
+def paginate_query(query, order_field: str, limit: int, cursor: Optional[str] = None, descending: bool = True):
+    """Ordena por order_field y por ID de documento (desempate estable) y aplica limit/start_after.
+
+    Se pide un documento de más para saber si existe una página siguiente sin otra consulta.
+    """
+    direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+    query = query.order_by(order_field, direction=direction).order_by("__name__", direction=direction)
+    if cursor:
+        order_value, document_id = decode_cursor(cursor)
+        query = query.start_after({order_field: order_value, "__name__": document_id})
+    return query.limit(limit + 1)
+
+
+def split_page(docs: list, order_field: str, limit: int) -> Tuple[list, Optional[str]]:
+    """Recorta el documento extra de paginate_query y calcula el cursor de la página siguiente"""
+    if len(docs) <= limit:
+        return docs, None
+    page = docs[:limit]
+    last = page[-1]
+    return page, encode_cursor(last.get(order_field), last.id)
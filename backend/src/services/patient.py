@@ -1,4 +1,4 @@
-from services.firestore import FirestoreService
+from services.firestore import FirestoreService, AsyncFirestoreService
 from models.patient import PatientDB, BloodAnalysis, RadiologyStudy, MedicalHistory
 from schemas import (
     Patient, PatientCreate, PatientUpdate, PatientAdmitted, PatientComplete,
@@ -7,22 +7,37 @@ from schemas import (
     PatientSearchFilters, VisitStatus
 )
 from services.visits import VisitService
+from services.admitted_board import build_admitted_entry
+from services.labs import LabRepository, BLOOD_ANALYSES, RADIOLOGY_STUDIES, use_lab_subcollections, merge_labs
+from services.search import PatientNameIndex, build_search_tokens, search_terms, matches_terms, most_selective_term
+from services.patient_directory import PatientDirectory
 from firebase_admin import firestore
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Iterator
 from datetime import datetime
 import logging
+import os
+
+# Tamaño de cada lote de lecturas (db.get_all) al cargar pacientes por DNI
+PATIENT_BATCH_SIZE = int(os.getenv("PATIENT_BATCH_SIZE", "100"))
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-class PatientRepository(FirestoreService):
-    """Repositorio para operaciones de base de datos de pacientes"""
-    
-    def __init__(self):
-        super().__init__()
-        self.patients_collection = "patients"
+# Campos necesarios para construir PatientSummary (select() evita descargar el historial médico completo).
+# Un PatientDB proyectado es solo de lectura: guardarlo sobrescribiría el resto del historial.
+PATIENT_SUMMARY_FIELDS = ["dni", "name", "age", "sex", "blood_type", "medical_history.allergies", "last_visit_date"]
+
+# Campos mínimos para unir pacientes con visitas (tablero de admitidos)
+PATIENT_BASIC_FIELDS = ["dni", "name", "age", "sex", "blood_type", "enabled"]
+
+# Lo necesario para consultar los análisis embebidos sin leer el resto del historial
+PATIENT_BLOOD_ANALYSES_FIELDS = PATIENT_BASIC_FIELDS + [f"medical_history.{BLOOD_ANALYSES}"]
+
+
+class PatientDocumentMixin:
+    """Conversión entre documentos de Firestore y PatientDB, compartida por los repositorios sync y async"""
     
     def _document_to_patient_db(self, doc) -> Optional[PatientDB]:
         """Convierte un documento de Firestore a PatientDB"""
@@ -32,51 +47,85 @@ class PatientRepository(FirestoreService):
             
             data = doc.to_dict()
             # Convertir timestamps de string a datetime si es necesario
-            for field in ['created_at', 'updated_at']:
+            for field in ['created_at', 'updated_at', 'last_visit_date']:
                 if field in data and isinstance(data[field], str):
                     try:
                         data[field] = datetime.fromisoformat(data[field].replace('Z', '+00:00'))
                     except ValueError:
-                        data[field] = datetime.now()
+                        data[field] = None if field == 'last_visit_date' else datetime.now()
             
             return PatientDB(**data)
         except Exception as e:
             logger.error(f"Error converting document to PatientDB: {e}")
             return None
     
-    def get_by_dni(self, dni: str) -> Optional[PatientDB]:
-        """Obtiene un paciente por DNI"""
+    def _patient_db_to_dict(self, patient_db: PatientDB) -> dict:
+        """Convierte PatientDB a diccionario con timestamps como strings ISO"""
+        patient_dict = patient_db.model_dump()
+        for field in ['created_at', 'updated_at', 'last_visit_date']:
+            if field in patient_dict and isinstance(patient_dict[field], datetime):
+                patient_dict[field] = patient_dict[field].isoformat()
+        
+        # Prefijos normalizados del nombre para search_by_name (se recalculan en cada escritura)
+        patient_dict['search_tokens'] = build_search_tokens(patient_db.name)
+        
+        # También convertir timestamps en historial médico
+        if 'medical_history' in patient_dict:
+            medical_history = patient_dict['medical_history']
+            if 'last_updated' in medical_history and isinstance(medical_history['last_updated'], datetime):
+                medical_history['last_updated'] = medical_history['last_updated'].isoformat()
+            
+            # Convertir timestamps en análisis de sangre
+            for analysis in medical_history.get('blood_analyses', []):
+                if 'date_performed' in analysis and isinstance(analysis['date_performed'], datetime):
+                    analysis['date_performed'] = analysis['date_performed'].isoformat()
+            
+            # Convertir timestamps en estudios radiológicos
+            for study in medical_history.get('radiology_studies', []):
+                if 'date_performed' in study and isinstance(study['date_performed'], datetime):
+                    study['date_performed'] = study['date_performed'].isoformat()
+        
+        return patient_dict
+
+
+class PatientRepository(PatientDocumentMixin, FirestoreService):
+    """Repositorio para operaciones de base de datos de pacientes"""
+    
+    def __init__(self, db=None):
+        super().__init__(db)
+        self.patients_collection = "patients"
+    
+    def get_by_dni(self, dni: str, fields: Optional[List[str]] = None) -> Optional[PatientDB]:
+        """Obtiene un paciente por DNI (solo los campos indicados si se pasa fields)"""
         try:
-            doc = self.db.collection(self.patients_collection).document(dni).get()
+            doc = self.db.collection(self.patients_collection).document(dni).get(fields)
             return self._document_to_patient_db(doc)
         except Exception as e:
             logger.error(f"Error getting patient by DNI {dni}: {e}")
             return None
     
+    def get_many_by_dni(self, dnis: List[str], fields: Optional[List[str]] = None) -> Dict[str, PatientDB]:
+        """Obtiene varios pacientes por DNI con lecturas en lote (una por cada PATIENT_BATCH_SIZE)"""
+        unique_dnis = list(dict.fromkeys(dni for dni in dnis if dni))
+        patients = {}
+        try:
+            collection = self.db.collection(self.patients_collection)
+            for start in range(0, len(unique_dnis), PATIENT_BATCH_SIZE):
+                refs = [collection.document(dni) for dni in unique_dnis[start:start + PATIENT_BATCH_SIZE]]
+                for doc in self.db.get_all(refs, field_paths=fields):
+                    patient = self._document_to_patient_db(doc)
+                    if patient:
+                        patients[patient.dni] = patient
+            return patients
+        except Exception as e:
+            logger.error(f"Error getting {len(unique_dnis)} patients by DNI: {e}")
+            return patients
+    
     def create(self, patient_db: PatientDB) -> bool:
         """Crea un nuevo paciente"""
         try:
             # Convertir el modelo a diccionario con timestamps como strings ISO
-            patient_dict = patient_db.model_dump()
-            for field in ['created_at', 'updated_at']:
-                if field in patient_dict and isinstance(patient_dict[field], datetime):
-                    patient_dict[field] = patient_dict[field].isoformat()
-            
-            # También convertir timestamps en historial médico
-            if 'medical_history' in patient_dict:
-                medical_history = patient_dict['medical_history']
-                if 'last_updated' in medical_history and isinstance(medical_history['last_updated'], datetime):
-                    medical_history['last_updated'] = medical_history['last_updated'].isoformat()
-                
-                # Convertir timestamps en análisis de sangre
-                for analysis in medical_history.get('blood_analyses', []):
-                    if 'date_performed' in analysis and isinstance(analysis['date_performed'], datetime):
-                        analysis['date_performed'] = analysis['date_performed'].isoformat()
-                
-                # Convertir timestamps en estudios radiológicos
-                for study in medical_history.get('radiology_studies', []):
-                    if 'date_performed' in study and isinstance(study['date_performed'], datetime):
-                        study['date_performed'] = study['date_performed'].isoformat()
+            patient_dict = self._patient_db_to_dict(patient_db)
             
             self.db.collection(self.patients_collection).document(patient_db.dni).set(patient_dict)
             logger.info(f"Patient {patient_db.dni} created successfully")
@@ -92,24 +141,7 @@ class PatientRepository(FirestoreService):
             patient_db.update_timestamp()
             
             # Convertir a diccionario con manejo de timestamps
-            patient_dict = patient_db.model_dump()
-            for field in ['created_at', 'updated_at']:
-                if field in patient_dict and isinstance(patient_dict[field], datetime):
-                    patient_dict[field] = patient_dict[field].isoformat()
-            
-            # Manejar timestamps en historial médico
-            if 'medical_history' in patient_dict:
-                medical_history = patient_dict['medical_history']
-                if 'last_updated' in medical_history and isinstance(medical_history['last_updated'], datetime):
-                    medical_history['last_updated'] = medical_history['last_updated'].isoformat()
-                
-                for analysis in medical_history.get('blood_analyses', []):
-                    if 'date_performed' in analysis and isinstance(analysis['date_performed'], datetime):
-                        analysis['date_performed'] = analysis['date_performed'].isoformat()
-                
-                for study in medical_history.get('radiology_studies', []):
-                    if 'date_performed' in study and isinstance(study['date_performed'], datetime):
-                        study['date_performed'] = study['date_performed'].isoformat()
+            patient_dict = self._patient_db_to_dict(patient_db)
             
             self.db.collection(self.patients_collection).document(patient_db.dni).set(patient_dict)
             logger.info(f"Patient {patient_db.dni} updated successfully")
@@ -118,10 +150,41 @@ class PatientRepository(FirestoreService):
             logger.error(f"Error updating patient {patient_db.dni}: {e}")
             return False
     
-    def get_all_enabled(self) -> List[PatientDB]:
-        """Obtiene todos los pacientes habilitados"""
+    def add_lab(self, patient_dni: str, kind: str, item: dict, labs: LabRepository) -> bool:
+        """Guarda un análisis/estudio en la subcolección y actualiza los metadatos del paciente en un batch"""
+        try:
+            now = datetime.now().isoformat()
+            batch = self.db.batch()
+            labs.add(patient_dni, kind, item, batch)
+            batch.update(self.db.collection(self.patients_collection).document(patient_dni), {
+                "medical_history.last_updated": now,
+                "updated_at": now
+            })
+            batch.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error adding {kind} item to patient {patient_dni}: {e}")
+            return False
+    
+    def update_last_visit(self, patient_dni: str, visit_id: str, visit_date: datetime) -> bool:
+        """Actualiza la última visita desnormalizada del paciente (sin leer ni reescribir el documento)"""
         try:
-            docs = self.db.collection(self.patients_collection).where("enabled", "==", True).get()
+            self.db.collection(self.patients_collection).document(patient_dni).update({
+                "last_visit_date": visit_date.isoformat(),
+                "last_visit_id": visit_id
+            })
+            return True
+        except Exception as e:
+            logger.error(f"Error updating last visit of patient {patient_dni}: {e}")
+            return False
+    
+    def get_all_enabled(self, fields: Optional[List[str]] = None) -> List[PatientDB]:
+        """Obtiene todos los pacientes habilitados (solo los campos indicados si se pasa fields)"""
+        try:
+            query = self.db.collection(self.patients_collection).where("enabled", "==", True)
+            if fields:
+                query = query.select(fields)
+            docs = query.get()
             patients = []
             for doc in docs:
                 patient = self._document_to_patient_db(doc)
@@ -132,20 +195,39 @@ class PatientRepository(FirestoreService):
             logger.error(f"Error getting all enabled patients: {e}")
             return []
     
-    def search_by_name(self, name: str) -> List[PatientDB]:
-        """Busca pacientes por nombre"""
+    def stream_all_enabled(self, fields: Optional[List[str]] = None) -> Iterator[PatientDB]:
+        """Recorre los pacientes habilitados con .stream(), sin materializar la colección completa"""
+        query = self.db.collection(self.patients_collection).where("enabled", "==", True)
+        if fields:
+            query = query.select(fields)
+        docs = query.stream()
+        for doc in docs:
+            patient = self._document_to_patient_db(doc)
+            if patient:
+                yield patient
+    
+    def search_by_name(self, name: str, fields: Optional[List[str]] = None) -> List[PatientDB]:
+        """Busca pacientes por prefijos de palabra del nombre, sin distinguir mayúsculas ni tildes.
+        
+        La consulta usa array_contains sobre search_tokens con el término más largo (índice
+        compuesto enabled ASC + search_tokens CONTAINS) y el resto de términos se filtra en memoria.
+        """
         try:
-            name_lower = name.lower()
-            docs = self.db.collection(self.patients_collection)\
+            terms = search_terms(name)
+            if not terms:
+                return []
+            
+            query = self.db.collection(self.patients_collection)\
                 .where("enabled", "==", True)\
-                .where("name", ">=", name_lower)\
-                .where("name", "<=", name_lower + '\uf8ff')\
-                .get()
+                .where("search_tokens", "array_contains", most_selective_term(terms))
+            if fields:
+                query = query.select(list(dict.fromkeys([*fields, "name"])))
+            docs = query.get()
             
             patients = []
             for doc in docs:
                 patient = self._document_to_patient_db(doc)
-                if patient:
+                if patient and matches_terms(patient.name, terms):
                     patients.append(patient)
             return patients
         except Exception as e:
@@ -153,20 +235,95 @@ class PatientRepository(FirestoreService):
             return []
 
 
+class AsyncPatientRepository(PatientDocumentMixin, AsyncFirestoreService):
+    """Repositorio asíncrono (AsyncClient) para operaciones de base de datos de pacientes"""
+    
+    def __init__(self, db=None):
+        super().__init__(db)
+        self.patients_collection = "patients"
+    
+    async def _get_patients(self, query) -> List[PatientDB]:
+        """Ejecuta una consulta y convierte los documentos a PatientDB"""
+        docs = await query.get()
+        patients = []
+        for doc in docs:
+            patient = self._document_to_patient_db(doc)
+            if patient:
+                patients.append(patient)
+        return patients
+    
+    async def get_by_dni(self, dni: str) -> Optional[PatientDB]:
+        """Obtiene un paciente por DNI"""
+        try:
+            doc = await self.db.collection(self.patients_collection).document(dni).get()
+            return self._document_to_patient_db(doc)
+        except Exception as e:
+            logger.error(f"Error getting patient by DNI {dni}: {e}")
+            return None
+    
+    async def get_many_by_dni(self, dnis: List[str]) -> Dict[str, PatientDB]:
+        """Obtiene varios pacientes por DNI con lecturas en lote (una por cada PATIENT_BATCH_SIZE)"""
+        unique_dnis = list(dict.fromkeys(dni for dni in dnis if dni))
+        patients = {}
+        try:
+            collection = self.db.collection(self.patients_collection)
+            for start in range(0, len(unique_dnis), PATIENT_BATCH_SIZE):
+                refs = [collection.document(dni) for dni in unique_dnis[start:start + PATIENT_BATCH_SIZE]]
+                async for doc in self.db.get_all(refs):
+                    patient = self._document_to_patient_db(doc)
+                    if patient:
+                        patients[patient.dni] = patient
+            return patients
+        except Exception as e:
+            logger.error(f"Error getting {len(unique_dnis)} patients by DNI: {e}")
+            return patients
+    
+    async def get_all_enabled(self) -> List[PatientDB]:
+        """Obtiene todos los pacientes habilitados"""
+        try:
+            return await self._get_patients(
+                self.db.collection(self.patients_collection).where("enabled", "==", True)
+            )
+        except Exception as e:
+            logger.error(f"Error getting all enabled patients: {e}")
+            return []
+    
+    async def search_by_name(self, name: str) -> List[PatientDB]:
+        """Busca pacientes por prefijos de palabra del nombre (ver PatientRepository.search_by_name)"""
+        try:
+            terms = search_terms(name)
+            if not terms:
+                return []
+            patients = await self._get_patients(
+                self.db.collection(self.patients_collection)
+                .where("enabled", "==", True)
+                .where("search_tokens", "array_contains", most_selective_term(terms))
+            )
+            return [patient for patient in patients if matches_terms(patient.name, terms)]
+        except Exception as e:
+            logger.error(f"Error searching patients by name {name}: {e}")
+            return []
+
+
 class PatientService:
     """Servicio principal para gestión de pacientes"""
     
-    def __init__(self):
-        self.repository = PatientRepository()
-        # Evitar import circular usando lazy import
-        self._visit_service = None
+    def __init__(self, repository: Optional[PatientRepository] = None, visit_service=None, lab_repository: Optional[LabRepository] = None, name_index: Optional[PatientNameIndex] = None, directory: Optional[PatientDirectory] = None):
+        self.repository = repository or PatientRepository()
+        self.labs = lab_repository or LabRepository(self.repository.db)
+        # Índice de nombres en memoria (opcional, PATIENT_SEARCH_TRIE); None -> búsqueda en Firestore
+        self.name_index = name_index
+        # Directorio sincronizado por snapshot listener (opcional, PATIENT_DIRECTORY); sustituye al índice
+        self.directory = directory
+        # Evitar import circular usando lazy import si no se inyecta
+        self._visit_service = visit_service
     
     @property
     def visit_service(self):
         """Lazy loading del visit service para evitar imports circulares"""
         if self._visit_service is None:
             from services.visits import VisitService
-            self._visit_service = VisitService()
+            self._visit_service = VisitService(patient_service=self)
         return self._visit_service
     
     def _patient_db_to_patient(self, patient_db: PatientDB) -> Patient:
@@ -182,31 +339,40 @@ class PatientService:
             updated_at=patient_db.updated_at
         )
     
+    def _blood_analysis_to_response(self, analysis: BloodAnalysis) -> BloodAnalysisResponse:
+        """Convierte BloodAnalysis a BloodAnalysisResponse"""
+        return BloodAnalysisResponse(
+            analysis_id=analysis.analysis_id,
+            date_performed=analysis.date_performed,
+            red_blood_cells=analysis.red_blood_cells,
+            hemoglobin=analysis.hemoglobin,
+            hematocrit=analysis.hematocrit,
+            platelets=analysis.platelets,
+            lymphocytes=analysis.lymphocytes,
+            glucose=analysis.glucose,
+            cholesterol=analysis.cholesterol,
+            urea=analysis.urea,
+            cocaine=analysis.cocaine,
+            alcohol=analysis.alcohol,
+            mdma=analysis.mdma,
+            fentanyl=analysis.fentanyl,
+            performed_by_dni=analysis.performed_by_dni,
+            performed_by_name=analysis.performed_by_name,
+            notes=analysis.notes,
+            visit_related_id=analysis.visit_related_id
+        )
+    
     def _patient_db_to_complete(self, patient_db: PatientDB) -> PatientComplete:
         """Convierte PatientDB a esquema PatientComplete (con historial completo)"""
+        # Análisis y estudios: embebidos y, en modo subcolección, leídos de patients/{dni}/...
+        patient_analyses = patient_db.medical_history.blood_analyses
+        patient_studies = patient_db.medical_history.radiology_studies
+        if use_lab_subcollections():
+            patient_analyses = merge_labs(patient_analyses, self.labs.list(patient_db.dni, BLOOD_ANALYSES))
+            patient_studies = merge_labs(patient_studies, self.labs.list(patient_db.dni, RADIOLOGY_STUDIES))
+        
         # Convertir análisis de sangre
-        blood_analyses = [
-            BloodAnalysisResponse(
-                analysis_id=analysis.analysis_id,
-                date_performed=analysis.date_performed,
-                red_blood_cells=analysis.red_blood_cells,
-                hemoglobin=analysis.hemoglobin,
-                hematocrit=analysis.hematocrit,
-                platelets=analysis.platelets,
-                lymphocytes=analysis.lymphocytes,
-                glucose=analysis.glucose,
-                cholesterol=analysis.cholesterol,
-                urea=analysis.urea,
-                cocaine=analysis.cocaine,
-                alcohol=analysis.alcohol,
-                mdma=analysis.mdma,
-                fentanyl=analysis.fentanyl,
-                performed_by_dni=analysis.performed_by_dni,
-                performed_by_name=analysis.performed_by_name,
-                notes=analysis.notes,
-                visit_related_id=analysis.visit_related_id
-            ) for analysis in patient_db.medical_history.blood_analyses
-        ]
+        blood_analyses = [self._blood_analysis_to_response(analysis) for analysis in patient_analyses]
         
         # Convertir estudios radiológicos
         radiology_studies = [
@@ -220,7 +386,7 @@ class PatientService:
                 performed_by_dni=study.performed_by_dni,
                 performed_by_name=study.performed_by_name,
                 visit_related_id=study.visit_related_id
-            ) for study in patient_db.medical_history.radiology_studies
+            ) for study in patient_studies
         ]
         
         # Crear historial médico completo
@@ -253,11 +419,28 @@ class PatientService:
     
     def get_patient(self, patient_dni: str) -> Optional[Patient]:
         """Obtiene un paciente básico por DNI"""
+        if self.directory is not None and self.directory.ready:
+            record = self.directory.get(patient_dni)
+            return record.to_patient() if record else None
+        
         patient_db = self.repository.get_by_dni(patient_dni)
         if patient_db and patient_db.enabled:
             return self._patient_db_to_patient(patient_db)
         return None
     
+    def get_patient_names(self, patient_dnis: List[str]) -> Dict[str, str]:
+        """Nombres de pacientes habilitados por DNI (directorio en memoria o una lectura en lote)"""
+        if self.directory is not None and self.directory.ready:
+            names = {}
+            for dni in patient_dnis:
+                record = self.directory.get(dni)
+                if record is not None:
+                    names[dni] = record.name
+            return names
+        
+        patients = self.repository.get_many_by_dni(patient_dnis, fields=PATIENT_BASIC_FIELDS)
+        return {dni: patient.name for dni, patient in patients.items() if patient.enabled}
+    
     def get_patient_complete(self, patient_dni: str) -> Optional[PatientComplete]:
         """Obtiene un paciente completo con historial médico por DNI"""
         patient_db = self.repository.get_by_dni(patient_dni)
@@ -265,6 +448,30 @@ class PatientService:
             return self._patient_db_to_complete(patient_db)
         return None
     
+    def get_latest_blood_analysis(self, patient_dni: str) -> Optional[BloodAnalysisResponse]:
+        """Análisis de sangre más reciente del paciente, o None si no existe el paciente o no tiene"""
+        patient_db = self.repository.get_by_dni(patient_dni, fields=PATIENT_BLOOD_ANALYSES_FIELDS)
+        if not patient_db or not patient_db.enabled:
+            return None
+        
+        analysis = patient_db.get_latest_blood_analysis()
+        if use_lab_subcollections():
+            # Una consulta con limit(1); el array embebido solo tiene datos en pacientes sin migrar
+            latest = self.labs.latest(patient_dni, BLOOD_ANALYSES)
+            analysis = next(iter(merge_labs([item for item in (analysis, latest) if item])), None)
+        return self._blood_analysis_to_response(analysis) if analysis else None
+    
+    def get_blood_analyses_by_visit(self, patient_dni: str, visit_id: str) -> Optional[List[BloodAnalysisResponse]]:
+        """Análisis de sangre del paciente asociados a una visita, más recientes primero"""
+        patient_db = self.repository.get_by_dni(patient_dni, fields=PATIENT_BLOOD_ANALYSES_FIELDS)
+        if not patient_db or not patient_db.enabled:
+            return None
+        
+        groups = [patient_db.get_blood_analyses_by_visit(visit_id)]
+        if use_lab_subcollections():
+            groups.append(self.labs.list_by_visit(patient_dni, BLOOD_ANALYSES, visit_id))
+        return [self._blood_analysis_to_response(analysis) for analysis in merge_labs(*groups)]
+    
     def create_patient(self, patient_create: PatientCreate, created_by: Optional[str] = None) -> Optional[Patient]:
         """Crea un nuevo paciente"""
         # Verificar si ya existe
@@ -296,6 +503,7 @@ class PatientService:
         )
         
         if self.repository.create(patient_db):
+            self._index_patient(patient_db)
             return self._patient_db_to_patient(patient_db)
         return None
     
@@ -307,6 +515,7 @@ class PatientService:
         
         # Actualizar campos básicos
         update_data = patient_update.model_dump(exclude_unset=True)
+        previous_name = patient_db.name
         for field, value in update_data.items():
             if value is not None:
                 setattr(patient_db, field, value)
@@ -314,6 +523,9 @@ class PatientService:
         patient_db.update_timestamp(updated_by)
         
         if self.repository.update(patient_db):
+            self._index_patient(patient_db)
+            if patient_db.name != previous_name:
+                self.visit_service.admitted_board.update_patient(patient_dni, name=patient_db.name)
             return self._patient_db_to_patient(patient_db)
         return None
     
@@ -334,6 +546,7 @@ class PatientService:
         patient_db.update_timestamp(updated_by)
         
         if self.repository.update(patient_db):
+            self._index_patient(patient_db)
             complete_patient = self._patient_db_to_complete(patient_db)
             return complete_patient.medical_history
         return None
@@ -363,9 +576,14 @@ class PatientService:
             performed_by_name=performed_by_name
         )
         
-        patient_db.add_blood_analysis(analysis, visit_id)
+        if use_lab_subcollections():
+            analysis.visit_related_id = visit_id or analysis.visit_related_id
+            saved = self.repository.add_lab(patient_dni, BLOOD_ANALYSES, analysis.model_dump(mode="json"), self.labs)
+        else:
+            patient_db.add_blood_analysis(analysis, visit_id)
+            saved = self.repository.update(patient_db)
         
-        if self.repository.update(patient_db):
+        if saved:
             return BloodAnalysisResponse(
                 analysis_id=analysis.analysis_id,
                 date_performed=analysis.date_performed,
@@ -404,9 +622,14 @@ class PatientService:
             performed_by_name=performed_by_name
         )
         
-        patient_db.add_radiology_study(study, visit_id)
+        if use_lab_subcollections():
+            study.visit_related_id = visit_id or study.visit_related_id
+            saved = self.repository.add_lab(patient_dni, RADIOLOGY_STUDIES, study.model_dump(mode="json"), self.labs)
+        else:
+            patient_db.add_radiology_study(study, visit_id)
+            saved = self.repository.update(patient_db)
         
-        if self.repository.update(patient_db):
+        if saved:
             return RadiologyStudyResponse(
                 study_id=study.study_id,
                 date_performed=study.date_performed,
@@ -430,63 +653,99 @@ class PatientService:
         patient_db.disabled_by = disabled_by
         patient_db.update_timestamp(disabled_by)
         
-        return self.repository.update(patient_db)
+        if self.repository.update(patient_db):
+            if self.name_index is not None:
+                self.name_index.remove(patient_dni)
+            if self.directory is not None:
+                self.directory.remove(patient_dni)
+            self.visit_service.admitted_board.update_patient(patient_dni, remove=True)
+            return True
+        return False
     
     def get_all_patients(self) -> List[PatientSummary]:
         """Obtiene todos los pacientes habilitados como resumen"""
-        patients_db = self.repository.get_all_enabled()
-        
-        # TODO: Obtener fecha de última visita para cada paciente
-        summaries = []
-        for patient_db in patients_db:
-            summaries.append(PatientSummary(
-                name=patient_db.name,
-                dni=patient_db.dni,
-                age=patient_db.age,
-                sex=patient_db.sex,
-                blood_type=patient_db.blood_type,
-                allergies=patient_db.medical_history.allergies,
-                last_visit=None  # TODO: Implementar consulta de última visita
-            ))
-        
-        return summaries
+        patients_db = self.repository.get_all_enabled(fields=PATIENT_SUMMARY_FIELDS)
+        
+        return [self._patient_db_to_summary(patient_db) for patient_db in patients_db]
+    
+    def iter_all_patients(self) -> Iterator[PatientSummary]:
+        """Genera los pacientes habilitados como resumen a medida que llegan (exportaciones en streaming)"""
+        for patient_db in self.repository.stream_all_enabled(fields=PATIENT_SUMMARY_FIELDS):
+            yield self._patient_db_to_summary(patient_db)
+    
+    def _patient_db_to_summary(self, patient_db: PatientDB) -> PatientSummary:
+        """Convierte PatientDB a PatientSummary"""
+        return PatientSummary(
+            name=patient_db.name,
+            dni=patient_db.dni,
+            age=patient_db.age,
+            sex=patient_db.sex,
+            blood_type=patient_db.blood_type,
+            allergies=patient_db.medical_history.allergies,
+            last_visit=patient_db.last_visit_date
+        )
     
     def search_patients(self, name: str) -> List[PatientSummary]:
-        """Busca pacientes por nombre"""
-        patients_db = self.repository.search_by_name(name)
-        
-        summaries = []
-        for patient_db in patients_db:
-            summaries.append(PatientSummary(
-                name=patient_db.name,
-                dni=patient_db.dni,
-                age=patient_db.age,
-                sex=patient_db.sex,
-                blood_type=patient_db.blood_type,
-                last_visit=None  # TODO: Implementar consulta de última visita
-            ))
-        
-        return summaries
+        """Busca pacientes por nombre (directorio o índice en memoria si están cargados, si no Firestore)"""
+        if self.directory is not None and self.directory.ready:
+            return [record.to_summary() for record in self.directory.search(search_terms(name))]
+        if self.name_index is not None and self.name_index.ready:
+            results = self.name_index.search(search_terms(name))
+            # Entre recargas el índice no ve los pacientes creados en otros procesos: sin resultados se confirma en Firestore
+            if results:
+                return results
+        
+        patients_db = self.repository.search_by_name(name, fields=PATIENT_SUMMARY_FIELDS)
+        return [self._patient_db_to_summary(patient_db) for patient_db in patients_db]
+    
+    def warm_search_index(self) -> int:
+        """Carga el índice de nombres con todos los pacientes habilitados (arranque)"""
+        if self.name_index is None:
+            return 0
+        self.name_index.load(self.iter_all_patients())
+        # Recarga periódica para recoger las altas y cambios hechos por otros workers o instancias
+        self.name_index.start_reloading(self.iter_all_patients)
+        return len(self.name_index)
+    
+    def _index_patient(self, patient_db: PatientDB):
+        """Refleja en el índice de nombres y el directorio una escritura de este proceso"""
+        if self.name_index is not None and patient_db.enabled:
+            self.name_index.upsert(self._patient_db_to_summary(patient_db))
+        if self.directory is not None:
+            self.directory.upsert(patient_db)
+    
+    def note_last_visit(self, patient_dni: str, visit_date: datetime):
+        """Refleja en memoria la última visita ya guardada por VisitService"""
+        if self.directory is not None:
+            self.directory.set_last_visit(patient_dni, visit_date)
+        if self.name_index is not None:
+            summary = self.name_index.get(patient_dni)
+            if summary is not None:
+                self.name_index.upsert(summary.model_copy(update={"last_visit": visit_date}))
     
     def get_admitted_patients(self) -> List[PatientAdmitted]:
         """Obtiene todos los pacientes admitidos"""
         admitted_visits = self.visit_service.get_all_visits_by_status(VisitStatus.ADMISSION)
+        # Un único lote de lecturas para todos los pacientes, unido en memoria con las visitas
+        patients_db = self.repository.get_many_by_dni(
+            [visit.patient_dni for visit in admitted_visits], fields=PATIENT_BASIC_FIELDS
+        )
         admitted_patients = []
         
         for visit in admitted_visits:
-            patient = self.get_patient(visit.patient_dni)
-            if patient:
-                admitted_patients.append(PatientAdmitted(
-                    name=patient.name,
-                    dni=patient.dni,
-                    visit_id=visit.visit_id,
-                    reason=visit.reason,
-                    attention_place=visit.attention_place,
-                    attention_details=visit.attention_details,
-                    triage=visit.triage,
-                    doctor_dni=visit.doctor_dni,
-                    doctor_name=visit.doctor_name,
-                    admission_date=visit.created_at
-                ))
-        
-        return admitted_patients
\ No newline at end of file
+            patient = patients_db.get(visit.patient_dni)
+            if patient and patient.enabled:
+                admitted_patients.append(build_admitted_entry(patient.name, visit))
+        
+        return admitted_patients
+    
+    def get_admitted_board(self) -> Tuple[List[PatientAdmitted], str]:
+        """Pacientes admitidos desde la proyección materializada (una lectura) y su ETag"""
+        board = self.visit_service.admitted_board.get()
+        if board is not None:
+            return board
+        
+        # Primer uso (o tablero borrado): se reconstruye a partir de las visitas
+        admitted_patients = self.get_admitted_patients()
+        etag = self.visit_service.admitted_board.rebuild(admitted_patients)
+        return admitted_patients, etag
\ No newline at end of file
@@ -0,0 +1,217 @@
+from models.patient import PatientDB
+from schemas import Patient, PatientSummary
+from services.search import PatientNameIndex
+from typing import Any, List, Optional, Tuple
+from datetime import datetime
+import threading
+import logging
+import time
+import sys
+import os
+
+logger = logging.getLogger(__name__)
+
+# Directorio de pacientes en memoria mantenido por un snapshot listener (desactivado por defecto)
+PATIENT_DIRECTORY_ENABLED = os.getenv("PATIENT_DIRECTORY", "false").lower() == "true"
+
+# Presupuesto de memoria estimada; si se supera el directorio se desactiva y se vuelve a Firestore
+PATIENT_DIRECTORY_MAX_MB = float(os.getenv("PATIENT_DIRECTORY_MAX_MB", "256"))
+
+
+class PatientRecord:
+    """Campos de Patient y PatientSummary de un paciente habilitado, sin historial médico"""
+
+    __slots__ = (
+        "dni", "name", "age", "sex", "phone", "blood_type", "allergies",
+        "last_visit_date", "created_at", "updated_at"
+    )
+
+    def __init__(self, patient_db: PatientDB):
+        self.dni: str = patient_db.dni
+        self.name: str = patient_db.name
+        self.age: int = patient_db.age
+        self.sex = patient_db.sex
+        self.phone: Optional[str] = patient_db.phone
+        self.blood_type = patient_db.blood_type
+        self.allergies: Tuple[str, ...] = tuple(patient_db.medical_history.allergies or ())
+        self.last_visit_date: Optional[datetime] = patient_db.last_visit_date
+        self.created_at: datetime = patient_db.created_at
+        self.updated_at: datetime = patient_db.updated_at
+
+    def to_patient(self) -> Patient:
+        return Patient(
+            name=self.name,
+            dni=self.dni,
+            age=self.age,
+            sex=self.sex,
+            phone=self.phone,
+            blood_type=self.blood_type,
+            created_at=self.created_at,
+            updated_at=self.updated_at
+        )
+
+    def to_summary(self) -> PatientSummary:
+        return PatientSummary(
+            name=self.name,
+            dni=self.dni,
+            age=self.age,
+            sex=self.sex,
+            blood_type=self.blood_type,
+            allergies=list(self.allergies),
+            last_visit=self.last_visit_date
+        )
+
+    def estimated_size(self) -> int:
+        """Tamaño aproximado en bytes (registro, atributos y alergias)"""
+        size = sys.getsizeof(self)
+        for attr in self.__slots__:
+            size += sys.getsizeof(getattr(self, attr))
+        return size + sum(sys.getsizeof(allergy) for allergy in self.allergies)
+
+
+class PatientDirectory:
+    """Pacientes habilitados por DNI, en memoria y sincronizados con un snapshot listener.
+
+    La primera instantánea del listener hace la carga completa; después solo llegan los cambios.
+    Mientras no está listo (o si supera el presupuesto de memoria) ready es False y
+    PatientService consulta Firestore como siempre. Las escrituras de este proceso se aplican
+    también directamente para que se lean al momento, sin esperar al listener.
+    """
+
+    def __init__(self, max_bytes: int = int(PATIENT_DIRECTORY_MAX_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self.name_index = PatientNameIndex()
+        self._sizes = {}
+        self._estimated_bytes = 0
+        self._lock = threading.Lock()
+        self._watch: Any = None
+        self._to_patient_db = None
+        self.ready = False
+        self.over_budget = False
+        self.last_snapshot_at: Optional[float] = None
+        self.last_read_time: Optional[datetime] = None
+        self.last_snapshot_lag: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self.name_index)
+
+    def get(self, dni: str) -> Optional[PatientRecord]:
+        return self.name_index.get(dni)
+
+    def search(self, terms: List[str]) -> List[PatientRecord]:
+        return self.name_index.search(terms)
+
+    def upsert(self, patient_db: PatientDB):
+        """Aplica un paciente (escritura local o cambio recibido); los deshabilitados se quitan"""
+        if not patient_db.enabled:
+            self.remove(patient_db.dni)
+            return
+        record = PatientRecord(patient_db)
+        size = record.estimated_size()
+        with self._lock:
+            self._estimated_bytes += size - self._sizes.get(record.dni, 0)
+            self._sizes[record.dni] = size
+        self.name_index.upsert(record)
+        self._check_budget()
+
+    def remove(self, dni: str):
+        with self._lock:
+            self._estimated_bytes -= self._sizes.pop(dni, 0)
+        self.name_index.remove(dni)
+
+    def set_last_visit(self, dni: str, visit_date: datetime):
+        """Actualiza la última visita de un registro (escritura local desde VisitService)"""
+        record = self.get(dni)
+        if record is not None:
+            record.last_visit_date = visit_date
+
+    def _check_budget(self):
+        if self.over_budget or self._estimated_bytes <= self.max_bytes:
+            return
+        self.over_budget = True
+        self.ready = False
+        logger.error(
+            f"Patient directory exceeded its memory budget ({self._estimated_bytes} > {self.max_bytes} bytes); "
+            "falling back to Firestore"
+        )
+        # Puede ocurrir dentro del callback del listener: se detiene desde otro hilo
+        threading.Thread(target=self.stop, daemon=True).start()
+        self.name_index.load([])
+        with self._lock:
+            self._sizes = {}
+            self._estimated_bytes = 0
+
+    # Sincronización con Firestore
+
+    def start(self, repository):
+        """Abre el snapshot listener sobre los pacientes habilitados (carga inicial incluida)"""
+        if self._watch is not None or self.over_budget:
+            return
+        self._to_patient_db = repository._document_to_patient_db
+        try:
+            self._watch = repository.db.collection(repository.patients_collection)\
+                .where("enabled", "==", True)\
+                .on_snapshot(self._on_snapshot)
+            logger.info("Patient directory snapshot listener started")
+        except Exception as e:
+            logger.error(f"Error starting patient directory listener: {e}")
+            self._watch = None
+
+    def stop(self):
+        """Detiene el snapshot listener"""
+        if self._watch is None:
+            return
+        try:
+            self._watch.unsubscribe()
+        except Exception as e:
+            logger.warning(f"Error stopping patient directory listener: {e}")
+        self._watch = None
+
+    def _on_snapshot(self, doc_snapshots, changes, read_time):
+        if self.over_budget:
+            return
+        try:
+            if not self.ready:
+                # Primera instantánea: el conjunto completo de pacientes habilitados
+                self.name_index.load([])
+                with self._lock:
+                    self._sizes = {}
+                    self._estimated_bytes = 0
+                for doc in doc_snapshots:
+                    patient_db = self._to_patient_db(doc)
+                    if patient_db:
+                        self.upsert(patient_db)
+                    if self.over_budget:
+                        return
+                self.ready = True
+                logger.info(f"Patient directory loaded with {len(self)} patients")
+            else:
+                for change in changes:
+                    if change.type.name == "REMOVED":
+                        self.remove(change.document.id)
+                        continue
+                    patient_db = self._to_patient_db(change.document)
+                    if patient_db:
+                        self.upsert(patient_db)
+            self.last_snapshot_at = time.time()
+            self.last_read_time = read_time
+            if read_time is not None:
+                self.last_snapshot_lag = max(0.0, self.last_snapshot_at - read_time.timestamp())
+        except Exception as e:
+            logger.error(f"Error applying patient directory snapshot: {e}")
+
+    def stats(self) -> dict:
+        """Tamaño, memoria estimada y frescura del directorio"""
+        return {
+            "enabled": True,
+            "ready": self.ready,
+            "listener_active": self._watch is not None,
+            "over_budget": self.over_budget,
+            "patients": len(self),
+            "estimated_bytes": self._estimated_bytes,
+            "max_bytes": self.max_bytes,
+            "last_read_time": self.last_read_time.isoformat() if self.last_read_time else None,
+            # Segundos desde el último cambio aplicado y retraso de entrega de esa instantánea
+            "seconds_since_last_snapshot": round(time.time() - self.last_snapshot_at, 3) if self.last_snapshot_at else None,
+            "snapshot_lag_seconds": round(self.last_snapshot_lag, 3) if self.last_snapshot_lag is not None else None
+        }
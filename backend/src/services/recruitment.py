@@ -13,8 +13,8 @@ logger = logging.getLogger(__name__)
 class RecruitmentService(FirestoreService):
     """Servicio para gestionar reclutamientos"""
     
-    def __init__(self):
-        super().__init__()
+    def __init__(self, db=None):
+        super().__init__(db)
         self.medical_recruitments_collection = "medical_recruitments"
         self.police_recruitments_collection = "police_recruitments"
         self.discord_webhook_url = os.getenv("DISCORD_WEBHOOK_URL")
@@ -0,0 +1,204 @@
+from schemas import PatientSummary
+from typing import Callable, Dict, Iterable, List, Optional, Set
+import threading
+import unicodedata
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Longitud máxima de los prefijos guardados por palabra (consultas más largas se recortan)
+SEARCH_MAX_PREFIX = int(os.getenv("SEARCH_MAX_PREFIX", "15"))
+
+# Índice en memoria (trie) para búsquedas de nombre tipo "type-ahead"; se carga al arrancar.
+# Sin PATIENT_DIRECTORY solo ve al momento las escrituras de su propio proceso: con varios workers
+# o instancias los pacientes creados en otro se ven tras la siguiente recarga periódica, y mientras
+# tanto una búsqueda sin resultados en el índice se consulta en Firestore. Con PATIENT_DIRECTORY
+# se usa en su lugar el índice del directorio, sincronizado por snapshot listener.
+PATIENT_SEARCH_TRIE = os.getenv("PATIENT_SEARCH_TRIE", "false").lower() == "true"
+
+# Segundos entre recargas completas del trie (0 desactiva la recarga: solo para un único proceso)
+PATIENT_SEARCH_TRIE_RELOAD_SECONDS = float(os.getenv("PATIENT_SEARCH_TRIE_RELOAD_SECONDS", "300"))
+
+_NON_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Minúsculas, sin tildes ni signos: "José  Pérez-Núñez" -> "jose perez nunez" """
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_ALPHANUMERIC.sub(" ", folded).strip()
+
+
+def search_terms(text: Optional[str]) -> List[str]:
+    """Palabras normalizadas de una consulta, recortadas a la longitud de prefijo indexada"""
+    return [word[:SEARCH_MAX_PREFIX] for word in normalize_text(text).split()]
+
+
+def build_search_tokens(name: Optional[str]) -> List[str]:
+    """Prefijos de cada palabra del nombre (campo search_tokens, consultado con array_contains)"""
+    tokens = set()
+    for word in normalize_text(name).split():
+        for length in range(1, min(len(word), SEARCH_MAX_PREFIX) + 1):
+            tokens.add(word[:length])
+    return sorted(tokens)
+
+
+def matches_terms(name: Optional[str], terms: List[str]) -> bool:
+    """Cada término es prefijo de alguna palabra del nombre (en cualquier orden)"""
+    words = normalize_text(name).split()
+    return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+def most_selective_term(terms: List[str]) -> str:
+    """Término que se usa en la consulta indexada; el resto se filtra en memoria"""
+    return max(terms, key=len)
+
+
+class _TrieNode:
+    __slots__ = ("children", "keys")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.keys: Optional[Set[str]] = None
+
+
+class PatientNameIndex:
+    """Trie de palabras de nombre -> DNI con el resumen de cada paciente habilitado.
+
+    Responde las búsquedas sin acceder a Firestore. Se carga con load() al arrancar, se
+    mantiene con upsert()/remove() desde las escrituras de PatientService de este proceso y,
+    con start_reloading(), se recarga entera cada cierto tiempo para recoger las de otros.
+    Los valores son PatientSummary o cualquier registro con dni y name (PatientDirectory).
+    """
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._summaries: Dict[str, PatientSummary] = {}
+        self._lock = threading.Lock()
+        self._stop_reload = threading.Event()
+        self._reload_thread: Optional[threading.Thread] = None
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._summaries)
+
+    def load(self, summaries: Iterable[PatientSummary]):
+        """Reemplaza el contenido del índice (carga inicial)"""
+        root = _TrieNode()
+        loaded: Dict[str, PatientSummary] = {}
+        for summary in summaries:
+            loaded[summary.dni] = summary
+            for word in set(normalize_text(summary.name).split()):
+                self._insert(root, word, summary.dni)
+        with self._lock:
+            self._root = root
+            self._summaries = loaded
+            self.ready = True
+
+    def start_reloading(self, loader: Callable[[], Iterable[PatientSummary]], interval: float = PATIENT_SEARCH_TRIE_RELOAD_SECONDS):
+        """Recarga el índice con loader() cada interval segundos en un hilo en segundo plano"""
+        if self._reload_thread is not None or interval <= 0:
+            return
+        self._stop_reload.clear()
+
+        def _reload_loop():
+            while not self._stop_reload.wait(interval):
+                try:
+                    self.load(loader())
+                    logger.info(f"Patient name index reloaded ({len(self)} patients)")
+                except Exception as e:
+                    logger.error(f"Error reloading patient name index: {e}")
+
+        self._reload_thread = threading.Thread(target=_reload_loop, name="patient-name-index-reload", daemon=True)
+        self._reload_thread.start()
+
+    def stop_reloading(self):
+        """Detiene la recarga periódica"""
+        if self._reload_thread is None:
+            return
+        self._stop_reload.set()
+        self._reload_thread = None
+
+    def upsert(self, summary: PatientSummary):
+        """Añade o actualiza un paciente (reindexa el nombre si ha cambiado)"""
+        with self._lock:
+            previous = self._summaries.get(summary.dni)
+            if previous is not None and previous.name != summary.name:
+                self._unindex(previous)
+            if previous is None or previous.name != summary.name:
+                for word in set(normalize_text(summary.name).split()):
+                    self._insert(self._root, word, summary.dni)
+            self._summaries[summary.dni] = summary
+
+    def remove(self, dni: str):
+        """Quita un paciente (baja)"""
+        with self._lock:
+            previous = self._summaries.pop(dni, None)
+            if previous is not None:
+                self._unindex(previous)
+
+    def get(self, dni: str) -> Optional[PatientSummary]:
+        with self._lock:
+            return self._summaries.get(dni)
+
+    def search(self, terms: List[str]) -> List[PatientSummary]:
+        """Pacientes cuyo nombre contiene todos los términos como prefijos de palabra"""
+        if not terms:
+            return []
+        with self._lock:
+            node = self._root
+            for char in most_selective_term(terms):
+                node = node.children.get(char)
+                if node is None:
+                    return []
+            dnis = self._collect(node)
+            results = [
+                self._summaries[dni] for dni in dnis
+                if len(terms) == 1 or matches_terms(self._summaries[dni].name, terms)
+            ]
+        return sorted(results, key=lambda summary: normalize_text(summary.name))
+
+    @staticmethod
+    def _insert(root: _TrieNode, word: str, dni: str):
+        node = root
+        for char in word:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _TrieNode()
+            node = child
+        if node.keys is None:
+            node.keys = set()
+        node.keys.add(dni)
+
+    def _unindex(self, summary: PatientSummary):
+        """Quita el DNI de las palabras del nombre anterior y poda las ramas vacías"""
+        for word in set(normalize_text(summary.name).split()):
+            path = [self._root]
+            for char in word:
+                node = path[-1].children.get(char)
+                if node is None:
+                    break
+                path.append(node)
+            else:
+                if path[-1].keys:
+                    path[-1].keys.discard(summary.dni)
+                for depth in range(len(word), 0, -1):
+                    node = path[depth]
+                    if node.keys or node.children:
+                        break
+                    del path[depth - 1].children[word[depth - 1]]
+
+    @staticmethod
+    def _collect(node: _TrieNode) -> Set[str]:
+        found: Set[str] = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.keys:
+                found.update(current.keys)
+            stack.extend(current.children.values())
+        return found
@@ -0,0 +1,68 @@
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from services.executor import run_in_executor
+from typing import AsyncIterator, Iterable, Iterator, List
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Documentos que se leen, convierten y serializan en cada salto al pool de Firestore
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "200"))
+
+
+def wants_ndjson(request: Request) -> bool:
+    """El cliente pide NDJSON (una línea JSON por elemento) en vez de un array JSON"""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def _next_chunk(iterator: Iterator[BaseModel], size: int) -> List[str]:
+    """Avanza el generador (lecturas de Firestore incluidas) y serializa hasta size elementos"""
+    chunk = []
+    for item in iterator:
+        chunk.append(item.model_dump_json())
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+async def _iterate_serialized(items: Iterable[BaseModel], chunk_size: int) -> AsyncIterator[List[str]]:
+    """Recorre un generador bloqueante por bloques en el pool de Firestore sin bloquear el event loop"""
+    iterator = iter(items)
+    while True:
+        chunk = await run_in_executor(_next_chunk, iterator, chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def streaming_json_response(items: Iterable[BaseModel], ndjson: bool = False, chunk_size: int = STREAM_CHUNK_SIZE) -> StreamingResponse:
+    """Respuesta en streaming (NDJSON o array JSON por trozos) con memoria acotada al tamaño de bloque"""
+
+    async def ndjson_body():
+        try:
+            async for chunk in _iterate_serialized(items, chunk_size):
+                yield "\n".join(chunk) + "\n"
+        except Exception as e:
+            # Las cabeceras ya se enviaron: se corta el cuerpo y se registra el error
+            logger.error(f"Error streaming NDJSON response: {e}")
+
+    async def json_array_body():
+        yield "["
+        first = True
+        try:
+            async for chunk in _iterate_serialized(items, chunk_size):
+                yield ("" if first else ",") + ",".join(chunk)
+                first = False
+        except Exception as e:
+            # Sin el "]" final el cliente recibe un JSON inválido en lugar de una lista truncada
+            logger.error(f"Error streaming JSON response: {e}")
+            return
+        yield "]"
+
+    if ndjson:
+        return StreamingResponse(ndjson_body(), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(json_array_body(), media_type="application/json")
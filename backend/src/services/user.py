@@ -7,6 +7,8 @@ from schemas.user import (
     UserSearchFilters
 )
 from schemas.enums import UserRole
+from auth.tokens import token_cache
+from auth.principal_cache import principal_cache
 from firebase_admin import auth
 from typing import Optional, List, Dict, Any
 from datetime import datetime
@@ -17,14 +19,8 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-class UserRepository(FirestoreService):
-    """Repositorio para operaciones de base de datos de usuarios"""
-    
-    def __init__(self):
-        super().__init__()
-        self.users_collection = "users"
-        self.doctors_collection = "doctors"
-        self.police_collection = "police"
+class UserDocumentMixin:
+    """Conversión entre documentos de Firestore y UserDB/perfiles"""
     
     def _document_to_user_db(self, doc) -> Optional[UserDB]:
         """Convierte un documento de Firestore a UserDB"""
@@ -46,6 +42,41 @@ class UserRepository(FirestoreService):
             logger.error(f"Error converting document to UserDB: {e}")
             return None
     
+    def _user_db_to_dict(self, user_db: UserDB) -> dict:
+        """Convierte UserDB a diccionario con timestamps como strings ISO"""
+        user_dict = user_db.model_dump()
+        for field in ['created_at', 'updated_at']:
+            if field in user_dict and isinstance(user_dict[field], datetime):
+                user_dict[field] = user_dict[field].isoformat()
+        return user_dict
+    
+    def _parse_profile_data(self, data: dict) -> dict:
+        """Convierte los timestamps de un perfil (doctor/policía) de string a datetime"""
+        for field in ['created_at', 'updated_at']:
+            if field in data and isinstance(data[field], str):
+                try:
+                    data[field] = datetime.fromisoformat(data[field].replace('Z', '+00:00'))
+                except ValueError:
+                    data[field] = datetime.now()
+        return data
+    
+    def _invalidate_cached_user(self, user_db: UserDB):
+        """Invalida las cachés de autenticación tras modificar un usuario"""
+        principal_cache.invalidate_uid(user_db.firebase_uid)
+        if not user_db.enabled:
+            # Un usuario deshabilitado no puede seguir usando tokens en caché
+            token_cache.invalidate_user(user_db.firebase_uid)
+
+
+class UserRepository(UserDocumentMixin, FirestoreService):
+    """Repositorio para operaciones de base de datos de usuarios"""
+    
+    def __init__(self, db=None):
+        super().__init__(db)
+        self.users_collection = "users"
+        self.doctors_collection = "doctors"
+        self.police_collection = "police"
+    
     def get_user_by_firebase_uid(self, firebase_uid: str) -> Optional[UserDB]:
         """Obtiene un usuario por Firebase UID"""
         try:
@@ -69,10 +100,7 @@ class UserRepository(FirestoreService):
     def create_user(self, user_db: UserDB) -> bool:
         """Crea un nuevo usuario"""
         try:
-            user_dict = user_db.model_dump()
-            for field in ['created_at', 'updated_at']:
-                if field in user_dict and isinstance(user_dict[field], datetime):
-                    user_dict[field] = user_dict[field].isoformat()
+            user_dict = self._user_db_to_dict(user_db)
             
             self.db.collection(self.users_collection).document(user_db.dni).set(user_dict)
             logger.info(f"User {user_db.dni} created successfully")
@@ -85,12 +113,10 @@ class UserRepository(FirestoreService):
         """Actualiza un usuario existente"""
         try:
             user_db.update_timestamp()
-            user_dict = user_db.model_dump()
-            for field in ['created_at', 'updated_at']:
-                if field in user_dict and isinstance(user_dict[field], datetime):
-                    user_dict[field] = user_dict[field].isoformat()
+            user_dict = self._user_db_to_dict(user_db)
             
             self.db.collection(self.users_collection).document(user_db.dni).set(user_dict)
+            self._invalidate_cached_user(user_db)
             logger.info(f"User {user_db.dni} updated successfully")
             return True
         except Exception as e:
@@ -102,6 +128,7 @@ class UserRepository(FirestoreService):
         try:
             doctor_dict = doctor_db.model_dump()
             self.db.collection(self.doctors_collection).document(doctor_db.user_id).set(doctor_dict)
+            principal_cache.invalidate_user_id(doctor_db.user_id)
             logger.info(f"Doctor {doctor_db.user_id} updated successfully")
             return True
         except Exception as e:
@@ -113,6 +140,7 @@ class UserRepository(FirestoreService):
         try:
             police_dict = police_db.model_dump()
             self.db.collection(self.police_collection).document(police_db.user_id).set(police_dict)
+            principal_cache.invalidate_user_id(police_db.user_id)
             logger.info(f"Police {police_db.user_id} updated successfully")
             return True
         except Exception as e:
@@ -204,8 +232,8 @@ class UserRepository(FirestoreService):
 class UserService:
     """Servicio principal para gestión de usuarios"""
     
-    def __init__(self):
-        self.repository = UserRepository()
+    def __init__(self, repository: Optional[UserRepository] = None):
+        self.repository = repository or UserRepository()
     
     def _user_db_to_user(self, user_db: UserDB) -> User:
         """Convierte UserDB a esquema User"""
@@ -225,64 +253,84 @@ class UserService:
     
     def get_user_by_firebase_uid(self, firebase_uid: str) -> Optional[User]:
         """Obtiene un usuario por Firebase UID"""
+        cached_user = principal_cache.get("user", firebase_uid)
+        if cached_user:
+            return cached_user
+        
         user_db = self.repository.get_user_by_firebase_uid(firebase_uid)
         if user_db and user_db.enabled:
-            return self._user_db_to_user(user_db)
+            user = self._user_db_to_user(user_db)
+            principal_cache.put("user", firebase_uid, user)
+            return user
         return None
     
     def get_doctor_by_firebase_uid(self, firebase_uid: str) -> Optional[Doctor]:
         """Obtiene un doctor completo por Firebase UID"""
-        user_db = self.repository.get_user_by_firebase_uid(firebase_uid)
-        if not user_db or not user_db.enabled or user_db.role != UserRole.DOCTOR:
+        cached_doctor = principal_cache.get("doctor", firebase_uid)
+        if cached_doctor:
+            return cached_doctor
+        
+        # Reutiliza el usuario base cacheado si existe
+        user = self.get_user_by_firebase_uid(firebase_uid)
+        if not user or user.role != UserRole.DOCTOR:
             return None
         
-        doctor_profile = self.repository.get_doctor_profile(user_db.user_id)
+        doctor_profile = self.repository.get_doctor_profile(user.user_id)
         
-        return Doctor(
-            user_id=user_db.user_id,
-            firebase_uid=user_db.firebase_uid,
-            name=user_db.name,
-            dni=user_db.dni,
-            email=user_db.email,
-            phone=user_db.phone,
-            role=user_db.role,
-            enabled=user_db.enabled,
-            is_admin=user_db.is_admin,
-            created_at=user_db.created_at,
-            updated_at=user_db.updated_at,
+        doctor = Doctor(
+            user_id=user.user_id,
+            firebase_uid=user.firebase_uid,
+            name=user.name,
+            dni=user.dni,
+            email=user.email,
+            phone=user.phone,
+            role=user.role,
+            enabled=user.enabled,
+            is_admin=user.is_admin,
+            created_at=user.created_at,
+            updated_at=user.updated_at,
             specialty=doctor_profile.specialty if doctor_profile else None,
             medical_license=doctor_profile.medical_license if doctor_profile else None,
             institution=doctor_profile.institution if doctor_profile else None,
             years_experience=doctor_profile.years_experience if doctor_profile else None,
             roles=doctor_profile.roles if doctor_profile and doctor_profile.roles else []
         )
+        principal_cache.put("doctor", firebase_uid, doctor)
+        return doctor
     
     def get_police_by_firebase_uid(self, firebase_uid: str) -> Optional[Police]:
         """Obtiene un policía completo por Firebase UID"""
-        user_db = self.repository.get_user_by_firebase_uid(firebase_uid)
-        if not user_db or not user_db.enabled or user_db.role != UserRole.POLICE:
+        cached_police = principal_cache.get("police", firebase_uid)
+        if cached_police:
+            return cached_police
+        
+        # Reutiliza el usuario base cacheado si existe
+        user = self.get_user_by_firebase_uid(firebase_uid)
+        if not user or user.role != UserRole.POLICE:
             return None
         
-        police_profile = self.repository.get_police_profile(user_db.user_id)
+        police_profile = self.repository.get_police_profile(user.user_id)
         
-        return Police(
-            user_id=user_db.user_id,
-            firebase_uid=user_db.firebase_uid,
-            name=user_db.name,
-            dni=user_db.dni,
-            email=user_db.email,
-            phone=user_db.phone,
-            role=user_db.role,
-            enabled=user_db.enabled,
-            is_admin=user_db.is_admin,
-            created_at=user_db.created_at,
-            updated_at=user_db.updated_at,
+        police = Police(
+            user_id=user.user_id,
+            firebase_uid=user.firebase_uid,
+            name=user.name,
+            dni=user.dni,
+            email=user.email,
+            phone=user.phone,
+            role=user.role,
+            enabled=user.enabled,
+            is_admin=user.is_admin,
+            created_at=user.created_at,
+            updated_at=user.updated_at,
             badge_number=police_profile.badge_number if police_profile else None,
             rank=police_profile.rank if police_profile else None,
             department=police_profile.department if police_profile else None,
             station=police_profile.station if police_profile else None,
             years_service=police_profile.years_service if police_profile else None
         )
+        principal_cache.put("police", firebase_uid, police)
+        return police
     
     def create_doctor(self, doctor_create: DoctorCreate) -> Optional[Doctor]:
         """Crea un nuevo doctor"""
@@ -512,6 +560,21 @@ class UserService:
         except Exception as e:
             logger.error(f"Error updating user roles: {e}")
             return False
+        finally:
+            principal_cache.invalidate_uid(firebase_uid)
+    
+    def revoke_user_tokens(self, firebase_uid: str) -> bool:
+        """Revoca las sesiones de un usuario en Firebase y limpia sus tokens y principales en caché"""
+        try:
+            auth.revoke_refresh_tokens(firebase_uid)
+            return True
+        except Exception as e:
+            logger.error(f"Error revoking tokens for user {firebase_uid}: {e}")
+            return False
+        finally:
+            # Aunque falle Firebase, este proceso deja de aceptar los tokens ya verificados
+            token_cache.invalidate_user(firebase_uid)
+            principal_cache.invalidate_uid(firebase_uid)
     
     def get_users_with_role(self, role: str) -> List[User]:
         """Obtiene todos los usuarios que tienen un rol específico"""
@@ -1,4 +1,4 @@
-from services.firestore import FirestoreService
+from services.firestore import FirestoreService, AsyncFirestoreService
 from models.visit import VisitDB, VitalSigns, Diagnosis, Prescription, MedicalProcedure, MedicalEvolution
 from schemas import (
     Visit, VisitCreate, VisitUpdate, VisitSummary, VisitComplete, VisitStatus,
@@ -11,22 +11,33 @@ from schemas.patient import (
 )
 from models.patient import BloodAnalysis, RadiologyStudy
 from services.doctor import DoctorService
+from services.pagination import paginate_query, split_page
+from services.cache import ExpiringLRUCache
+from services.executor import run_in_executor
+from services.labs import LabRepository, BLOOD_ANALYSES, RADIOLOGY_STUDIES, use_lab_subcollections, merge_labs
+from services.admitted_board import AdmittedBoardRepository, build_admitted_entry, board_fields_changed
 from firebase_admin import firestore
-from typing import Optional, List
+from google.api_core.exceptions import NotFound
+from typing import Optional, List, Dict, Tuple, Iterator
 from datetime import datetime
 import logging
+import os
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-class VisitRepository(FirestoreService):
-    """Repositorio para operaciones de base de datos de visitas"""
-    
-    def __init__(self):
-        super().__init__()
-        self.visits_collection = "visits"
+# Campos necesarios para construir VisitSummary (select() evita descargar análisis, estudios y textos largos).
+# Un VisitDB proyectado es solo de lectura: guardarlo sobrescribiría el resto de campos con sus valores por defecto.
+VISIT_SUMMARY_FIELDS = [
+    "visit_id", "patient_dni", "visit_status", "reason", "attention_place", "attention_details",
+    "location", "triage", "attending_doctor_dni", "attending_doctor_name", "admission_date", "discharge_date"
+]
+
+
+class VisitDocumentMixin:
+    """Conversión entre documentos de Firestore y VisitDB, compartida por los repositorios sync y async"""
     
     def _document_to_visit_db(self, doc) -> Optional[VisitDB]:
         """Convierte un documento de Firestore a VisitDB"""
@@ -122,6 +133,51 @@ class VisitRepository(FirestoreService):
                     except ValueError:
                         study['date_performed'] = datetime.now()
     
+    def _visit_db_to_dict(self, visit_db: VisitDB) -> dict:
+        """Convierte VisitDB a diccionario con timestamps como strings"""
+        visit_dict = visit_db.model_dump()
+        
+        # Convertir timestamps principales
+        datetime_fields = [
+            'created_at', 'updated_at', 'admission_date', 'discharge_date'
+        ]
+        
+        for field in datetime_fields:
+            if field in visit_dict and isinstance(visit_dict[field], datetime):
+                visit_dict[field] = visit_dict[field].isoformat()
+        
+        # Convertir timestamps en signos vitales
+        if 'admission_vital_signs' in visit_dict and visit_dict['admission_vital_signs']:
+            vital_signs = visit_dict['admission_vital_signs']
+            if 'measured_at' in vital_signs and isinstance(vital_signs['measured_at'], datetime):
+                vital_signs['measured_at'] = vital_signs['measured_at'].isoformat()
+        
+        # Convertir timestamps en listas médicas
+        for medical_list, timestamp_field in [
+            ('diagnoses', 'diagnosed_at'),
+            ('procedures', 'performed_at'),
+            ('evolutions', 'recorded_at'),
+            ('prescriptions', 'prescribed_at'),
+            ('blood_analyses', 'date_performed'),
+            ('radiology_studies', 'date_performed')
+        ]:
+            if medical_list in visit_dict:
+                for item in visit_dict[medical_list]:
+                    if timestamp_field in item and isinstance(item[timestamp_field], datetime):
+                        item[timestamp_field] = item[timestamp_field].isoformat()
+        
+        return visit_dict
+
+
+class VisitRepository(VisitDocumentMixin, FirestoreService):
+    """Repositorio para operaciones de base de datos de visitas"""
+    
+    def __init__(self, db=None):
+        super().__init__(db)
+        self.visits_collection = "visits"
+        # Colección de pacientes, para los commits que escriben visita y paciente a la vez
+        self.patients_collection = "patients"
+    
     def get_by_id(self, visit_id: str) -> Optional[VisitDB]:
         """Obtiene una visita por ID"""
         try:
@@ -160,6 +216,108 @@ class VisitRepository(FirestoreService):
             logger.error(f"Error updating visit {visit_db.visit_id}: {e}")
             return False
     
+    # Actualizaciones parciales: solo se escriben los campos que cambian, sin reescribir el documento
+    
+    def _audit_fields(self, updated_by: Optional[str] = None) -> dict:
+        """Campos de auditoría que acompañan a cada actualización parcial"""
+        fields = {"updated_at": datetime.now().isoformat()}
+        if updated_by:
+            fields["last_updated_by"] = updated_by
+        return fields
+    
+    def update_fields(self, visit_id: str, fields: dict, updated_by: Optional[str] = None) -> bool:
+        """Actualiza solo los campos indicados (admite rutas con punto) sin leer el documento.
+        
+        Devuelve False si la visita no existe.
+        """
+        try:
+            self.db.collection(self.visits_collection).document(visit_id).update({
+                **fields,
+                **self._audit_fields(updated_by)
+            })
+            return True
+        except NotFound:
+            logger.warning(f"Visit {visit_id} not found for partial update")
+            return False
+        except Exception as e:
+            logger.error(f"Error updating fields {list(fields)} of visit {visit_id}: {e}")
+            return False
+    
+    def update_changed(self, visit_db: VisitDB, original: dict, updated_by: Optional[str] = None) -> bool:
+        """Escribe solo los campos de visit_db que difieren de original (resultado de _visit_db_to_dict)"""
+        current = self._visit_db_to_dict(visit_db)
+        changes = {
+            field: value for field, value in current.items()
+            if field not in ("updated_at", "last_updated_by") and original.get(field) != value
+        }
+        return self.update_fields(visit_db.visit_id, changes, updated_by)
+    
+    def append_to_array(self, visit_id: str, field: str, item: dict, updated_by: Optional[str] = None) -> bool:
+        """Añade un elemento a un array con ArrayUnion (una sola escritura, sin lectura previa)"""
+        return self.update_fields(visit_id, {field: firestore.ArrayUnion([item])}, updated_by)
+    
+    def append_text(self, visit_id: str, field: str, text: str, updated_by: Optional[str] = None) -> bool:
+        """Añade una línea a un campo de texto en una transacción, sin perder escrituras concurrentes"""
+        doc_ref = self.db.collection(self.visits_collection).document(visit_id)
+        
+        @firestore.transactional
+        def _append(transaction) -> bool:
+            snapshot = doc_ref.get(field_paths=[field], transaction=transaction)
+            if not snapshot.exists:
+                return False
+            current = (snapshot.to_dict() or {}).get(field) or ""
+            transaction.update(doc_ref, {
+                field: f"{current}\n{text}" if current else text,
+                **self._audit_fields(updated_by)
+            })
+            return True
+        
+        try:
+            appended = _append(self.db.transaction())
+            if not appended:
+                logger.warning(f"Visit {visit_id} not found to append to {field}")
+            return appended
+        except Exception as e:
+            logger.error(f"Error appending to {field} of visit {visit_id}: {e}")
+            return False
+    
+    def get_patient_dni(self, visit_id: str) -> Optional[str]:
+        """Lee solo el DNI del paciente de una visita"""
+        try:
+            doc = self.db.collection(self.visits_collection).document(visit_id).get(field_paths=["patient_dni"])
+            return (doc.to_dict() or {}).get("patient_dni") if doc.exists else None
+        except Exception as e:
+            logger.error(f"Error getting patient DNI of visit {visit_id}: {e}")
+            return None
+    
+    def append_with_patient_sync(self, visit_id: str, patient_dni: str, field: str, item: dict, updated_by: Optional[str] = None, labs: Optional[LabRepository] = None):
+        """Añade item al array field de la visita y al de medical_history del paciente en un único batch.
+        
+        Con labs (modo subcolección) el elemento se guarda una sola vez en patients/{dni}/{field}
+        y visita y paciente solo actualizan sus metadatos, en el mismo batch.
+        El batch es atómico: si falta alguno de los dos documentos lanza NotFound y no se escribe nada.
+        """
+        now = datetime.now().isoformat()
+        visit_ref = self.db.collection(self.visits_collection).document(visit_id)
+        patient_ref = self.db.collection(self.patients_collection).document(patient_dni)
+        batch = self.db.batch()
+        
+        if labs is not None:
+            labs.add(patient_dni, field, item, batch)
+            batch.update(visit_ref, self._audit_fields(updated_by))
+            batch.update(patient_ref, {"medical_history.last_updated": now, "updated_at": now})
+        else:
+            batch.update(visit_ref, {
+                field: firestore.ArrayUnion([item]),
+                **self._audit_fields(updated_by)
+            })
+            batch.update(patient_ref, {
+                f"medical_history.{field}": firestore.ArrayUnion([item]),
+                "medical_history.last_updated": now,
+                "updated_at": now
+            })
+        batch.commit()
+    
     def delete(self, visit_id: str) -> bool:
         """Elimina una visita (hard delete)"""
         try:
@@ -170,13 +328,15 @@ class VisitRepository(FirestoreService):
             logger.error(f"Error deleting visit {visit_id}: {e}")
             return False
     
-    def get_by_patient_dni(self, patient_dni: str) -> List[VisitDB]:
-        """Obtiene todas las visitas de un paciente"""
+    def get_by_patient_dni(self, patient_dni: str, fields: Optional[List[str]] = None) -> List[VisitDB]:
+        """Obtiene todas las visitas de un paciente (solo los campos indicados si se pasa fields)"""
         try:
-            docs = self.db.collection(self.visits_collection)\
+            query = self.db.collection(self.visits_collection)\
                 .where("patient_dni", "==", patient_dni)\
-                .order_by("admission_date", direction=firestore.Query.DESCENDING)\
-                .get()
+                .order_by("admission_date", direction=firestore.Query.DESCENDING)
+            if fields:
+                query = query.select(fields)
+            docs = query.get()
             
             visits = []
             for doc in docs:
@@ -241,48 +401,133 @@ class VisitRepository(FirestoreService):
             logger.error(f"Error getting all visits: {e}")
             return []
     
-    def _visit_db_to_dict(self, visit_db: VisitDB) -> dict:
-        """Convierte VisitDB a diccionario con timestamps como strings"""
-        visit_dict = visit_db.model_dump()
-        
-        # Convertir timestamps principales
-        datetime_fields = [
-            'created_at', 'updated_at', 'admission_date', 'discharge_date'
-        ]
+    def stream_all(self) -> Iterator[VisitDB]:
+        """Recorre todas las visitas con .stream(), sin materializar la colección completa"""
+        docs = self.db.collection(self.visits_collection)\
+            .order_by("admission_date", direction=firestore.Query.DESCENDING)\
+            .stream()
+        for doc in docs:
+            visit = self._document_to_visit_db(doc)
+            if visit:
+                yield visit
+    
+    def get_page(self, limit: int, cursor: Optional[str] = None, field: Optional[str] = None, value=None, fields: Optional[List[str]] = None) -> Tuple[List[VisitDB], Optional[str]]:
+        """Página de visitas (más recientes primero), opcionalmente filtradas por field == value.
         
-        for field in datetime_fields:
-            if field in visit_dict and isinstance(visit_dict[field], datetime):
-                visit_dict[field] = visit_dict[field].isoformat()
+        Devuelve las visitas y el cursor de la página siguiente (None si es la última).
+        Con fields solo se descargan esos campos. Un cursor inválido lanza InvalidCursorError.
+        """
+        query = self.db.collection(self.visits_collection)
+        if field:
+            query = query.where(field, "==", value)
         
-        # Convertir timestamps en signos vitales
-        if 'admission_vital_signs' in visit_dict and visit_dict['admission_vital_signs']:
-            vital_signs = visit_dict['admission_vital_signs']
-            if 'measured_at' in vital_signs and isinstance(vital_signs['measured_at'], datetime):
-                vital_signs['measured_at'] = vital_signs['measured_at'].isoformat()
+        query = paginate_query(query, "admission_date", limit, cursor)
+        if fields:
+            # El campo de orden debe venir en la proyección para poder generar el cursor
+            query = query.select(list(dict.fromkeys([*fields, "admission_date"])))
+        docs = query.get()
+        page, next_cursor = split_page(list(docs), "admission_date", limit)
         
-        # Convertir timestamps en listas médicas
-        for medical_list, timestamp_field in [
-            ('diagnoses', 'diagnosed_at'),
-            ('procedures', 'performed_at'),
-            ('evolutions', 'recorded_at'),
-            ('prescriptions', 'prescribed_at'),
-            ('blood_analyses', 'date_performed'),
-            ('radiology_studies', 'date_performed')
-        ]:
-            if medical_list in visit_dict:
-                for item in visit_dict[medical_list]:
-                    if timestamp_field in item and isinstance(item[timestamp_field], datetime):
-                        item[timestamp_field] = item[timestamp_field].isoformat()
-        
-        return visit_dict
+        visits = []
+        for doc in page:
+            visit = self._document_to_visit_db(doc)
+            if visit:
+                visits.append(visit)
+        return visits, next_cursor
+
+
+class AsyncVisitRepository(VisitDocumentMixin, AsyncFirestoreService):
+    """Repositorio asíncrono (AsyncClient) para operaciones de base de datos de visitas"""
+    
+    def __init__(self, db=None):
+        super().__init__(db)
+        self.visits_collection = "visits"
+    
+    async def _get_visits(self, query) -> List[VisitDB]:
+        """Ejecuta una consulta y convierte los documentos a VisitDB"""
+        docs = await query.get()
+        visits = []
+        for doc in docs:
+            visit = self._document_to_visit_db(doc)
+            if visit:
+                visits.append(visit)
+        return visits
+    
+    async def get_by_id(self, visit_id: str) -> Optional[VisitDB]:
+        """Obtiene una visita por ID"""
+        try:
+            doc = await self.db.collection(self.visits_collection).document(visit_id).get()
+            return self._document_to_visit_db(doc)
+        except Exception as e:
+            logger.error(f"Error getting visit by ID {visit_id}: {e}")
+            return None
+    
+    async def get_by_patient_dni(self, patient_dni: str, fields: Optional[List[str]] = None) -> List[VisitDB]:
+        """Obtiene todas las visitas de un paciente (solo los campos indicados si se pasa fields)"""
+        try:
+            query = self.db.collection(self.visits_collection)\
+                .where("patient_dni", "==", patient_dni)\
+                .order_by("admission_date", direction=firestore.Query.DESCENDING)
+            if fields:
+                query = query.select(fields)
+            return await self._get_visits(query)
+        except Exception as e:
+            logger.error(f"Error getting visits for patient {patient_dni}: {e}")
+            return []
+    
+    async def get_by_doctor_dni(self, doctor_dni: str) -> List[VisitDB]:
+        """Obtiene todas las visitas de un médico"""
+        try:
+            return await self._get_visits(
+                self.db.collection(self.visits_collection)
+                .where("attending_doctor_dni", "==", doctor_dni)
+                .order_by("admission_date", direction=firestore.Query.DESCENDING)
+            )
+        except Exception as e:
+            logger.error(f"Error getting visits for doctor {doctor_dni}: {e}")
+            return []
+    
+    async def get_by_status(self, status: VisitStatus) -> List[VisitDB]:
+        """Obtiene todas las visitas por estado"""
+        try:
+            return await self._get_visits(
+                self.db.collection(self.visits_collection)
+                .where("visit_status", "==", status)
+                .order_by("admission_date", direction=firestore.Query.DESCENDING)
+            )
+        except Exception as e:
+            logger.error(f"Error getting visits by status {status}: {e}")
+            return []
+    
+    async def get_all(self) -> List[VisitDB]:
+        """Obtiene todas las visitas"""
+        try:
+            return await self._get_visits(
+                self.db.collection(self.visits_collection)
+                .order_by("admission_date", direction=firestore.Query.DESCENDING)
+            )
+        except Exception as e:
+            logger.error(f"Error getting all visits: {e}")
+            return []
 
 
 class VisitService:
     """Servicio principal para gestión de visitas"""
     
-    def __init__(self):
-        self.repository = VisitRepository()
-        self.doctor_service = DoctorService()
+    def __init__(self, repository: Optional[VisitRepository] = None, doctor_service: Optional[DoctorService] = None, patient_service=None, admitted_board: Optional[AdmittedBoardRepository] = None, lab_repository: Optional[LabRepository] = None, async_repository: Optional[AsyncVisitRepository] = None):
+        self.repository = repository or VisitRepository()
+        # Solo lecturas: las escrituras pasan por repository (campos sueltos, tablero, última visita...)
+        self.async_repository = async_repository or AsyncVisitRepository()
+        self.labs = lab_repository or LabRepository(self.repository.db)
+        self.doctor_service = doctor_service or DoctorService(db=self.repository.db)
+        self.admitted_board = admitted_board or AdmittedBoardRepository(self.repository.db)
+        # visit_id -> patient_dni (no cambia nunca), para sincronizar laboratorio sin leer la visita
+        self._visit_patient_cache = ExpiringLRUCache(
+            max_size=int(os.getenv("VISIT_PATIENT_CACHE_SIZE", "4096")),
+            default_ttl=float(os.getenv("VISIT_PATIENT_CACHE_TTL", "3600"))
+        )
+        # PatientService depende de VisitService, así que se resuelve de forma perezosa si no se inyecta
+        self._patient_service = patient_service
         
         # Reconstruir modelos para resolver referencias forward
         try:
@@ -293,11 +538,66 @@ class VisitService:
         except ImportError:
             pass
     
-    def _visit_db_to_visit(self, visit_db: VisitDB, doctor_info: Optional[Doctor] = None) -> Visit:
+    @property
+    def patient_service(self):
+        """PatientService compartido; lazy loading para evitar imports circulares"""
+        if self._patient_service is None:
+            from services.patient import PatientService
+            self._patient_service = PatientService(visit_service=self)
+        return self._patient_service
+    
+    @patient_service.setter
+    def patient_service(self, patient_service):
+        self._patient_service = patient_service
+    
+    def _sync_admitted_board(self, visit: Visit):
+        """Mantiene el tablero de admitidos al día tras escribir una visita"""
+        try:
+            if visit.visit_status != VisitStatus.ADMISSION:
+                self.admitted_board.remove(visit.visit_id)
+                return
+            
+            patient_db = self.patient_service.repository.get_by_dni(visit.patient_dni)
+            if patient_db and patient_db.enabled:
+                self.admitted_board.upsert(build_admitted_entry(patient_db.name, visit))
+            else:
+                self.admitted_board.remove(visit.visit_id)
+        except Exception as e:
+            logger.error(f"Error syncing admitted board for visit {visit.visit_id}: {e}")
+    
+    def _update_patient_last_visit(self, visit_db: VisitDB, visit_date: datetime):
+        """Adelanta last_visit_date/last_visit_id del paciente para el listado (nunca hacia atrás)"""
+        try:
+            if self.patient_service.repository.update_last_visit(visit_db.patient_dni, visit_db.visit_id, visit_date):
+                self.patient_service.note_last_visit(visit_db.patient_dni, visit_date)
+        except Exception as e:
+            logger.error(f"Error updating last visit for patient {visit_db.patient_dni}: {e}")
+    
+    def _resolve_doctor_names(self, visits_db: List[VisitDB]) -> Dict[str, str]:
+        """Nombres de médico para visitas legacy sin attending_doctor_name, resueltos en lote"""
+        missing_dnis = {
+            visit_db.attending_doctor_dni for visit_db in visits_db
+            if not visit_db.attending_doctor_name and visit_db.attending_doctor_dni
+        }
+        if not missing_dnis:
+            return {}
+        return self.doctor_service.get_names_by_dni(missing_dnis)
+    
+    def _doctor_name_for(self, visit_db: VisitDB, doctor_names: Optional[Dict[str, str]] = None) -> str:
+        """Nombre desnormalizado del médico, con fallback al resolutor solo para visitas legacy"""
+        if visit_db.attending_doctor_name:
+            return visit_db.attending_doctor_name
+        if doctor_names is None:
+            doctor_names = self._resolve_doctor_names([visit_db])
+        return doctor_names.get(visit_db.attending_doctor_dni, "Unknown")
+    
+    def _visit_db_to_visit(self, visit_db: VisitDB, doctor_info: Optional[Doctor] = None, doctor_names: Optional[Dict[str, str]] = None) -> Visit:
         """Convierte VisitDB a esquema Visit (compatible con API actual)"""
-        # Obtener información del médico si no se proporciona
-        if not doctor_info:
-            doctor_info = self.doctor_service.get_doctor(visit_db.attending_doctor_dni)
+        # El nombre del médico está desnormalizado en la visita; no se consulta Firestore salvo en visitas legacy
+        if doctor_info and not visit_db.attending_doctor_name:
+            doctor_name = doctor_info.name
+        else:
+            doctor_name = self._doctor_name_for(visit_db, doctor_names)
         
         # Obtener diagnóstico principal para compatibilidad (ahora es string)
         diagnosis_text = visit_db.diagnoses if visit_db.diagnoses else None
@@ -315,7 +615,7 @@ class VisitService:
             admission_date=visit_db.admission_date,
             discharge_date=visit_db.discharge_date,
             doctor_dni=visit_db.attending_doctor_dni,
-            doctor_name= visit_db.attending_doctor_name,
+            doctor_name=doctor_name,
             diagnosis=diagnosis_text,
             procedures=visit_db.procedures if visit_db.procedures else None,
             treatment=getattr(visit_db, 'treatment', None),
@@ -361,44 +661,15 @@ class VisitService:
         treatment = getattr(visit_db, 'treatment', '')
         medication = visit_db.prescriptions if visit_db.prescriptions else ''
         
-        # Convertir análisis de sangre
-        blood_analyses = [
-            BloodAnalysisResponse(
-                analysis_id=analysis.analysis_id,
-                date_performed=analysis.date_performed,
-                red_blood_cells=analysis.red_blood_cells,
-                hemoglobin=analysis.hemoglobin,
-                hematocrit=analysis.hematocrit,
-                platelets=analysis.platelets,
-                lymphocytes=analysis.lymphocytes,
-                glucose=analysis.glucose,
-                cholesterol=analysis.cholesterol,
-                urea=analysis.urea,
-                cocaine=analysis.cocaine,
-                alcohol=analysis.alcohol,
-                mdma=analysis.mdma,
-                fentanyl=analysis.fentanyl,
-                performed_by_dni=analysis.performed_by_dni,
-                performed_by_name=analysis.performed_by_name,
-                notes=analysis.notes,
-                visit_related_id=analysis.visit_related_id
-            ) for analysis in visit_db.blood_analyses
-        ]
+        # Análisis y estudios: embebidos en la visita y, en modo subcolección, consultados por visit_related_id
+        visit_analyses = visit_db.blood_analyses
+        visit_studies = visit_db.radiology_studies
+        if use_lab_subcollections():
+            visit_analyses = merge_labs(visit_analyses, self.labs.list_by_visit(visit_db.patient_dni, BLOOD_ANALYSES, visit_db.visit_id))
+            visit_studies = merge_labs(visit_studies, self.labs.list_by_visit(visit_db.patient_dni, RADIOLOGY_STUDIES, visit_db.visit_id))
         
-        # Convertir estudios radiológicos
-        radiology_studies = [
-            RadiologyStudyResponse(
-                study_id=study.study_id,
-                date_performed=study.date_performed,
-                study_type=study.study_type,
-                body_part=study.body_part,
-                findings=study.findings,
-                image_url=study.image_url,
-                performed_by_dni=study.performed_by_dni,
-                performed_by_name=study.performed_by_name,
-                visit_related_id=study.visit_related_id
-            ) for study in visit_db.radiology_studies
-        ]
+        blood_analyses = [self._blood_analysis_to_response(analysis) for analysis in visit_analyses]
+        radiology_studies = [self._radiology_study_to_response(study) for study in visit_studies]
         
         return VisitComplete(
             visit_id=visit_db.visit_id,
@@ -489,7 +760,11 @@ class VisitService:
             )
             
             if self.repository.create(visit_db):
-                return self._visit_db_to_visit(visit_db, doctor)
+                self._visit_patient_cache.set(visit_db.visit_id, visit_db.patient_dni)
+                self._update_patient_last_visit(visit_db, visit_db.admission_date)
+                visit = self._visit_db_to_visit(visit_db, doctor)
+                self._sync_admitted_board(visit)
+                return visit
             return None
         except Exception as e:
             logger.error(f"Error creating visit: {e}")
@@ -502,6 +777,8 @@ class VisitService:
             return None
         
         try:
+            original = self.repository._visit_db_to_dict(visit_db)
+            
             # Actualizar campos básicos
             update_data = visit_update.model_dump(exclude_unset=True)
             
@@ -564,8 +841,13 @@ class VisitService:
             
             visit_db.update_timestamp(updated_by)
             
-            if self.repository.update(visit_db):
-                return self._visit_db_to_visit(visit_db)
+            # Solo se escriben los campos modificados para no pisar añadidos concurrentes (análisis, estudios...)
+            if self.repository.update_changed(visit_db, original, updated_by):
+                visit = self._visit_db_to_visit(visit_db)
+                # La mayoría de ediciones (notas, tratamiento...) no tocan el tablero: sin escritura
+                if board_fields_changed(original, self.repository._visit_db_to_dict(visit_db)):
+                    self._sync_admitted_board(visit)
+                return visit
             return None
         except Exception as e:
             logger.error(f"Error updating visit {visit_id}: {e}")
@@ -578,10 +860,14 @@ class VisitService:
             return None
         
         try:
+            original = self.repository._visit_db_to_dict(visit_db)
             visit_db.discharge_patient(discharged_by)
             
-            if self.repository.update(visit_db):
-                return self._visit_db_to_visit(visit_db)
+            if self.repository.update_changed(visit_db, original, discharged_by):
+                self._update_patient_last_visit(visit_db, visit_db.discharge_date)
+                visit = self._visit_db_to_visit(visit_db)
+                self._sync_admitted_board(visit)
+                return visit
             return None
         except Exception as e:
             logger.error(f"Error discharging visit {visit_id}: {e}")
@@ -589,31 +875,57 @@ class VisitService:
     
     def delete_visit(self, visit_id: str) -> bool:
         """Elimina una visita"""
-        return self.repository.delete(visit_id)
+        if self.repository.delete(visit_id):
+            self._visit_patient_cache.invalidate(visit_id)
+            self.admitted_board.remove(visit_id)
+            return True
+        return False
     
     def get_all_visits(self) -> List[Visit]:
         """Obtiene todas las visitas"""
         visits_db = self.repository.get_all()
+        doctor_names = self._resolve_doctor_names(visits_db)
         visits = []
         for visit_db in visits_db:
-            visit = self._visit_db_to_visit(visit_db)
+            visit = self._visit_db_to_visit(visit_db, doctor_names=doctor_names)
             if visit:
                 visits.append(visit)
         return visits
     
+    def iter_all_visits(self, batch_size: int = 200) -> Iterator[Visit]:
+        """Genera todas las visitas convertidas a Visit a medida que llegan (exportaciones en streaming)"""
+        batch = []
+        for visit_db in self.repository.stream_all():
+            batch.append(visit_db)
+            if len(batch) >= batch_size:
+                yield from self._visits_db_to_visits(batch)
+                batch = []
+        if batch:
+            yield from self._visits_db_to_visits(batch)
+    
     def get_all_visits_by_patient_dni(self, patient_dni: str) -> List[VisitSummary]:
         """Obtiene todas las visitas de un paciente como resumen"""
-        visits_db = self.repository.get_by_patient_dni(patient_dni)
+        return self._visits_db_to_summaries(
+            self.repository.get_by_patient_dni(patient_dni, fields=VISIT_SUMMARY_FIELDS)
+        )
+    
+    async def get_all_visits_by_patient_dni_async(self, patient_dni: str) -> List[VisitSummary]:
+        """Igual que get_all_visits_by_patient_dni, con la consulta en el AsyncClient (sin ocupar el pool)"""
+        visits_db = await self.async_repository.get_by_patient_dni(patient_dni, fields=VISIT_SUMMARY_FIELDS)
+        if any(not visit_db.attending_doctor_name for visit_db in visits_db):
+            # Visitas legacy sin nombre de médico: la resolución en lote es síncrona
+            return await run_in_executor(self._visits_db_to_summaries, visits_db)
+        return self._visits_db_to_summaries(visits_db)
+    
+    def _visits_db_to_summaries(self, visits_db: List[VisitDB]) -> List[VisitSummary]:
+        """Convierte visitas a VisitSummary resolviendo en lote los nombres de médico que falten"""
+        # Fallback en lote solo para visitas viejas sin el nombre del médico guardado
+        doctor_names = self._resolve_doctor_names(visits_db)
         summaries = []
         
         for visit_db in visits_db:
             # Usar información del médico guardada en la visita, evitando queries adicionales
-            doctor_name = getattr(visit_db, 'attending_doctor_name', None)
-            
-            # Fallback solo si no existe la información guardada (para compatibilidad con visitas viejas)
-            if not doctor_name:
-                doctor_info = self.doctor_service.get_doctor(visit_db.attending_doctor_dni)
-                doctor_name = doctor_info.name if doctor_info else "Unknown"
+            doctor_name = self._doctor_name_for(visit_db, doctor_names)
             
             summary = VisitSummary(
                 visit_id=visit_db.visit_id,
@@ -638,12 +950,13 @@ class VisitService:
     def get_all_visits_by_doctor_dni(self, doctor_dni: str) -> List[Visit]:
         """Obtiene todas las visitas de un médico"""
         visits_db = self.repository.get_by_doctor_dni(doctor_dni)
+        doctor_names = self._resolve_doctor_names(visits_db)
         visits = []
         
         # No necesitamos hacer una query adicional ya que la información del doctor 
         # está guardada en cada visita
         for visit_db in visits_db:
-            visit = self._visit_db_to_visit(visit_db)
+            visit = self._visit_db_to_visit(visit_db, doctor_names=doctor_names)
             if visit:
                 visits.append(visit)
         return visits
@@ -651,21 +964,47 @@ class VisitService:
     def get_all_visits_by_status(self, status: VisitStatus) -> List[Visit]:
         """Obtiene todas las visitas por estado"""
         visits_db = self.repository.get_by_status(status)
+        doctor_names = self._resolve_doctor_names(visits_db)
         visits = []
         for visit_db in visits_db:
-            visit = self._visit_db_to_visit(visit_db)
+            visit = self._visit_db_to_visit(visit_db, doctor_names=doctor_names)
             if visit:
                 visits.append(visit)
         return visits
     
+    def _visits_db_to_visits(self, visits_db: List[VisitDB]) -> List[Visit]:
+        """Convierte visitas a Visit resolviendo en lote los nombres de médico que falten"""
+        doctor_names = self._resolve_doctor_names(visits_db)
+        return [self._visit_db_to_visit(visit_db, doctor_names=doctor_names) for visit_db in visits_db]
+    
+    # Listados paginados por cursor (la memoria y la latencia dependen del tamaño de página)
+    
+    def get_visits_page_by_patient_dni(self, patient_dni: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[VisitSummary], Optional[str]]:
+        """Página de visitas de un paciente como resumen y cursor de la siguiente"""
+        visits_db, next_cursor = self.repository.get_page(
+            limit, cursor, "patient_dni", patient_dni, fields=VISIT_SUMMARY_FIELDS
+        )
+        return self._visits_db_to_summaries(visits_db), next_cursor
+    
+    def get_visits_page_by_doctor_dni(self, doctor_dni: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[Visit], Optional[str]]:
+        """Página de visitas de un médico y cursor de la siguiente"""
+        visits_db, next_cursor = self.repository.get_page(limit, cursor, "attending_doctor_dni", doctor_dni)
+        return self._visits_db_to_visits(visits_db), next_cursor
+    
+    def get_visits_page_by_status(self, status: VisitStatus, limit: int, cursor: Optional[str] = None) -> Tuple[List[Visit], Optional[str]]:
+        """Página de visitas por estado y cursor de la siguiente"""
+        visits_db, next_cursor = self.repository.get_page(limit, cursor, "visit_status", status)
+        return self._visits_db_to_visits(visits_db), next_cursor
+    
+    def get_visits_page(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[Visit], Optional[str]]:
+        """Página de todas las visitas y cursor de la siguiente"""
+        visits_db, next_cursor = self.repository.get_page(limit, cursor)
+        return self._visits_db_to_visits(visits_db), next_cursor
+    
     # Métodos adicionales para datos médicos específicos
     
     def add_vital_signs(self, visit_id: str, vital_signs_data: VitalSignsBase, measured_by: Optional[str] = None) -> Optional[VitalSignsResponse]:
         """Añade signos vitales a una visita"""
-        visit_db = self.repository.get_by_id(visit_id)
-        if not visit_db:
-            return None
-        
         try:
             vital_signs = VitalSigns(
                 heart_rate=vital_signs_data.heart_rate,
@@ -680,9 +1019,12 @@ class VisitService:
                 measured_by=measured_by
             )
             
-            visit_db.add_vital_signs(vital_signs, measured_by)
-            
-            if self.repository.update(visit_db):
+            # Una única escritura del campo, sin leer la visita
+            if self.repository.update_fields(
+                visit_id,
+                {"admission_vital_signs": vital_signs.model_dump(mode="json")},
+                measured_by
+            ):
                 return VitalSignsResponse(
                     measurement_id=vital_signs.measurement_id,
                     measured_at=vital_signs.measured_at,
@@ -704,10 +1046,6 @@ class VisitService:
     
     def add_diagnosis(self, visit_id: str, diagnosis_data: DiagnosisCreate, diagnosed_by: Optional[str] = None) -> Optional[DiagnosisResponse]:
         """Añade un diagnóstico a una visita"""
-        visit_db = self.repository.get_by_id(visit_id)
-        if not visit_db:
-            return None
-        
         try:
             # Crear texto del diagnóstico para añadir al campo string
             diagnosis_text = f"Diagnóstico: {diagnosis_data.primary_diagnosis}"
@@ -718,15 +1056,8 @@ class VisitService:
             if diagnosis_data.secondary_diagnoses:
                 diagnosis_text += f" - Diagnósticos secundarios: {', '.join(diagnosis_data.secondary_diagnoses)}"
             
-            # Añadir al campo diagnoses como string
-            if visit_db.diagnoses:
-                visit_db.diagnoses += f"\n{diagnosis_text}"
-            else:
-                visit_db.diagnoses = diagnosis_text
-            
-            visit_db.update_timestamp(diagnosed_by)
-            
-            if self.repository.update(visit_db):
+            # Añadir al campo diagnoses como string (transacción sobre ese campo)
+            if self.repository.append_text(visit_id, "diagnoses", diagnosis_text, diagnosed_by):
                 # Crear objeto de respuesta simulado para compatibilidad
                 from uuid import uuid4
                 return DiagnosisResponse(
@@ -747,10 +1078,6 @@ class VisitService:
     
     def add_prescription(self, visit_id: str, prescription_data: PrescriptionCreate, prescribed_by: Optional[str] = None) -> Optional[PrescriptionResponse]:
         """Añade una prescripción a una visita"""
-        visit_db = self.repository.get_by_id(visit_id)
-        if not visit_db:
-            return None
-        
         try:
             # Crear texto de la prescripción para añadir al campo string
             prescription_text = f"Medicamento: {prescription_data.medication_name} - "
@@ -761,15 +1088,8 @@ class VisitService:
             if prescription_data.instructions:
                 prescription_text += f" - Instrucciones: {prescription_data.instructions}"
             
-            # Añadir al campo prescriptions como string
-            if visit_db.prescriptions:
-                visit_db.prescriptions += f"\n{prescription_text}"
-            else:
-                visit_db.prescriptions = prescription_text
-            
-            visit_db.update_timestamp(prescribed_by)
-            
-            if self.repository.update(visit_db):
+            # Añadir al campo prescriptions como string (transacción sobre ese campo)
+            if self.repository.append_text(visit_id, "prescriptions", prescription_text, prescribed_by):
                 # Crear objeto de respuesta simulado para compatibilidad
                 from uuid import uuid4
                 return PrescriptionResponse(
@@ -788,57 +1108,90 @@ class VisitService:
             logger.error(f"Error adding prescription to visit {visit_id}: {e}")
             return None
     
+    def _build_blood_analysis(self, visit_id: str, analysis_data: BloodAnalysisCreate, performed_by_dni: Optional[str] = None, performed_by_name: Optional[str] = None) -> BloodAnalysis:
+        """Crea el análisis de sangre relacionado con la visita"""
+        return BloodAnalysis(
+            red_blood_cells=analysis_data.red_blood_cells,
+            hemoglobin=analysis_data.hemoglobin,
+            hematocrit=analysis_data.hematocrit,
+            platelets=analysis_data.platelets,
+            lymphocytes=analysis_data.lymphocytes,
+            glucose=analysis_data.glucose,
+            cholesterol=analysis_data.cholesterol,
+            urea=analysis_data.urea,
+            cocaine=analysis_data.cocaine,
+            alcohol=analysis_data.alcohol,
+            mdma=analysis_data.mdma,
+            fentanyl=analysis_data.fentanyl,
+            notes=analysis_data.notes,
+            performed_by_dni=performed_by_dni,
+            performed_by_name=performed_by_name,
+            visit_related_id=visit_id  # Establecer la relación con la visita
+        )
+    
+    def _blood_analysis_to_response(self, analysis: BloodAnalysis) -> BloodAnalysisResponse:
+        """Convierte BloodAnalysis a BloodAnalysisResponse"""
+        return BloodAnalysisResponse(
+            analysis_id=analysis.analysis_id,
+            date_performed=analysis.date_performed,
+            red_blood_cells=analysis.red_blood_cells,
+            hemoglobin=analysis.hemoglobin,
+            hematocrit=analysis.hematocrit,
+            platelets=analysis.platelets,
+            lymphocytes=analysis.lymphocytes,
+            glucose=analysis.glucose,
+            cholesterol=analysis.cholesterol,
+            urea=analysis.urea,
+            cocaine=analysis.cocaine,
+            alcohol=analysis.alcohol,
+            mdma=analysis.mdma,
+            fentanyl=analysis.fentanyl,
+            performed_by_dni=analysis.performed_by_dni,
+            performed_by_name=analysis.performed_by_name,
+            notes=analysis.notes,
+            visit_related_id=analysis.visit_related_id
+        )
+    
+    def _build_radiology_study(self, visit_id: str, study_data: RadiologyStudyCreate, performed_by_dni: Optional[str] = None, performed_by_name: Optional[str] = None) -> RadiologyStudy:
+        """Crea el estudio radiológico relacionado con la visita"""
+        return RadiologyStudy(
+            study_type=study_data.study_type,
+            body_part=study_data.body_part,
+            findings=study_data.findings,
+            image_url=study_data.image_url,
+            performed_by_dni=performed_by_dni,
+            performed_by_name=performed_by_name,
+            visit_related_id=visit_id  # Establecer la relación con la visita
+        )
+    
+    def _radiology_study_to_response(self, study: RadiologyStudy) -> RadiologyStudyResponse:
+        """Convierte RadiologyStudy a RadiologyStudyResponse"""
+        return RadiologyStudyResponse(
+            study_id=study.study_id,
+            date_performed=study.date_performed,
+            study_type=study.study_type,
+            body_part=study.body_part,
+            findings=study.findings,
+            image_url=study.image_url,
+            performed_by_dni=study.performed_by_dni,
+            performed_by_name=study.performed_by_name,
+            visit_related_id=study.visit_related_id
+        )
+    
     def add_blood_analysis(self, visit_id: str, analysis_data: BloodAnalysisCreate, performed_by_dni: Optional[str] = None, performed_by_name: Optional[str] = None) -> Optional[BloodAnalysisResponse]:
         """Añade un análisis de sangre a una visita específica"""
-        visit_db = self.repository.get_by_id(visit_id)
-        if not visit_db:
-            return None
-        
         try:
-            # Crear análisis de sangre
-            analysis = BloodAnalysis(
-                red_blood_cells=analysis_data.red_blood_cells,
-                hemoglobin=analysis_data.hemoglobin,
-                hematocrit=analysis_data.hematocrit,
-                platelets=analysis_data.platelets,
-                lymphocytes=analysis_data.lymphocytes,
-                glucose=analysis_data.glucose,
-                cholesterol=analysis_data.cholesterol,
-                urea=analysis_data.urea,
-                cocaine=analysis_data.cocaine,
-                alcohol=analysis_data.alcohol,
-                mdma=analysis_data.mdma,
-                fentanyl=analysis_data.fentanyl,
-                notes=analysis_data.notes,
-                performed_by_dni=performed_by_dni,
-                performed_by_name=performed_by_name,
-                visit_related_id=visit_id  # Establecer la relación con la visita
-            )
+            analysis = self._build_blood_analysis(visit_id, analysis_data, performed_by_dni, performed_by_name)
             
-            # Añadir análisis a la visita
-            visit_db.add_blood_analysis(analysis, performed_by_dni)
+            if use_lab_subcollections():
+                # Una sola copia en la subcolección del paciente, enlazada por visit_related_id
+                added = self._append_lab_with_patient_sync(visit_id, BLOOD_ANALYSES, analysis.model_dump(mode="json"), performed_by_dni)
+            else:
+                # Añadir análisis a la visita con ArrayUnion (una escritura, sin lectura previa)
+                added = self.repository.append_to_array(visit_id, BLOOD_ANALYSES, analysis.model_dump(mode="json"), performed_by_dni)
             
-            if self.repository.update(visit_db):
-                return BloodAnalysisResponse(
-                    analysis_id=analysis.analysis_id,
-                    date_performed=analysis.date_performed,
-                    red_blood_cells=analysis.red_blood_cells,
-                    hemoglobin=analysis.hemoglobin,
-                    hematocrit=analysis.hematocrit,
-                    platelets=analysis.platelets,
-                    lymphocytes=analysis.lymphocytes,
-                    glucose=analysis.glucose,
-                    cholesterol=analysis.cholesterol,
-                    urea=analysis.urea,
-                    cocaine=analysis.cocaine,
-                    alcohol=analysis.alcohol,
-                    mdma=analysis.mdma,
-                    fentanyl=analysis.fentanyl,
-                    performed_by_dni=analysis.performed_by_dni,
-                    performed_by_name=analysis.performed_by_name,
-                    notes=analysis.notes,
-                    visit_related_id=analysis.visit_related_id
-                )
+            if added:
+                return self._blood_analysis_to_response(analysis)
             return None
         except Exception as e:
             logger.error(f"Error adding blood analysis to visit {visit_id}: {e}")
@@ -846,108 +1199,71 @@ class VisitService:
     
     def add_radiology_study(self, visit_id: str, study_data: RadiologyStudyCreate, performed_by_dni: Optional[str] = None, performed_by_name: Optional[str] = None) -> Optional[RadiologyStudyResponse]:
         """Añade un estudio radiológico a una visita específica"""
-        visit_db = self.repository.get_by_id(visit_id)
-        if not visit_db:
-            return None
-        
         try:
-            # Crear estudio radiológico
-            study = RadiologyStudy(
-                study_type=study_data.study_type,
-                body_part=study_data.body_part,
-                findings=study_data.findings,
-                image_url=study_data.image_url,
-                performed_by_dni=performed_by_dni,
-                performed_by_name=performed_by_name,
-                visit_related_id=visit_id  # Establecer la relación con la visita
-            )
+            study = self._build_radiology_study(visit_id, study_data, performed_by_dni, performed_by_name)
             
-            # Añadir estudio a la visita
-            visit_db.add_radiology_study(study, performed_by_dni)
+            if use_lab_subcollections():
+                # Una sola copia en la subcolección del paciente, enlazada por visit_related_id
+                added = self._append_lab_with_patient_sync(visit_id, RADIOLOGY_STUDIES, study.model_dump(mode="json"), performed_by_dni)
+            else:
+                # Añadir estudio a la visita con ArrayUnion (una escritura, sin lectura previa)
+                added = self.repository.append_to_array(visit_id, RADIOLOGY_STUDIES, study.model_dump(mode="json"), performed_by_dni)
             
-            if self.repository.update(visit_db):
-                return RadiologyStudyResponse(
-                    study_id=study.study_id,
-                    date_performed=study.date_performed,
-                    study_type=study.study_type,
-                    body_part=study.body_part,
-                    findings=study.findings,
-                    image_url=study.image_url,
-                    performed_by_dni=study.performed_by_dni,
-                    performed_by_name=study.performed_by_name,
-                    visit_related_id=study.visit_related_id
-                )
+            if added:
+                return self._radiology_study_to_response(study)
             return None
         except Exception as e:
             logger.error(f"Error adding radiology study to visit {visit_id}: {e}")
             return None
     
-    def add_blood_analysis_with_patient_sync(self, visit_id: str, analysis_data: BloodAnalysisCreate, performed_by_dni: Optional[str] = None, performed_by_name: Optional[str] = None) -> Optional[BloodAnalysisResponse]:
-        """Añade un análisis de sangre tanto a la visita como al historial del paciente"""
-        from services.patient import PatientService  # Import local para evitar import circular
-        
-        visit_db = self.repository.get_by_id(visit_id)
-        if not visit_db:
-            return None
+    def _get_visit_patient_dni(self, visit_id: str) -> Optional[str]:
+        """DNI del paciente de una visita (inmutable, así que se cachea y normalmente no cuesta lecturas)"""
+        patient_dni = self._visit_patient_cache.get(visit_id)
+        if patient_dni is None:
+            patient_dni = self.repository.get_patient_dni(visit_id)
+            if patient_dni:
+                self._visit_patient_cache.set(visit_id, patient_dni)
+        return patient_dni
+    
+    def _append_lab_with_patient_sync(self, visit_id: str, field: str, item: dict, performed_by_dni: Optional[str] = None) -> bool:
+        """Añade un análisis/estudio a la visita y al historial del paciente en un único commit atómico"""
+        patient_dni = self._get_visit_patient_dni(visit_id)
+        if not patient_dni:
+            return False
         
         try:
-            # Primero añadir a la visita
-            visit_result = self.add_blood_analysis(visit_id, analysis_data, performed_by_dni, performed_by_name)
-            if not visit_result:
-                return None
-            
-            # Luego añadir al historial del paciente
-            patient_service = PatientService()
-            patient_result = patient_service.add_blood_analysis(
-                visit_db.patient_dni, 
-                analysis_data, 
-                performed_by_dni, 
-                performed_by_name, 
-                visit_id
+            self.repository.append_with_patient_sync(
+                visit_id, patient_dni, field, item, performed_by_dni,
+                labs=self.labs if use_lab_subcollections() else None
             )
-            
-            if patient_result:
-                logger.info(f"Blood analysis {visit_result.analysis_id} added to both visit {visit_id} and patient {visit_db.patient_dni}")
-                return visit_result
-            else:
-                logger.warning(f"Blood analysis added to visit {visit_id} but failed to add to patient {visit_db.patient_dni}")
-                return visit_result
-                
+            logger.info(f"Added {field} item to both visit {visit_id} and patient {patient_dni}")
+            return True
+        except NotFound:
+            # Falta la visita o el paciente: se conserva al menos la copia de la visita, como antes
+            self._visit_patient_cache.invalidate(visit_id)
+            appended = self.repository.append_to_array(visit_id, field, item, performed_by_dni)
+            if appended:
+                logger.warning(f"Added {field} item to visit {visit_id} but patient {patient_dni} was not found")
+            return appended
+    
+    def add_blood_analysis_with_patient_sync(self, visit_id: str, analysis_data: BloodAnalysisCreate, performed_by_dni: Optional[str] = None, performed_by_name: Optional[str] = None) -> Optional[BloodAnalysisResponse]:
+        """Añade un análisis de sangre tanto a la visita como al historial del paciente"""
+        try:
+            analysis = self._build_blood_analysis(visit_id, analysis_data, performed_by_dni, performed_by_name)
+            if self._append_lab_with_patient_sync(visit_id, BLOOD_ANALYSES, analysis.model_dump(mode="json"), performed_by_dni):
+                return self._blood_analysis_to_response(analysis)
+            return None
         except Exception as e:
             logger.error(f"Error adding blood analysis with patient sync to visit {visit_id}: {e}")
             return None
     
     def add_radiology_study_with_patient_sync(self, visit_id: str, study_data: RadiologyStudyCreate, performed_by_dni: Optional[str] = None, performed_by_name: Optional[str] = None) -> Optional[RadiologyStudyResponse]:
         """Añade un estudio radiológico tanto a la visita como al historial del paciente"""
-        from services.patient import PatientService  # Import local para evitar import circular
-        
-        visit_db = self.repository.get_by_id(visit_id)
-        if not visit_db:
-            return None
-        
         try:
-            # Primero añadir a la visita
-            visit_result = self.add_radiology_study(visit_id, study_data, performed_by_dni, performed_by_name)
-            if not visit_result:
-                return None
-            
-            # Luego añadir al historial del paciente
-            patient_service = PatientService()
-            patient_result = patient_service.add_radiology_study(
-                visit_db.patient_dni, 
-                study_data, 
-                performed_by_dni, 
-                performed_by_name, 
-                visit_id
-            )
-            
-            if patient_result:
-                logger.info(f"Radiology study {visit_result.study_id} added to both visit {visit_id} and patient {visit_db.patient_dni}")
-                return visit_result
-            else:
-                logger.warning(f"Radiology study added to visit {visit_id} but failed to add to patient {visit_db.patient_dni}")
-                return visit_result
-                
+            study = self._build_radiology_study(visit_id, study_data, performed_by_dni, performed_by_name)
+            if self._append_lab_with_patient_sync(visit_id, RADIOLOGY_STUDIES, study.model_dump(mode="json"), performed_by_dni):
+                return self._radiology_study_to_response(study)
+            return None
         except Exception as e:
             logger.error(f"Error adding radiology study with patient sync to visit {visit_id}: {e}")
-            return None
\ No newline at end of file
+            return None
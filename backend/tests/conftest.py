@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos de la API se importan igual que al arrancar uvicorn desde backend/src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
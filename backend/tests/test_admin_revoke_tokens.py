@@ -0,0 +1,86 @@
+"""
+POST /admin/users/{user_dni}/revoke-tokens: revoca en Firebase y vacía las cachés del usuario.
+"""
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from auth.authorization import auth_service
+from auth.principal_cache import principal_cache
+from auth.tokens import token_cache
+from routers.admin import admin_router
+from services.container import get_user_service
+from services import user as user_module
+from services.user import UserService, UserRepository
+
+
+class CachedPrincipal(BaseModel):
+    dni: str
+
+
+USER = SimpleNamespace(dni="12345678", name="Dr. Juan Pérez", firebase_uid="uid-1")
+
+
+@pytest.fixture
+def revoked(monkeypatch):
+    calls = []
+    monkeypatch.setattr(user_module.auth, "revoke_refresh_tokens", calls.append)
+    return calls
+
+
+@pytest.fixture
+def client(monkeypatch):
+    user_service = UserService(UserRepository(db=object()))
+    monkeypatch.setattr(user_service, "get_user_by_dni", lambda dni: USER if dni == USER.dni else None)
+
+    app = FastAPI()
+    app.include_router(admin_router)
+    app.dependency_overrides[auth_service.verify_admin] = lambda: SimpleNamespace(dni="admin")
+    app.dependency_overrides[get_user_service] = lambda: user_service
+    return TestClient(app)
+
+
+def cache_user_session():
+    token_cache.put("token-of-uid-1", {"uid": "uid-1", "exp": time.time() + 3600})
+    token_cache.put("token-of-uid-2", {"uid": "uid-2", "exp": time.time() + 3600})
+    principal_cache.put("user", "uid-1", CachedPrincipal(dni=USER.dni))
+    principal_cache.put("user", "uid-2", CachedPrincipal(dni="87654321"))
+
+
+def test_revokes_and_clears_caches(client, revoked):
+    cache_user_session()
+
+    response = client.post(f"/admin/users/{USER.dni}/revoke-tokens")
+
+    assert response.status_code == 200
+    assert response.json()["user_dni"] == USER.dni
+    assert revoked == ["uid-1"]
+    assert token_cache.get("token-of-uid-1") is None
+    assert principal_cache.get("user", "uid-1") is None
+    # Las sesiones de otros usuarios no se tocan
+    assert token_cache.get("token-of-uid-2") is not None
+    assert principal_cache.get("user", "uid-2") is not None
+
+
+def test_unknown_user(client, revoked):
+    response = client.post("/admin/users/00000000/revoke-tokens")
+    assert response.status_code == 404
+    assert revoked == []
+
+
+def test_firebase_failure_still_clears_caches(client, monkeypatch):
+    def fail(uid):
+        raise RuntimeError("unavailable")
+
+    monkeypatch.setattr(user_module.auth, "revoke_refresh_tokens", fail)
+    cache_user_session()
+
+    response = client.post(f"/admin/users/{USER.dni}/revoke-tokens")
+
+    assert response.status_code == 502
+    assert token_cache.get("token-of-uid-1") is None
+    assert principal_cache.get("user", "uid-1") is None
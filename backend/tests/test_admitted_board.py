@@ -0,0 +1,66 @@
+"""
+Tablero de admitidos: si la transacción agota los reintentos el tablero queda marcado como
+desactualizado y get() fuerza la reconstrucción desde las visitas.
+"""
+from services import admitted_board as board_module
+from services.admitted_board import AdmittedBoardRepository
+
+
+class FakeBoardDocument:
+    def __init__(self, data=None):
+        self.data = data
+        self.updates = []
+
+    @property
+    def exists(self):
+        return self.data is not None
+
+    def to_dict(self):
+        return self.data
+
+    def get(self):
+        return self
+
+    def update(self, changes):
+        self.updates.append(changes)
+        self.data = {**(self.data or {}), **changes}
+
+
+class FakeDb:
+    def __init__(self, board):
+        self.board = board
+        self.transactions = []
+
+    def collection(self, name):
+        return self
+
+    def document(self, name):
+        return self.board
+
+    def transaction(self, **kwargs):
+        self.transactions.append(kwargs)
+        return object()
+
+
+def contended(transaction):
+    raise RuntimeError("Too much contention on these documents")
+
+
+def test_exhausted_retries_mark_board_stale():
+    board = FakeBoardDocument({"entries": {}, "version": 7})
+    db = FakeDb(board)
+    repository = AdmittedBoardRepository(db=db)
+
+    assert repository._run(contended, "visit v-1") is False
+    assert db.transactions == [{"max_attempts": board_module.ADMITTED_BOARD_MAX_ATTEMPTS}]
+    assert board.data["stale"] is True
+    assert board.data["version"] == 7
+    assert repository.get() is None
+
+
+def test_fresh_board_is_served():
+    board = FakeBoardDocument({"entries": {}, "version": 3})
+    entries, etag = AdmittedBoardRepository(db=FakeDb(board)).get()
+
+    assert entries == []
+    assert etag == '"3"'
@@ -0,0 +1,39 @@
+"""
+If-None-Match con comparación débil (RFC 9110): listas, etiquetas W/ y "*".
+"""
+import pytest
+from starlette.requests import Request
+
+from services.etag import etag_matches, parse_if_none_match
+
+ETAG = '"3f2a9c"'
+
+
+def request_with(if_none_match=None):
+    headers = [] if if_none_match is None else [(b"if-none-match", if_none_match.encode("latin-1"))]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize("header", [
+    '"3f2a9c"',
+    'W/"3f2a9c"',
+    '"old", "3f2a9c"',
+    'W/"old",W/"3f2a9c"',
+    ' "3f2a9c" ',
+    "*",
+])
+def test_matches(header):
+    assert etag_matches(request_with(header), ETAG)
+
+
+@pytest.mark.parametrize("header", [None, "", '"old"', '"3f2a9"', "3f2a9c", 'W/"old", "other"'])
+def test_does_not_match(header):
+    assert not etag_matches(request_with(header), ETAG)
+
+
+def test_weak_current_etag():
+    assert etag_matches(request_with('"3f2a9c"'), 'W/"3f2a9c"')
+
+
+def test_parse_keeps_commas_inside_tags():
+    assert parse_if_none_match('"a,b", W/"c"') == ['"a,b"', '"c"']
@@ -0,0 +1,74 @@
+"""
+Resolución de rutas de /exams: las rutas GET fijas no deben quedar ocultas por "/{exam_id}".
+"""
+import pytest
+from fastapi import FastAPI
+from starlette.routing import Match
+
+from routers.exams import exam_router
+
+app = FastAPI()
+app.include_router(exam_router)
+
+
+def resolve(method, path):
+    """Handler y parámetros de la primera ruta que coincide, como al atender la petición"""
+    scope = {"type": "http", "method": method, "path": path, "root_path": ""}
+    for route in app.routes:
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            return route.endpoint.__name__, child_scope.get("path_params", {})
+    return None
+
+
+@pytest.mark.parametrize("path, endpoint", [
+    ("/exams/patients", "get_patients_with_exams"),
+    ("/exams/patients/search/garcia", "search_patients_with_exams"),
+    ("/exams/patients/12345678/history", "get_patient_exam_history"),
+    ("/exams/results/r1", "get_exam_result"),
+    ("/exams/exam-1", "get_exam"),
+    ("/exams/exam-1/questions", "get_questions_by_exam"),
+])
+def test_get_routes(path, endpoint):
+    assert resolve("GET", path)[0] == endpoint
+
+
+def test_exam_id_route_still_takes_ids():
+    assert resolve("GET", "/exams/exam-1") == ("get_exam", {"exam_id": "exam-1"})
+
+
+@pytest.mark.parametrize("path, endpoint", [
+    ("/exams/statistics", "get_exam_statistics"),
+    ("/exams/results", "get_all_exam_results"),
+])
+def test_statistics_and_results_routes(path, endpoint):
+    assert resolve("GET", path)[0] == endpoint
+
+
+class FakeExamResultService:
+    def __init__(self):
+        self.days_back = None
+
+    def get_exam_statistics(self, days_back):
+        self.days_back = days_back
+        return {"total_exams": 3, "passed_exams": 2, "failed_exams": 1}
+
+
+def test_statistics_endpoint_answers():
+    from fastapi.testclient import TestClient
+    from services.container import get_exam_result_service
+
+    route = next(route for route in app.routes if getattr(route, "path", None) == "/exams/statistics")
+    # La dependencia de autenticación es un closure de require_exam_access(): se sustituye la de esta ruta
+    auth_dependency = next(dep.call for dep in route.dependant.dependencies if dep.name == "current_user")
+    service = FakeExamResultService()
+    app.dependency_overrides[auth_dependency] = lambda: None
+    app.dependency_overrides[get_exam_result_service] = lambda: service
+    try:
+        response = TestClient(app).get("/exams/statistics", params={"days_back": 7})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.json()["total_exams"] == 3
+    assert service.days_back == 7
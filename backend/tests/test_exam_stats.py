@@ -0,0 +1,80 @@
+"""
+Contadores diarios de exam_stats: tamaño constante por día (sin DNIs de pacientes).
+"""
+from datetime import datetime
+from types import SimpleNamespace
+
+from services.exam_stats import ExamStatsRepository, stats_period_start
+
+
+class FakeBatch:
+    def __init__(self):
+        self.writes = []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append(data)
+
+
+class FakeDocument:
+    def __init__(self, data):
+        self.data = data
+
+    def to_dict(self):
+        return self.data
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def document(self, doc_id):
+        return doc_id
+
+    def where(self, field, op, value):
+        return FakeCollection([doc for doc in self.docs if doc.data[field] >= value])
+
+    def stream(self):
+        return iter(self.docs)
+
+
+class FakeDb:
+    def __init__(self, docs=()):
+        self.docs = [FakeDocument(data) for data in docs]
+
+    def collection(self, name):
+        return FakeCollection(self.docs)
+
+
+def make_result(patient_dni):
+    return SimpleNamespace(
+        exam_date=datetime(2026, 10, 1, 12), is_approved=True, score_percentage=90.0,
+        patient_dni=patient_dni, exam_id="exam-1", exam_name="Psicotécnico"
+    )
+
+
+def test_record_result_does_not_store_patients():
+    batch = FakeBatch()
+    ExamStatsRepository(db=FakeDb()).record_result(make_result("12345678"), batch)
+
+    assert "patient_dnis" not in batch.writes[0]
+    assert batch.writes[0]["day"] == "2026-10-01"
+
+
+def test_statistics_merge_shards_without_patient_totals():
+    today = datetime.now().strftime("%Y-%m-%d")
+    shard = {"day": today, "total": 2, "passed": 1, "failed": 1, "score_sum": 150,
+             "by_exam": {"exam-1": {"exam_name": "Psicotécnico", "total": 2, "passed": 1, "failed": 1}}}
+    legacy = {**shard, "patient_dnis": ["12345678", "87654321"]}
+
+    stats = ExamStatsRepository(db=FakeDb([shard, legacy])).get_statistics(days_back=30)
+
+    assert stats["total_exams"] == 4
+    assert stats["average_score"] == 75.0
+    assert stats["exams_by_exam"][0]["total"] == 4
+    assert "total_patients" not in stats
+
+
+def test_period_starts_at_midnight():
+    since = stats_period_start(30)
+    assert (since.hour, since.minute, since.second, since.microsecond) == (0, 0, 0, 0)
+    assert stats_period_start(None) is None
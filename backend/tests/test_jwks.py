@@ -0,0 +1,217 @@
+"""
+Verificación local de ID tokens (auth/jwks.py) contra un certificado generado en el test.
+
+La descarga de certificados de Google se sustituye por un httpx.MockTransport que sirve
+los PEM del fixture y cuenta las peticiones.
+"""
+import asyncio
+import datetime
+import time
+
+import httpx
+import jwt
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from firebase_admin import auth
+
+from auth import jwks
+
+PROJECT_ID = "test-project"
+ISSUER = f"{jwks.ISSUER_PREFIX}{PROJECT_ID}"
+
+
+def generate_signing_key():
+    """Clave RSA y certificado autofirmado en PEM, como los de securetoken"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.test")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    )
+    return private_pem, certificate.public_bytes(serialization.Encoding.PEM).decode("utf-8")
+
+
+class CertificateServer:
+    """Sirve {kid: pem} con Cache-Control y cuenta las descargas"""
+
+    def __init__(self):
+        self.certs = {}
+        self.fetches = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.fetches += 1
+        return httpx.Response(200, json=dict(self.certs), headers={"Cache-Control": "public, max-age=3600"})
+
+
+@pytest.fixture(scope="module")
+def signing_keys():
+    return {"key-1": generate_signing_key(), "key-2": generate_signing_key()}
+
+
+@pytest.fixture
+def server(monkeypatch, signing_keys):
+    server = CertificateServer()
+    server.certs["key-1"] = signing_keys["key-1"][1]
+    real_client = httpx.AsyncClient
+
+    def client_factory(**kwargs):
+        return real_client(transport=httpx.MockTransport(server.handler), **kwargs)
+
+    monkeypatch.setattr(jwks.httpx, "AsyncClient", client_factory)
+    return server
+
+
+@pytest.fixture
+def verifier(server):
+    key_set = jwks.FirebaseKeySet(certs_url="https://certs.test/", min_refresh_interval=30)
+    return jwks.FirebaseTokenVerifier(key_set, project_id=PROJECT_ID)
+
+
+def make_token(signing_keys, kid="key-1", drop=(), **overrides):
+    now = int(time.time())
+    claims = {
+        "iss": ISSUER,
+        "aud": PROJECT_ID,
+        "sub": "user-123",
+        "iat": now - 10,
+        "exp": now + 3600,
+        "auth_time": now - 60,
+    }
+    claims.update(overrides)
+    for claim in drop:
+        claims.pop(claim)
+    signer = kid if kid in signing_keys else "key-1"
+    return jwt.encode(claims, signing_keys[signer][0], algorithm="RS256", headers={"kid": kid})
+
+
+def verify(verifier, token):
+    return asyncio.run(verifier.verify(token))
+
+
+def test_valid_token(verifier, server, signing_keys):
+    claims = verify(verifier, make_token(signing_keys))
+    assert claims["uid"] == "user-123"
+    assert claims["aud"] == PROJECT_ID
+    assert server.fetches == 1
+
+
+def test_certificates_are_reused_while_fresh(verifier, server, signing_keys):
+    async def verify_twice():
+        await verifier.verify(make_token(signing_keys))
+        await verifier.verify(make_token(signing_keys))
+
+    asyncio.run(verify_twice())
+    assert server.fetches == 1
+
+
+def test_expired_token(verifier, signing_keys):
+    now = int(time.time())
+    token = make_token(signing_keys, iat=now - 7200, exp=now - 3600, auth_time=now - 7200)
+    with pytest.raises(auth.ExpiredIdTokenError):
+        verify(verifier, token)
+
+
+def test_wrong_audience(verifier, signing_keys):
+    with pytest.raises(auth.InvalidIdTokenError):
+        verify(verifier, make_token(signing_keys, aud="other-project"))
+
+
+def test_wrong_issuer(verifier, signing_keys):
+    with pytest.raises(auth.InvalidIdTokenError):
+        verify(verifier, make_token(signing_keys, iss=f"{jwks.ISSUER_PREFIX}other-project"))
+
+
+def test_issued_in_the_future(verifier, signing_keys):
+    with pytest.raises(auth.InvalidIdTokenError, match="Token used too early"):
+        verify(verifier, make_token(signing_keys, iat=int(time.time()) + 600))
+
+
+def test_issued_in_the_future_within_clock_skew(verifier, signing_keys):
+    token = make_token(signing_keys, iat=int(time.time()) + 5)
+    claims = asyncio.run(verifier.verify(token, clock_skew_seconds=30))
+    assert claims["uid"] == "user-123"
+
+
+def test_auth_time_in_the_future(verifier, signing_keys):
+    with pytest.raises(auth.InvalidIdTokenError, match="Token used too early"):
+        verify(verifier, make_token(signing_keys, auth_time=int(time.time()) + 600))
+
+
+@pytest.mark.parametrize("claim", ["sub", "auth_time"])
+def test_missing_required_claim(verifier, signing_keys, claim):
+    with pytest.raises(auth.InvalidIdTokenError):
+        verify(verifier, make_token(signing_keys, drop=(claim,)))
+
+
+def test_empty_subject(verifier, signing_keys):
+    with pytest.raises(auth.InvalidIdTokenError, match="invalid subject"):
+        verify(verifier, make_token(signing_keys, sub=""))
+
+
+def test_wrong_algorithm(verifier, signing_keys):
+    token = jwt.encode({"sub": "user-123"}, "secret", algorithm="HS256", headers={"kid": "key-1"})
+    with pytest.raises(auth.InvalidIdTokenError, match="algorithm"):
+        verify(verifier, token)
+
+
+def test_unknown_kid_forces_refresh(verifier, server, signing_keys):
+    async def rotate():
+        await verifier.verify(make_token(signing_keys))
+        # Google rota las claves antes de que caduque la caché local (pasado el intervalo mínimo)
+        server.certs["key-2"] = signing_keys["key-2"][1]
+        verifier.key_set._last_fetch -= verifier.key_set.min_refresh_interval
+        return await verifier.verify(make_token(signing_keys, kid="key-2"))
+
+    claims = asyncio.run(rotate())
+    assert claims["uid"] == "user-123"
+    assert server.fetches == 2
+
+
+def test_unknown_kid_refresh_is_rate_limited(verifier, server, signing_keys):
+    async def unknown_kids():
+        await verifier.verify(make_token(signing_keys))
+        errors = 0
+        for _ in range(3):
+            try:
+                await verifier.verify(make_token(signing_keys, kid="missing"))
+            except auth.InvalidIdTokenError:
+                errors += 1
+        return errors
+
+    # La primera carga cuenta como descarga reciente: ningún kid desconocido fuerza otra
+    assert asyncio.run(unknown_kids()) == 3
+    assert server.fetches == 1
+
+
+def test_unknown_kid_refresh_after_interval(verifier, server, signing_keys):
+    async def unknown_kid_later():
+        await verifier.verify(make_token(signing_keys))
+        verifier.key_set._last_fetch -= verifier.key_set.min_refresh_interval
+        with pytest.raises(auth.InvalidIdTokenError, match="kid"):
+            await verifier.verify(make_token(signing_keys, kid="missing"))
+        with pytest.raises(auth.InvalidIdTokenError, match="kid"):
+            await verifier.verify(make_token(signing_keys, kid="missing"))
+
+    asyncio.run(unknown_kid_later())
+    assert server.fetches == 2
+
+
+def test_certificate_fetch_error(verifier, server, signing_keys, monkeypatch):
+    monkeypatch.setattr(server, "handler", lambda request: httpx.Response(503))
+    with pytest.raises(auth.CertificateFetchError):
+        verify(verifier, make_token(signing_keys))
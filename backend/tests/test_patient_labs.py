@@ -0,0 +1,100 @@
+"""
+Consultas de análisis de sangre de PatientService: arrays embebidos y, con
+LAB_STORAGE_MODE=subcollection, LabRepository (limit(1) y consulta por visita).
+"""
+from datetime import datetime
+
+import pytest
+
+from models.patient import PatientDB, MedicalHistory, BloodAnalysis
+from services import patient as patient_module
+from services.labs import BLOOD_ANALYSES
+from services.patient import PatientService, PATIENT_BLOOD_ANALYSES_FIELDS
+
+
+def make_analysis(analysis_id, day, visit_id=None):
+    return BloodAnalysis(
+        analysis_id=analysis_id, date_performed=datetime(2026, 1, day),
+        red_blood_cells=4.5, hemoglobin=14, hematocrit=42, platelets=250000,
+        lymphocytes=30, glucose=90, cholesterol=180, urea=30, visit_related_id=visit_id
+    )
+
+
+class FakePatientRepository:
+    def __init__(self, patient_db):
+        self.patient_db = patient_db
+        self.db = object()
+        self.fields = []
+
+    def get_by_dni(self, dni, fields=None):
+        self.fields.append(fields)
+        return self.patient_db if dni == self.patient_db.dni else None
+
+
+class FakeLabRepository:
+    def __init__(self, items):
+        self.items = items
+        self.calls = []
+
+    def latest(self, patient_dni, kind):
+        self.calls.append(("latest", kind))
+        return max(self.items, key=lambda item: item.date_performed) if self.items else None
+
+    def list_by_visit(self, patient_dni, kind, visit_id):
+        self.calls.append(("list_by_visit", kind, visit_id))
+        return [item for item in self.items if item.visit_related_id == visit_id]
+
+
+@pytest.fixture
+def patient_db():
+    return PatientDB(
+        dni="12345678", name="Ana García", age=40, sex="female", blood_type="A+",
+        medical_history=MedicalHistory(blood_analyses=[
+            make_analysis("embedded-old", 1, "visit-1"),
+            make_analysis("embedded-new", 5, "visit-2"),
+        ])
+    )
+
+
+def make_service(patient_db, lab_items, monkeypatch, mode):
+    monkeypatch.setattr(patient_module, "use_lab_subcollections", lambda: mode == "subcollection")
+    labs = FakeLabRepository(lab_items)
+    return PatientService(repository=FakePatientRepository(patient_db), lab_repository=labs), labs
+
+
+def test_latest_embedded_mode_does_not_query_subcollection(patient_db, monkeypatch):
+    service, labs = make_service(patient_db, [make_analysis("sub", 9)], monkeypatch, "embedded")
+
+    assert service.get_latest_blood_analysis(patient_db.dni).analysis_id == "embedded-new"
+    assert labs.calls == []
+    assert service.repository.fields == [PATIENT_BLOOD_ANALYSES_FIELDS]
+
+
+def test_latest_subcollection_mode_uses_lab_repository(patient_db, monkeypatch):
+    service, labs = make_service(patient_db, [make_analysis("sub", 9)], monkeypatch, "subcollection")
+
+    assert service.get_latest_blood_analysis(patient_db.dni).analysis_id == "sub"
+    assert labs.calls == [("latest", BLOOD_ANALYSES)]
+
+
+def test_latest_keeps_unmigrated_embedded_analysis(patient_db, monkeypatch):
+    service, _ = make_service(patient_db, [make_analysis("sub", 3)], monkeypatch, "subcollection")
+
+    assert service.get_latest_blood_analysis(patient_db.dni).analysis_id == "embedded-new"
+
+
+def test_by_visit_merges_subcollection_newest_first(patient_db, monkeypatch):
+    lab_items = [make_analysis("sub-visit-1", 7, "visit-1"), make_analysis("sub-visit-2", 8, "visit-2")]
+    service, labs = make_service(patient_db, lab_items, monkeypatch, "subcollection")
+
+    analyses = service.get_blood_analyses_by_visit(patient_db.dni, "visit-1")
+
+    assert [analysis.analysis_id for analysis in analyses] == ["sub-visit-1", "embedded-old"]
+    assert labs.calls == [("list_by_visit", BLOOD_ANALYSES, "visit-1")]
+
+
+def test_unknown_patient(patient_db, monkeypatch):
+    service, _ = make_service(patient_db, [], monkeypatch, "subcollection")
+
+    assert service.get_latest_blood_analysis("00000000") is None
+    assert service.get_blood_analyses_by_visit("00000000", "visit-1") is None